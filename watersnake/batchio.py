@@ -0,0 +1,285 @@
+""" Batched datagram socket I/O for the UDP transport of a protocol based on
+the SWIM protocol described in
+http://www.cs.cornell.edu/~asdas/research/dsn02-SWIM.pdf ("the paper").
+
+A member answering many ping_reqs and piggybacking on every message sends
+and receives lots of small datagrams; rather than making a system call per
+datagram, on Linux these classes send and receive up to MAX_BATCH datagrams
+per system call with sendmmsg(2) and recvmmsg(2) (called through ctypes).
+Elsewhere, and for IPv6 sockets, they fall back to a sendto() or
+recvfrom_into() call per datagram. """
+# Disable 'Too few public methods'                   pylint: disable=R0903
+# Disable 'Invalid name'                             pylint: disable=C0103
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import socket
+import struct
+import sys
+
+# Most datagrams sent or received per system call
+MAX_BATCH = 64
+
+# An IPv4 address, as held (in network order) in a native integer
+_IN_ADDR = struct.Struct("=I")
+
+
+class _IOVec(ctypes.Structure):
+    """struct iovec"""
+    _fields_ = [("iov_base", ctypes.c_void_p),
+                ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    """struct msghdr"""
+    _fields_ = [("msg_name", ctypes.c_void_p),
+                ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_IOVec)),
+                ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p),
+                ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    """struct mmsghdr"""
+    _fields_ = [("msg_hdr", _MsgHdr),
+                ("msg_len", ctypes.c_uint)]
+
+
+_MMSGHDR_SIZE = ctypes.sizeof(_MMsgHdr)
+# struct iovec (a size_t is the same size as a pointer wherever there's
+# sendmmsg), and msg_name, the first field of struct mmsghdr
+_IOVEC = struct.Struct("PP")
+_MSG_NAME = struct.Struct("P")
+
+
+class _SockAddrIn(ctypes.Structure):
+    """struct sockaddr_in (with the port and address in network order)"""
+    _fields_ = [("sin_family", ctypes.c_ushort),
+                ("sin_port", ctypes.c_uint16),
+                ("sin_addr", ctypes.c_uint32),
+                ("sin_zero", ctypes.c_char * 8)]
+
+
+def _load_libc():
+    """Returns the C library, if it provides sendmmsg and recvmmsg"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+        libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p,
+                                  ctypes.c_uint, ctypes.c_int]
+        libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p,
+                                  ctypes.c_uint, ctypes.c_int,
+                                  ctypes.c_void_p]
+    except (OSError, AttributeError):
+        return None
+    libc.sendmmsg.restype = ctypes.c_int
+    libc.recvmmsg.restype = ctypes.c_int
+    return libc
+
+_LIBC = _load_libc()
+
+# Are sendmmsg and recvmmsg available?
+HAVE_MMSG = _LIBC is not None
+
+
+def _use_mmsg(sock, use_mmsg):
+    """Should we use sendmmsg/recvmmsg on sock?"""
+    if use_mmsg is None:
+        use_mmsg = HAVE_MMSG
+    return bool(use_mmsg and HAVE_MMSG and sock.family == socket.AF_INET)
+
+
+def _socket_error():
+    """A socket.error for the errno of the last ctypes call"""
+    error = ctypes.get_errno()
+    return socket.error(error, os.strerror(error))
+
+
+def _message_array(iovecs):
+    """An array of mmsghdrs, each with a single iovec"""
+    messages = (_MMsgHdr * MAX_BATCH)()
+    for message, iovec in zip(messages, iovecs):
+        message.msg_hdr.msg_iov = ctypes.pointer(iovec)
+        message.msg_hdr.msg_iovlen = 1
+    return messages
+
+
+class DatagramBatchSender(object):
+    """ Sends batches of datagrams on a (non-blocking) UDP socket, with
+    sendmmsg if possible (use_mmsg=None) or permitted (use_mmsg=True).
+    'syscalls' counts the system calls made.
+
+    Each batch is copied into a pre-allocated buffer of buffer_size bytes
+    (which is much cheaper than pointing ctypes structures at each
+    datagram); datagrams which don't fit are sent on their own. """
+    def __init__(self, sock, use_mmsg=None, buffer_size=MAX_BATCH * 1024):
+        self.socket = sock
+        self.use_mmsg = _use_mmsg(sock, use_mmsg)
+        self.syscalls = 0
+        if self.use_mmsg:
+            self._buffer = bytearray(buffer_size)
+            self._ctypes_buffer = (
+                ctypes.c_char * buffer_size
+            ).from_buffer(self._buffer)
+            self._buffer_address = ctypes.addressof(self._ctypes_buffer)
+            self._iovecs = (_IOVec * MAX_BATCH)()
+            self._messages = _message_array(self._iovecs)
+            for message in self._messages:
+                message.msg_hdr.msg_namelen = ctypes.sizeof(_SockAddrIn)
+            # (host, port) destination: (sockaddr_in, its address)
+            self._sockaddrs = {}
+
+    def send(self, datagrams):
+        """Send each (datagram, (host, port)) in datagrams; returns the
+        number which couldn't be sent"""
+        if not self.use_mmsg:
+            return self._send_each(datagrams)
+        failed = 0
+        buff = self._buffer
+        buffer_address = self._buffer_address
+        iovecs = self._iovecs
+        messages = self._messages
+        sockaddrs = self._sockaddrs
+        count = offset = 0
+        for datagram, destination in datagrams:
+            length = len(datagram)
+            if count == MAX_BATCH or offset + length > len(buff):
+                if count:
+                    failed += self._send_mmsg(count)
+                count = offset = 0
+                if length > len(buff):
+                    failed += self._send_each([(datagram, destination)])
+                    continue
+            sockaddr = sockaddrs.get(destination)
+            sockaddr = (self._sockaddr(destination) if sockaddr is None
+                        else sockaddr[1])
+            end = offset + length
+            buff[offset:end] = datagram
+            _IOVEC.pack_into(iovecs, count * _IOVEC.size,
+                             buffer_address + offset, length)
+            _MSG_NAME.pack_into(messages, count * _MMSGHDR_SIZE, sockaddr)
+            offset = end
+            count += 1
+        if count:
+            failed += self._send_mmsg(count)
+        return failed
+
+    def _send_each(self, datagrams):
+        """Send datagrams with a sendto() call each"""
+        failed = 0
+        for datagram, destination in datagrams:
+            while True:
+                self.syscalls += 1
+                try:
+                    self.socket.sendto(datagram, destination)
+                except socket.error as se:
+                    if se.args[0] == errno.EINTR:
+                        continue
+                    failed += 1
+                break
+        return failed
+
+    def _sockaddr(self, destination):
+        """The address of the (cached) sockaddr_in for (host, port)
+        destination"""
+        host, port = destination
+        sockaddr = _SockAddrIn(socket.AF_INET, socket.htons(port),
+                               _IN_ADDR.unpack(socket.inet_aton(host))[0])
+        self._sockaddrs[destination] = (sockaddr, ctypes.addressof(sockaddr))
+        return self._sockaddrs[destination][1]
+
+    def _send_mmsg(self, count):
+        """Send the first count datagrams in the buffer with as few
+        sendmmsg() calls as possible, skipping any which can't be sent"""
+        failed = 0
+        offset = 0
+        fileno = self.socket.fileno()
+        while offset < count:
+            self.syscalls += 1
+            sent = _LIBC.sendmmsg(
+                fileno,
+                ctypes.byref(self._messages, offset * _MMSGHDR_SIZE),
+                count - offset,
+                0
+            )
+            if sent > 0:
+                offset += sent
+            elif ctypes.get_errno() != errno.EINTR:
+                # The first remaining datagram couldn't be sent
+                failed += 1
+                offset += 1
+        return failed
+
+
+class DatagramBatchReceiver(object):
+    """ Receives batches of datagrams from a (non-blocking) UDP socket into
+    pre-allocated buffers, with recvmmsg if possible (use_mmsg=None) or
+    permitted (use_mmsg=True). 'syscalls' counts the system calls made. """
+    def __init__(self, sock, max_packet_size, use_mmsg=None):
+        self.socket = sock
+        self.use_mmsg = _use_mmsg(sock, use_mmsg)
+        self.syscalls = 0
+        self.max_packet_size = max_packet_size
+        batch = MAX_BATCH if self.use_mmsg else 1
+        self._buffer = bytearray(max_packet_size * batch)
+        self._view = memoryview(self._buffer)
+        if self.use_mmsg:
+            self._ctypes_buffer = (
+                ctypes.c_char * len(self._buffer)
+            ).from_buffer(self._buffer)
+            address = ctypes.addressof(self._ctypes_buffer)
+            self._iovecs = (_IOVec * MAX_BATCH)()
+            for index, iovec in enumerate(self._iovecs):
+                iovec.iov_base = address + index * max_packet_size
+                iovec.iov_len = max_packet_size
+            self._messages = _message_array(self._iovecs)
+            self._sockaddrs = (_SockAddrIn * MAX_BATCH)()
+            for message, sockaddr in zip(self._messages, self._sockaddrs):
+                message.msg_hdr.msg_name = ctypes.addressof(sockaddr)
+            self._addresses = {}
+
+    def receive(self):
+        """Returns a list of one or more (datagram, (host, port)), where
+        each datagram is a memoryview which is only valid until the next
+        call; raises socket.error (e.g. EAGAIN if there's nothing to
+        receive)"""
+        if not self.use_mmsg:
+            self.syscalls += 1
+            length, source = self.socket.recvfrom_into(self._buffer)
+            if self.socket.family == socket.AF_INET6:
+                source = source[:2]
+            return [(self._view[:length], source)]
+        messages = self._messages
+        for message in messages:
+            message.msg_hdr.msg_namelen = ctypes.sizeof(_SockAddrIn)
+        self.syscalls += 1
+        received = _LIBC.recvmmsg(self.socket.fileno(), messages, MAX_BATCH,
+                                  0, None)
+        if received < 0:
+            raise _socket_error()
+        datagrams = []
+        view = self._view
+        max_packet_size = self.max_packet_size
+        for index in xrange(received):
+            start = index * max_packet_size
+            datagrams.append((
+                view[start:start + messages[index].msg_len],
+                self._source(self._sockaddrs[index])
+            ))
+        return datagrams
+
+    def _source(self, sockaddr):
+        """The (cached) (host, port) of sockaddr"""
+        key = (sockaddr.sin_addr, sockaddr.sin_port)
+        source = self._addresses.get(key)
+        if source is None:
+            source = (socket.inet_ntoa(_IN_ADDR.pack(sockaddr.sin_addr)),
+                      socket.ntohs(sockaddr.sin_port))
+            self._addresses[key] = source
+        return source
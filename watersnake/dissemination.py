@@ -0,0 +1,157 @@
+""" Implementation of the bounded infection-style dissemination buffer used
+by a protocol based on the SWIM protocol described in
+http://www.cs.cornell.edu/~asdas/research/dsn02-SWIM.pdf ("the paper") """
+
+import hashlib
+import heapq
+import math
+import struct
+import watersnake.swimprotocol as swimprotocol
+
+DEFAULT_BUDGET_BYTES = 512
+
+_DIGEST = struct.Struct("!Q")
+
+
+def view_entry_digest(member_id, incarnation, state):
+    """64 bit hash of a single (member_id, incarnation, state) entry in a
+    view of the group. The digest of an entire view is the XOR of the
+    digests of its entries, so it can be maintained incrementally as
+    entries change; members whose state is unknown contribute nothing."""
+    if state == "unknown":
+        return 0
+    if isinstance(member_id, unicode):
+        member_id = member_id.encode("utf-8")
+    return _DIGEST.unpack_from(hashlib.md5(
+        "%s\0%d\0%s" % (member_id, incarnation, state)
+    ).digest())[0]
+
+
+# Size of the smallest possible update (one character id, incarnation < 10)
+_MIN_ENTRY_SIZE = 10
+
+# Returned by DisseminationBuffer.select() when there's nothing to select
+_NO_UPDATES = []
+
+
+class DisseminationBuffer(object):
+    """ Holds recent membership changes awaiting infection-style
+    dissemination (section 4.1 of the paper).
+
+    Only the latest update about any given member is retained. Each update
+    is piggybacked at most LAMBDA * log(n) times, least-transmitted updates
+    first, and no more updates are selected for a single message than fit
+    into the configured byte budget. This keeps piggyback size (and so
+    message size) constant as the group grows. """
+
+    def __init__(
+            self,
+            budget_bytes=DEFAULT_BUDGET_BYTES,
+            retransmit_multiplier=swimprotocol.SWIM.LAMBDA
+        ):
+        self.budget_bytes = budget_bytes
+        self.retransmit_multiplier = retransmit_multiplier
+        # member_id -> [transmit_count, sequence, state, incarnation]
+        self._updates = {}
+        self._sequence = 0
+        # Incremented whenever an update is enqueued
+        self.version = 0
+        # The most recent selection, which is reused (with its transmissions
+        # only accounted for once it's replaced) until an update is enqueued
+        # or one of its updates would exceed its retransmit limit, provided
+        # it includes every update awaiting dissemination:
+        # (version, n_members, budget_bytes), selection, [(member_id,
+        # update)], transmissions so far, transmissions allowed
+        self._selection_key = None
+        self._selection = None
+        self._selected_updates = None
+        self._selection_uses = 0
+        self._selection_max_uses = 0
+
+    def __len__(self):
+        self._commit_selection()
+        return len(self._updates)
+
+    @staticmethod
+    def entry_size(member_id, incarnation):
+        """Approximate number of bytes an update occupies on the wire"""
+        return len(member_id) + len(str(incarnation)) + 8
+
+    def retransmit_limit(self, n_members):
+        """Number of times an update is piggybacked in a group of n_members
+        before it is considered disseminated"""
+        return max(1, int(self.retransmit_multiplier *
+                          math.ceil(math.log(n_members + 1))))
+
+    def enqueue(self, member_id, state, incarnation):
+        """Record a change to the state of member_id; this supersedes any
+        update about member_id that is still awaiting dissemination"""
+        self._sequence += 1
+        self.version += 1
+        self._updates[member_id] = [0, self._sequence, state, incarnation]
+
+    def _commit_selection(self):
+        """Account for the transmissions of the current selection, forgetting
+        updates which have reached their retransmit limit"""
+        if self._selection is None:
+            return
+        uses = self._selection_uses
+        limit = self._selection_key[1]
+        for member_id, update in self._selected_updates:
+            update[0] += uses
+            if (update[0] >= limit and
+                    self._updates.get(member_id) is update):
+                del self._updates[member_id]
+        self._selection_key = None
+        self._selection = None
+        self._selected_updates = None
+
+    def select(self, n_members, budget_bytes=None):
+        """Returns a list of (member_id, state, incarnation) updates to
+        piggyback on the next outgoing message, accounting for their
+        transmission. Until the updates awaiting dissemination change, the
+        same list is returned (so callers may cache anything derived from
+        it, but must not modify it)."""
+        if budget_bytes is None:
+            budget_bytes = self.budget_bytes
+        limit = self.retransmit_limit(n_members)
+        key = (self.version, limit, budget_bytes)
+        if (key == self._selection_key and
+                self._selection_uses < self._selection_max_uses):
+            self._selection_uses += 1
+            return self._selection
+        self._commit_selection()
+        if not self._updates:
+            return _NO_UPDATES
+        # Least transmitted first; most recent first amongst equals. Only
+        # as many updates as fit in the budget are popped off the heap, so
+        # this costs O(n + k log n) rather than a full sort.
+        ordered = [
+            (update[0], -update[1], member_id)
+            for member_id, update in self._updates.iteritems()
+        ]
+        heapq.heapify(ordered)
+        selection = []
+        selected_updates = []
+        used_bytes = 0
+        max_uses = limit
+        while ordered and budget_bytes - used_bytes >= _MIN_ENTRY_SIZE:
+            member_id = heapq.heappop(ordered)[2]
+            update = self._updates[member_id]
+            size = self.entry_size(member_id, update[3])
+            if used_bytes + size > budget_bytes:
+                continue
+            used_bytes += size
+            selection.append((member_id, update[2], update[3]))
+            selected_updates.append((member_id, update))
+            max_uses = min(max_uses, limit - update[0])
+        if len(selection) < len(self._updates):
+            # Others are waiting their turn, so next time may differ
+            max_uses = 1
+        if selection:
+            self._selection_key = key
+            self._selection = selection
+            self._selected_updates = selected_updates
+            self._selection_uses = 1
+            self._selection_max_uses = max_uses
+        return selection
@@ -0,0 +1,133 @@
+""" Consistent hash ring over the members of a group maintained by a
+protocol based on the SWIM protocol described in
+http://www.cs.cornell.edu/~asdas/research/dsn02-SWIM.pdf ("the paper"),
+for sharding work between them (see Membership.enable_hash_ring()).
+
+Each member owns 'vnodes' points on a ring of 64 bit hashes, and a key is
+owned by the member owning the first point at or after the key's hash. A
+member joining or leaving only moves the keys adjacent to its own points,
+and updating the ring only touches those points. """
+
+import bisect
+import hashlib
+import struct
+
+# Points on the ring per member
+DEFAULT_VNODES = 100
+
+_POINT = struct.Struct("!Q")
+
+
+def ring_hash(value):
+    """The 64 bit position on the ring of value (a str or unicode)"""
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+    return _POINT.unpack_from(hashlib.md5(value).digest())[0]
+
+
+class ConsistentHashRing(object):
+    """ A consistent hash ring of member ids, updated incrementally: adding
+    or removing a member inserts or removes only its own points. Lookups
+    take time logarithmic in the number of points. """
+    def __init__(self, vnodes=DEFAULT_VNODES):
+        self.vnodes = vnodes
+        # The points on the ring in ascending order, and their owners
+        self._points = []
+        self._owners = []
+        self._members = set()
+
+    def __len__(self):
+        return len(self._members)
+
+    def __contains__(self, member_id):
+        return member_id in self._members
+
+    def _member_points(self, member_id):
+        """The points on the ring owned by member_id"""
+        if isinstance(member_id, unicode):
+            member_id = member_id.encode("utf-8")
+        return [ring_hash("%s#%d" % (member_id, vnode))
+                for vnode in xrange(self.vnodes)]
+
+    def add(self, member_id):
+        """Add member_id's points to the ring (if they aren't already)"""
+        if member_id in self._members:
+            return
+        self._members.add(member_id)
+        points = self._points
+        owners = self._owners
+        for point in self._member_points(member_id):
+            index = bisect.bisect_left(points, point)
+            points.insert(index, point)
+            owners.insert(index, member_id)
+
+    def update(self, member_ids):
+        """Add the points of each of member_ids to the ring, merging them
+        with the ring's existing points in a single pass (which is much
+        cheaper than adding many members one at a time)"""
+        new_points = []
+        for member_id in member_ids:
+            if member_id not in self._members:
+                self._members.add(member_id)
+                new_points.extend(
+                    (point, member_id)
+                    for point in self._member_points(member_id)
+                )
+        if not new_points:
+            return
+        new_points.sort()
+        points = self._points
+        owners = self._owners
+        merged_points = []
+        merged_owners = []
+        start = 0
+        for point, member_id in new_points:
+            index = bisect.bisect_left(points, point, start)
+            merged_points.extend(points[start:index])
+            merged_owners.extend(owners[start:index])
+            merged_points.append(point)
+            merged_owners.append(member_id)
+            start = index
+        merged_points.extend(points[start:])
+        merged_owners.extend(owners[start:])
+        self._points = merged_points
+        self._owners = merged_owners
+
+    def remove(self, member_id):
+        """Remove member_id's points from the ring (if it's there)"""
+        if member_id not in self._members:
+            return
+        self._members.remove(member_id)
+        points = self._points
+        owners = self._owners
+        for point in self._member_points(member_id):
+            index = bisect.bisect_left(points, point)
+            # (skip past any other member's point with the same hash)
+            while owners[index] != member_id:
+                index += 1
+            del points[index]
+            del owners[index]
+
+    def owner(self, key):
+        """The member id which owns key (None if the ring is empty)"""
+        if not self._points:
+            return None
+        index = bisect.bisect_left(self._points, ring_hash(key))
+        return self._owners[index % len(self._owners)]
+
+    def preference_list(self, key, k):
+        """The (up to) k distinct member ids which own key: its owner, then
+        the owners of the following points on the ring"""
+        owners = self._owners
+        k = min(k, len(self._members))
+        if not k:
+            return []
+        index = bisect.bisect_left(self._points, ring_hash(key))
+        preferred = []
+        for offset in xrange(len(owners)):
+            member_id = owners[(index + offset) % len(owners)]
+            if member_id not in preferred:
+                preferred.append(member_id)
+                if len(preferred) == k:
+                    break
+        return preferred
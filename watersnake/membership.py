@@ -4,11 +4,178 @@ http://www.cs.cornell.edu/~asdas/research/dsn02-SWIM.pdf ("the paper") """
 # Disable 'Too many instance attributes'             pylint: disable=R0902
 
 
+import collections
+import math
 import random
-import itertools
+import timeit
+import watersnake.dissemination as dissemination
+import watersnake.hashring as hashring
+import watersnake.metrics as metrics
+import watersnake.rtt as rtt
+import watersnake.scheduler as scheduler
+import watersnake.statefile as statefile
 import watersnake.swimmsg as swimmsg
 import watersnake.swimprotocol as swimprotocol
 
+# Seconds between periodic push-pull (full state) syncs with a random member
+# (None disables push-pull anti-entropy altogether)
+DEFAULT_PUSH_PULL_INTERVAL = 30.0
+
+# Suspected members are declared dead unless they refute the suspicion within
+# this many protocol periods (scaled by log10 of the group size)
+DEFAULT_SUSPICION_MULTIPLIER = 4
+
+# Seconds between saving changes in our view of the group to our state file,
+# if we have one (see Membership.enable_state_file())
+DEFAULT_STATE_SAVE_INTERVAL = 5.0
+
+# How many incarnations beyond our current one our state file allows us to
+# take before it must be rewritten (see Membership.enable_state_file())
+DEFAULT_INCARNATION_LEASE = 16
+
+# With zone-aware probing, the largest proportion of protocol periods in
+# which we ping a member in another zone (see
+# Membership.enable_zone_aware_probing())
+DEFAULT_CROSS_ZONE_PROBE_RATE = 0.2
+
+# Member states which are disseminated between members
+DISSEMINATED_STATES = ("alive", "suspect", "dead", "left")
+
+# RemoteMember states are held as small integer codes (RemoteMember.state
+# translates to and from the names used on the wire and in our API)
+STATE_UNKNOWN, STATE_ALIVE, STATE_SUSPECT, STATE_DEAD, STATE_LEFT = range(5)
+STATE_NAMES = ("unknown", "alive", "suspect", "dead", "left")
+STATE_CODES = dict((name, code) for code, name in enumerate(STATE_NAMES))
+
+# At the same incarnation, a rumour about a member only overrides what we
+# already believe if its state outranks ours (indexed by state code)
+_STATE_PRECEDENCE = (0, 0, 1, 2, 3)
+
+# States of the members on the hash ring (see Membership.enable_hash_ring())
+HASH_RING_STATES = ("alive", "suspect")
+
+# Kinds of MembershipEvent: a member has joined our view of the group (or
+# rejoined, having left), has changed state, or has a new incarnation in the
+# same state (e.g. having refuted suspicion and been suspected again)
+EVENT_KINDS = ("joined", "alive", "suspect", "dead", "left",
+               "incarnation_changed")
+
+
+class MembershipEvent(object):
+    """ A change in our view of a remote member, as delivered to
+    subscribers (see Membership.subscribe()). Changes within a tick are
+    coalesced into a single event per member, so 'previous_state' is its
+    state (None if it's just joined) before the first of them. """
+    __slots__ = ("kind", "member_id", "state", "incarnation",
+                 "previous_state")
+
+    def __init__(self, kind, member_id, state, incarnation, previous_state):
+        self.kind = kind
+        self.member_id = member_id
+        self.state = state
+        self.incarnation = incarnation
+        self.previous_state = previous_state
+
+    def __repr__(self):
+        return "MembershipEvent(%r, %r, %r, %r, %r)" % (
+            self.kind, self.member_id, self.state, self.incarnation,
+            self.previous_state
+        )
+
+    def __eq__(self, other):
+        return (isinstance(other, MembershipEvent) and
+                all(getattr(self, name) == getattr(other, name)
+                    for name in self.__slots__))
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class MembershipSnapshot(object):
+    """ An immutable view of the membership of the group (see
+    Membership.snapshot()): the (frozen) sets of ids of the remote members
+    in each state, and the Membership.view_version it was taken at. """
+    __slots__ = ("version", "alive", "suspect", "dead", "left")
+
+    def __init__(self, version, alive, suspect, dead, left):
+        self.version = version
+        self.alive = alive
+        self.suspect = suspect
+        self.dead = dead
+        self.left = left
+
+    def __repr__(self):
+        return "MembershipSnapshot(version=%s, %s)" % (
+            self.version,
+            ", ".join("%s=%s" % (state, len(getattr(self, state)))
+                      for state in DISSEMINATED_STATES)
+        )
+
+
+class ProbeRotation(object):
+    """ The members to ping in randomised round-robin order, as per section
+    4.3 of the paper: each member is pinged once per round, and the order is
+    shuffled afresh at the start of each round. Members are added and
+    removed in constant time (each knows its 'rotation_index'). Randomness
+    is drawn from rand (a random.Random, or the random module itself). """
+    __slots__ = ("members", "next_index", "rand")
+
+    def __init__(self, members=(), rand=random):
+        self.members = list(members)
+        self.rand = rand
+        for index, member in enumerate(self.members):
+            member.rotation_index = index
+        # (so that the first member to be pinged starts a round)
+        self.next_index = len(self.members)
+
+    def next_member(self):
+        """The next member to ping (None if there are none)"""
+        members = self.members
+        if not members:
+            return None
+        if self.next_index >= len(members):
+            self.rand.shuffle(members)
+            for index, member in enumerate(members):
+                member.rotation_index = index
+            self.next_index = 0
+        member = members[self.next_index]
+        self.next_index += 1
+        return member
+
+    def _move(self, member, index):
+        """Put member at position index in the rotation"""
+        self.members[index] = member
+        member.rotation_index = index
+
+    def add(self, member):
+        """Insert member at a uniformly random position among those yet to
+        be pinged this round"""
+        members = self.members
+        members.append(member)
+        position = self.rand.randint(self.next_index, len(members) - 1)
+        self._move(members[position], len(members) - 1)
+        self._move(member, position)
+
+    def remove(self, member):
+        """Remove member (if it's in the rotation); the members yet to be
+        pinged this round stay yet to be pinged"""
+        members = self.members
+        position = member.rotation_index
+        if (position is None or position >= len(members) or
+                members[position] is not member):
+            return
+        if position < self.next_index:
+            # Fill the gap with the last member already pinged this round,
+            # and its place with the first yet to be pinged
+            self.next_index -= 1
+            self._move(members[self.next_index], position)
+            position = self.next_index
+        last = members.pop()
+        if position < len(members):
+            self._move(last, position)
+        member.rotation_index = None
+
+
 class Membership(object):
     """  Each member of the distributed process group
     should instantiate a single instance of this class.
@@ -27,28 +194,351 @@ class Membership(object):
             member_id,
             expected_remote_members,
             messagerouter,
-            enable_infection_dissemination=True
+            enable_infection_dissemination=True,
+            piggyback_budget_bytes=dissemination.DEFAULT_BUDGET_BYTES,
+            seed_member_ids=None,
+            push_pull_interval=DEFAULT_PUSH_PULL_INTERVAL,
+            suspicion_multiplier=DEFAULT_SUSPICION_MULTIPLIER,
+            min_probe_timeout=rtt.DEFAULT_MIN_PROBE_TIMEOUT,
+            max_probe_timeout=rtt.DEFAULT_MAX_PROBE_TIMEOUT,
+            clock=None,
+            metrics_registry=None,
+            zone=None,
+            rand=None
         ):
         self.member_id = member_id
         self.messagerouter = messagerouter
-        self.incarnation_number = 0 # Futures: should persist
+        self.incarnation_number = 0  # see enable_state_file()
         self.expected_remote_members = expected_remote_members
         self.alive_remote_members = []
         self.last_received_message = None
         self.received_messages = 0
         self.messagerouter.register_for_messages(self.member_id, self)
-        self.nodes_to_ping = None
+        self.zone = zone
+        self._rotation = None
+        self._cross_zone_rotation = None
+        self.zone_aware_probing = False  # see enable_zone_aware_probing()
+        self.cross_zone_probe_rate = None
+        self.prefer_local_helpers = False
+        self.zone_of = None
+        self._cross_zone_credit = 0.0
+        self.seed_member_ids = [seed_member_id for seed_member_id
+                                in (seed_member_ids or [])
+                                if seed_member_id != member_id]
+        self._next_seed = 0
+        self.joined = not self.seed_member_ids
+        self.left = False
+        self.push_pull_interval = push_pull_interval
+        self._next_push_pull = None
+        self._pending_push_pulls = set()
+        self._view_mismatch_member_id = None
+        self.suspicion_multiplier = suspicion_multiplier
+        self.suspicions_raised = 0
+        self.suspicions_refuted = 0
+        self.suspicions_confirmed = 0
+        # The incarnation in which each member we suspect is suspected
+        self._suspected_incarnations = {}
+        self.time_now = 0
+        self.clock = clock
+        # Source of randomness (e.g. a seeded random.Random, for
+        # reproducible simulations); by default, the random module
+        self.rand = rand or random
+        self.min_probe_timeout = min_probe_timeout
+        self.max_probe_timeout = max_probe_timeout
         self.enable_infection_dissemination = enable_infection_dissemination
+        self.dissemination_buffer = dissemination.DisseminationBuffer(
+            budget_bytes=piggyback_budget_bytes
+        )
+        self.scheduler = scheduler.DeadlineScheduler()
+        self.view_digest = 0
+        self._own_view_digest = 0  # our own contribution to view_digest
+        self.merges_skipped = 0
+        self._piggyback_selected = None
+        self._piggyback_key = None
+        self._piggyback_data = None
+        self.state_file = None
+        self.state_save_interval = DEFAULT_STATE_SAVE_INTERVAL
+        self._state_writer = None
+        self._next_state_save = None
+        self._saved_state_version = None
+        self._leased_incarnation = None
+        self.incarnation_lease = DEFAULT_INCARNATION_LEASE
         self._update_incarnation()
         self._remote_members_by_id = {
             remote_member.remote_member_id : remote_member
             for remote_member in
             self.expected_remote_members
         }
+        for remote_member in self.expected_remote_members:
+            self._update_view_digest(remote_member)
+        # The ids of the remote members in each state (indexed by state
+        # code), frozen copies of them for snapshot() (None once stale), and
+        # a count of the changes to our view of the group
+        self._members_by_state = tuple(set() for _ in STATE_NAMES)
+        for remote_member in self.expected_remote_members:
+            self._members_by_state[remote_member.state_code].add(
+                remote_member.remote_member_id
+            )
+        self._frozen_by_state = [None] * len(STATE_NAMES)
+        self.view_version = 0
+        self._snapshot = None
+        self._subscribers = []
+        # member id: (RemoteMember, its state and incarnation before the
+        # first change since events were last delivered), in order of first
+        # change
+        self._changed_members = collections.OrderedDict()
+        self.hash_ring = None
+        self.metrics = None
+        if metrics_registry is not None:
+            self.enable_metrics(metrics_registry)
 
-    def _update_incarnation(self):
-        """We need to update our incarnation"""
-        self.incarnation_number += 1
+    def enable_hash_ring(self, vnodes=hashring.DEFAULT_VNODES):
+        """Maintain a hashring.ConsistentHashRing of ourselves and the
+        members we believe to be alive (or only suspect have failed), for
+        sharding work between them; it's updated incrementally as our view
+        of each member changes. Returns the ring."""
+        self.hash_ring = hashring.ConsistentHashRing(vnodes)
+        member_ids = [self.member_id]
+        for state in HASH_RING_STATES:
+            member_ids.extend(self._members_by_state[STATE_CODES[state]])
+        self.hash_ring.update(member_ids)
+        return self.hash_ring
+
+    def enable_state_file(self, path,
+                          save_interval=DEFAULT_STATE_SAVE_INTERVAL,
+                          background=True,
+                          incarnation_lease=DEFAULT_INCARNATION_LEASE):
+        """Persist our incarnation and view of the group in the file at
+        path, for warm restarts (see watersnake.statefile); should be called
+        before start(). If the file holds our state from before a restart,
+        we take a higher incarnation than we had (so we can refute rumours
+        of our death straight away), and members we knew of but hadn't
+        heard of since are restored to their last known state and
+        incarnation. Our state is saved at most every save_interval seconds
+        as our view or incarnation changes, by a statefile.StateFileWriter
+        thread (unless background is False); call close() when shutting
+        down. Returns the statefile.SavedState restored from, or None.
+
+        So that we never restart in an incarnation we've already used
+        without waiting for the disk whenever our incarnation changes, the
+        incarnation saved is a lease: incarnation_lease incarnations beyond
+        the one we take. Only when our incarnation passes the lease do we
+        wait while a new one is written."""
+        try:
+            saved = statefile.read_state(path)
+        except (IOError, OSError, ValueError) as error:
+            print "Warning: %s ignoring state file '%s': %s" % (
+                self.member_id, path, error
+            )
+            saved = None
+        if saved is not None and saved.member_id != self.member_id:
+            print "Warning: %s ignoring state file '%s' of member '%s'" % (
+                self.member_id, path, saved.member_id
+            )
+            saved = None
+        if saved is not None:
+            self._restore_state(saved)
+        self.state_file = path
+        self.state_save_interval = save_interval
+        self.incarnation_lease = incarnation_lease
+        if background:
+            self._state_writer = statefile.StateFileWriter(path)
+        self._renew_incarnation_lease()
+        return saved
+
+    def _restore_state(self, saved):
+        """Take an incarnation beyond the one saved, and restore the saved
+        view of each member we haven't yet heard of (without disseminating
+        it: it's only what we knew before restarting). Members which were
+        suspect are restored as alive, as we aren't checking up on them."""
+        self._update_incarnation(max(self.incarnation_number,
+                                     saved.incarnation + 1))
+        restored_ring_members = []
+        for member_id, incarnation, state_code in saved.members:
+            if member_id == self.member_id:
+                continue
+            if state_code == STATE_SUSPECT:
+                state_code = STATE_ALIVE
+            remote_member = self._remote_member_from_id(member_id)
+            if remote_member is None:
+                remote_member = RemoteMember(member_id)
+                self.expected_remote_members.append(remote_member)
+                self._remote_members_by_id[member_id] = remote_member
+                self._add_to_rotation(remote_member)
+            elif remote_member.state_code != STATE_UNKNOWN:
+                continue
+            remote_member.incarnation_number = incarnation
+            remote_member.state_code = state_code
+            self._index_member(remote_member)
+            self._update_view_digest(remote_member)
+            if remote_member.state in HASH_RING_STATES:
+                restored_ring_members.append(member_id)
+        if self.hash_ring is not None:
+            # (in place, as whoever enabled it may hold on to the ring)
+            self.hash_ring.update(restored_ring_members)
+
+    def _renew_incarnation_lease(self):
+        """Save a lease on the next incarnation_lease incarnations, waiting
+        until it's written"""
+        self._leased_incarnation = (self.incarnation_number +
+                                    self.incarnation_lease)
+        self.save_state(wait=True)
+
+    def save_state(self, wait=False):
+        """Save our incarnation lease and view of the group to our state
+        file now (in the background, if we have a StateFileWriter, unless
+        wait is True)"""
+        self._saved_state_version = (self.incarnation_number,
+                                     self.view_version)
+        self._next_state_save = self.time_now + self.state_save_interval
+        data = statefile.encode_state(
+            self.member_id,
+            self._leased_incarnation,
+            [(remote_member.remote_member_id,
+              remote_member.incarnation_number,
+              remote_member.state_code)
+             for remote_member in self.expected_remote_members
+             if remote_member.state_code != STATE_UNKNOWN]
+        )
+        if self._state_writer is None:
+            statefile.write_state(self.state_file, data)
+        else:
+            self._state_writer.submit(data)
+            if wait:
+                self._state_writer.flush()
+
+    def close(self):
+        """We're shutting down (whether or not we've left the group): save
+        our state, if we have a state file, and wait for it to be written.
+        Nothing is saved after this."""
+        if self.state_file is None:
+            return
+        self.save_state()
+        if self._state_writer is not None:
+            self._state_writer.close()
+            self._state_writer = None
+        self.state_file = None
+
+    def _maybe_save_state(self, time_now):
+        """Save our state if our incarnation or view has changed and it's
+        time to (our incarnation lease makes sure we needn't hurry)"""
+        if (self._saved_state_version != (self.incarnation_number,
+                                          self.view_version) and
+                time_now >= self._next_state_save):
+            self.save_state()
+
+    def enable_zone_aware_probing(
+            self,
+            cross_zone_probe_rate=DEFAULT_CROSS_ZONE_PROBE_RATE,
+            prefer_local_helpers=True,
+            zone_of=None
+        ):
+        """Probe with awareness of the zone (e.g. availability zone or
+        region) each member is in, to keep traffic off expensive links
+        between zones: members in other zones are pinged in at most a
+        proportion cross_zone_probe_rate of protocol periods (None for as
+        many as if we chose uniformly), and ping_req helpers are chosen
+        from our own zone first if prefer_local_helpers. Members are pinged
+        in randomised round-robin order within our zone and within the
+        others, so each is still pinged within a bounded time (a member in
+        another zone within about 2 / cross_zone_probe_rate rounds of our
+        zone's rotation). We and each RemoteMember are labelled with a
+        zone when created; zone_of(member id), if given, labels members
+        without one (e.g. those we hear of from others). Members whose zone
+        isn't known are treated as being in another zone."""
+        if self.zone is None:
+            raise ValueError("Zone-aware probing needs our zone")
+        self.zone_aware_probing = True
+        self.cross_zone_probe_rate = cross_zone_probe_rate
+        self.prefer_local_helpers = prefer_local_helpers
+        self.zone_of = zone_of
+        # (rebuilt, split by zone, when next needed)
+        self._rotation = None
+        self._cross_zone_rotation = None
+
+    def enable_metrics(self, registry):
+        """Start recording metrics (tick duration, probe outcomes and round
+        trip times, suspicions, piggyback sizes) in registry, a
+        metrics.MetricsRegistry"""
+        self.metrics = registry
+        self._tick_seconds = registry.histogram(
+            "tick_seconds",
+            "Time taken to process a protocol period tick",
+            metrics.LATENCY_BUCKETS
+        ).labels()
+        probe_rtt = registry.histogram(
+            "probe_rtt_seconds",
+            "Measured probe round trip times",
+            metrics.RTT_BUCKETS,
+            ("path",)
+        )
+        probe_outcomes = registry.counter(
+            "probe_outcomes_total",
+            "Outcomes of failure detection probes",
+            ("outcome",)
+        )
+        self._probe_metrics = {
+            "ack" : (probe_outcomes.labels("ack"),
+                     probe_rtt.labels("direct")),
+            "indirect_ack" : (probe_outcomes.labels("indirect_ack"),
+                              probe_rtt.labels("indirect")),
+            "timeout" : (probe_outcomes.labels("timeout"), None),
+        }
+        suspicions = registry.counter(
+            "suspicions_total",
+            "Suspicions of members raised, refuted and confirmed",
+            ("outcome",)
+        )
+        self._suspicion_metrics = {}
+        for outcome in ("raised", "refuted", "confirmed"):
+            counter = suspicions.labels(outcome)
+            # (including those before metrics were enabled)
+            counter.inc(getattr(self, "suspicions_" + outcome))
+            self._suspicion_metrics[outcome] = counter
+        self._piggyback_entries = registry.histogram(
+            "piggyback_entries",
+            "Membership updates piggybacked on each outgoing message",
+            metrics.SIZE_BUCKETS
+        ).labels()
+
+    def record_probe_outcome(self, outcome, rtt_sample=None):
+        """A failure detection probe has finished with outcome "ack",
+        "indirect_ack" or "timeout" (only called with metrics enabled)"""
+        outcome_counter, rtt_histogram = self._probe_metrics[outcome]
+        outcome_counter.inc()
+        if rtt_sample is not None:
+            rtt_histogram.observe(rtt_sample)
+
+    def record_suspicion(self, outcome):
+        """A suspicion has been "raised", "refuted" or "confirmed" (only
+        called with metrics enabled)"""
+        self._suspicion_metrics[outcome].inc()
+
+    def _update_incarnation(self, incarnation=None):
+        """We need to update our incarnation (to the next one, unless
+        told otherwise)"""
+        if incarnation is None:
+            incarnation = self.incarnation_number + 1
+        self.incarnation_number = incarnation
+        own_view_digest = dissemination.view_entry_digest(
+            self.member_id, self.incarnation_number, "alive"
+        )
+        self.view_digest ^= self._own_view_digest ^ own_view_digest
+        self._own_view_digest = own_view_digest
+        if (self.state_file is not None and
+                incarnation > self._leased_incarnation):
+            self._renew_incarnation_lease()
+
+    def _update_view_digest(self, remote_member):
+        """Replace remote_member's contribution to the digest of our view
+        of the group"""
+        entry_digest = dissemination.view_entry_digest(
+            remote_member.remote_member_id,
+            remote_member.incarnation_number,
+            remote_member.state
+        )
+        self.view_digest ^= remote_member.view_digest ^ entry_digest
+        remote_member.view_digest = entry_digest
 
     def __str__(self):
         return "Membership(member_id=%s)" % self.member_id
@@ -58,68 +548,592 @@ class Membership(object):
         for remote_member in self.expected_remote_members:
             remote_member.start(self)
 
+    def now(self):
+        """The current time, used to measure round trip times. This is
+        clock() if we were given a clock, otherwise the time of the most
+        recent tick (in which case round trips are only measured to the
+        granularity of the protocol period)."""
+        if self.clock is not None:
+            return self.clock()
+        return self.time_now
+
+    def rtt_estimates(self):
+        """Our estimate of the round trip time to each remote member, as a
+        dict of member id -> dict with keys srtt, rttvar, samples and
+        (probe) timeout
+        (Members we've never measured a round trip to are left out, rather
+        than allocating estimators for them.)"""
+        return {
+            remote_member.remote_member_id :
+            remote_member.rtt_estimator.snapshot()
+            for remote_member in self.expected_remote_members
+            if remote_member.has_rtt_estimate()
+        }
+
     def tick(self, time_now):
         """Time is advancing - we should check up on remote nodes
         (time_now should be some sort of monotonic time)"""
+        if self.metrics is None:
+            self._tick(time_now)
+        else:
+            started = timeit.default_timer()
+            self._tick(time_now)
+            self._tick_seconds.observe(timeit.default_timer() - started)
+
+    def run_deadlines(self, time_now):
+        """Time out any failure detection operations (and suspicions) whose
+        deadlines have passed between ticks, so that probe timeouts shorter
+        than the protocol period take effect as soon as they expire"""
+        if self.left:
+            return
+        self.time_now = time_now
+        self.scheduler.run_expired(time_now)
+        if self._changed_members:
+            self.deliver_events()
+
+    def _tick(self, time_now):
+        """Do the work of tick()"""
+        if self.left:
+            return
+        self.time_now = time_now
+        if not self.joined:
+            self._send_join()
         new_node_to_ping = self._select_node_to_ping()
-        if new_node_to_ping.is_currently_being_checked():
+        if new_node_to_ping is None:
+            # We don't know of anyone to ping (yet)
+            pass
+        elif new_node_to_ping.is_currently_being_checked():
             # We've already got a ping in progress for this node. Let's
             # wait for that to succeed/fail.
             pass
         else:
             new_node_to_ping.begin_checking_for_failure(time_now)
 
-        # prod each node to see if it needs to change state/time out etc.
-        for node in self.expected_remote_members:
-            node.on_tick(time_now)
+        # time out any failure detection operations whose deadlines have
+        # passed (rather than prodding every node)
+        self.scheduler.run_expired(time_now)
+
+        if self.enable_infection_dissemination and self.push_pull_interval:
+            self._push_pull(time_now)
+
+        if self._changed_members:
+            self.deliver_events()
+
+        if self.state_file is not None:
+            self._maybe_save_state(time_now)
+
+    def subscribe(self, callback):
+        """Call callback(events) with each batch of MembershipEvents: the
+        changes in our view of the group since the last batch, coalesced
+        into one event per member and delivered at the end of each tick
+        (callback may be e.g. the put method of a twisted DeferredQueue).
+        Nothing is recorded unless there are subscribers."""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """Stop calling callback with events"""
+        self._subscribers.remove(callback)
+
+    def deliver_events(self):
+        """Deliver any changes recorded since the last batch of events to
+        subscribers now, rather than waiting for the end of the tick"""
+        changed_members = self._changed_members
+        self._changed_members = collections.OrderedDict()
+        events = []
+        for (remote_member, previous_state,
+             previous_incarnation) in changed_members.itervalues():
+            state = remote_member.state
+            if previous_state is None or (previous_state == "left" and
+                                          state != "left"):
+                kind = "joined"
+            elif state == previous_state:
+                if remote_member.incarnation_number == previous_incarnation:
+                    # It has changed state and back again (e.g. we suspected
+                    # it, then it answered a ping)
+                    continue
+                kind = "incarnation_changed"
+            else:
+                kind = state
+            events.append(MembershipEvent(
+                kind,
+                remote_member.remote_member_id,
+                state,
+                remote_member.incarnation_number,
+                previous_state
+            ))
+        if events:
+            for callback in list(self._subscribers):
+                # (One subscriber failing mustn't stop the others hearing
+                # of the changes, nor abandon the rest of our tick)
+                try:
+                    callback(events)
+                except Exception as error:
+                    print "Warning: %s subscriber %r failed: %r" % (
+                        self.member_id, callback, error
+                    )
+
+    def _push_pull(self, time_now):
+        """Periodically sync our entire view of the group with another
+        member: one whose view we know differs from ours, if we've heard
+        from one since the last sync, otherwise one chosen at random from
+        those we believe alive. Also promptly sync with members which come
+        back to life (e.g. after a partition heals)"""
+        pending_push_pulls = self._pending_push_pulls
+        self._pending_push_pulls = set()
+        if self._next_push_pull is None:
+            self._next_push_pull = time_now + self.push_pull_interval
+        elif time_now >= self._next_push_pull:
+            self._next_push_pull = time_now + self.push_pull_interval
+            member = self._remote_member_from_id(
+                self._view_mismatch_member_id
+            )
+            self._view_mismatch_member_id = None
+            if member is None or member.state != "alive":
+                member = self._random_alive_member()
+            if member is not None:
+                pending_push_pulls.add(member.remote_member_id)
+        for remote_member_id in pending_push_pulls:
+            self.push_pull_with(remote_member_id)
+
+    def _random_alive_member(self):
+        """A member chosen uniformly at random from those we believe alive
+        (None if there are none)"""
+        alive = self._members_by_state[STATE_ALIVE]
+        if not alive:
+            return None
+        return self._remote_members_by_id[self.rand.choice(tuple(alive))]
+
+    @property
+    def nodes_to_ping(self):
+        """The members in the ping rotation (with zone-aware probing, those
+        in our zone), or None if it hasn't been built yet"""
+        if self._rotation is None:
+            return None
+        return self._rotation.members
+
+    @property
+    def _next_node_to_ping(self):
+        """The position in nodes_to_ping of the next member to ping"""
+        return self._rotation.next_index
+
+    def _build_rotations(self):
+        """Put every member which hasn't left into the ping rotation (or,
+        with zone-aware probing, into that of our zone or of the others)"""
+        members = [member for member in self.expected_remote_members
+                   if member.state_code != STATE_LEFT]
+        if not self.zone_aware_probing:
+            self._rotation = ProbeRotation(members, self.rand)
+            return
+        local_members = []
+        other_members = []
+        for member in members:
+            if self._in_our_zone(member):
+                local_members.append(member)
+            else:
+                other_members.append(member)
+        self._rotation = ProbeRotation(local_members, self.rand)
+        self._cross_zone_rotation = ProbeRotation(other_members, self.rand)
+
+    def _in_our_zone(self, remote_member):
+        """Is remote_member known to be in the same zone as us?"""
+        if remote_member.zone is None and self.zone_of is not None:
+            remote_member.zone = self.zone_of(remote_member.remote_member_id)
+        return (remote_member.zone is not None and
+                remote_member.zone == self.zone)
+
+    def _rotation_for(self, remote_member):
+        """The ping rotation which remote_member belongs in"""
+        if (self._cross_zone_rotation is None or
+                self._in_our_zone(remote_member)):
+            return self._rotation
+        return self._cross_zone_rotation
 
     def _select_node_to_ping(self):
         """Select a node to ping using randomised round-robin as per
-        section 4.3 of the paper.
-        (helps to provide time bounded strong completeness)"""
-        if self.nodes_to_ping is None:
-            random.shuffle(self.expected_remote_members)
-            self.nodes_to_ping = itertools.cycle(self.expected_remote_members)
-        return self.nodes_to_ping.next()
+        section 4.3 of the paper (helps to provide time bounded strong
+        completeness). With zone-aware probing, a member in another zone is
+        only pinged in (at most) a proportion cross_zone_probe_rate of
+        protocol periods, and a member in our zone otherwise."""
+        if self._rotation is None:
+            self._build_rotations()
+        rotation = self._rotation
+        cross_zone_rotation = self._cross_zone_rotation
+        if cross_zone_rotation is not None and cross_zone_rotation.members:
+            rate = self.cross_zone_probe_rate
+            if rate is None:
+                # As many cross-zone pings as if we chose uniformly
+                rate = float(len(cross_zone_rotation.members)) / (
+                    len(rotation.members) + len(cross_zone_rotation.members)
+                )
+            self._cross_zone_credit = min(1.0, self._cross_zone_credit + rate)
+            if self._cross_zone_credit >= 1.0 or not rotation.members:
+                self._cross_zone_credit = max(
+                    0.0, self._cross_zone_credit - 1.0
+                )
+                rotation = cross_zone_rotation
+        return rotation.next_member()
+
+    def _add_to_rotation(self, remote_member):
+        """Insert a newly joined member into the ping rotation at a
+        uniformly random position among those yet to be pinged this round
+        (as per section 4.3 of the paper), in constant time"""
+        if self._rotation is None:
+            # The rotation hasn't been built yet; it will include this member
+            return
+        self._rotation_for(remote_member).add(remote_member)
+
+    def _remove_from_rotation(self, remote_member):
+        """Remove a member which has left from the ping rotation, in
+        constant time (the members yet to be pinged this round stay yet to
+        be pinged)"""
+        if self._rotation is not None:
+            self._rotation_for(remote_member).remove(remote_member)
 
     def select_nodes_to_ping_req(self, node_id_to_ping):
-        """Returns K nodes for the failure detection subgroup """
-        nodes_to_ping_req = []
-        if self.nodes_to_ping is not None:
-            aux = list(self.expected_remote_members)
-            random.shuffle(aux)
-            nodes_to_ping_req = [node for node in aux
-                                 if node.remote_member_id != node_id_to_ping]
-        return nodes_to_ping_req[:swimprotocol.SWIM.K]
+        """Returns (up to) K nodes for the failure detection subgroup,
+        chosen uniformly at random from those in the ping rotation which
+        aren't node_id_to_ping and aren't known to be dead (with zone-aware
+        probing, preferring those in our zone if prefer_local_helpers).
+        Random positions in the rotation are sampled (rejecting ineligible
+        and repeated nodes), so this usually takes time proportional to K
+        rather than to the size of the group."""
+        if self._rotation is None:
+            return []
+        rotations = [self._rotation]
+        if self._cross_zone_rotation is not None:
+            rotations.append(self._cross_zone_rotation)
+        if len(rotations) == 1 or not self.prefer_local_helpers:
+            return self._sample_helpers(rotations, node_id_to_ping, [],
+                                        self.rand)
+        selected = self._sample_helpers(rotations[:1], node_id_to_ping, [],
+                                        self.rand)
+        if len(selected) < swimprotocol.SWIM.K:
+            selected = self._sample_helpers(rotations[1:], node_id_to_ping,
+                                            selected, self.rand)
+        return selected
+
+    @staticmethod
+    def _sample_helpers(rotations, node_id_to_ping, selected, rand):
+        """Add to selected (up to K in all) ping_req helpers chosen
+        uniformly at random (drawing on rand) from the members of (one or
+        two) rotations which are neither dead nor left"""
+        wanted = swimprotocol.SWIM.K - len(selected)
+        first = rotations[0].members
+        second = rotations[1].members if len(rotations) > 1 else []
+        n_first = len(first)
+        n_nodes = n_first + len(second)
+        if not n_nodes or wanted <= 0:
+            return selected
+        chosen = []
+        for _ in xrange(4 * wanted):
+            index = rand.randrange(n_nodes)
+            if index < n_first:
+                node = first[index]
+            else:
+                node = second[index - n_first]
+            if (node.state_code < STATE_DEAD and
+                    node.remote_member_id != node_id_to_ping and
+                    node not in chosen and node not in selected):
+                chosen.append(node)
+                if len(chosen) == wanted:
+                    return selected + chosen
+        # Most of the rotation must be ineligible (e.g. in a small group,
+        # or one in which many members have failed)
+        eligible = [node for node in first + second
+                    if node.state_code < STATE_DEAD and
+                    node.remote_member_id != node_id_to_ping and
+                    node not in selected]
+        if len(eligible) <= wanted:
+            rand.shuffle(eligible)
+            return selected + eligible
+        return selected + rand.sample(eligible, wanted)
 
     def broadcast_message(self, message):
         """ Broadcast a message to all known members """
         for member in self.expected_remote_members:
-            self.send_message_to_member_id(message, member.remote_member_id)
+            if member.state != "left":
+                self.send_message_to_member_id(
+                    message,
+                    member.remote_member_id
+                )
+
+    def _send_join(self):
+        """Ask the next of our seed members to let us join the group"""
+        seed_member_id = self.seed_member_ids[
+            self._next_seed % len(self.seed_member_ids)
+        ]
+        self._next_seed += 1
+        self.send_message_to_member_id(
+            swimmsg.join(self.incarnation_number),
+            seed_member_id
+        )
+
+    def membership_view(self):
+        """Returns our entire view of the group (including ourselves) in
+        the same form as piggyback data, i.e.
+        {state: [[member_id, incarnation], ...]}"""
+        view = {"alive" : [[self.member_id, self.incarnation_number]]}
+        for state in DISSEMINATED_STATES:
+            if self._members_by_state[STATE_CODES[state]]:
+                view.setdefault(state, []).extend(
+                    [member.remote_member_id, member.incarnation_number]
+                    for member in self.members_in_state(state)
+                )
+        return view
+
+    def push_pull_with(self, remote_member_id):
+        """Anti-entropy: send our entire view of the group to a member,
+        which will merge it and reply with its own view for us to merge.
+        (Note that on a datagram transport the view of a large group may
+        not fit in a single datagram.)"""
+        self.send_message_to_member_id(
+            swimmsg.sync(self.membership_view()),
+            remote_member_id
+        )
+
+    def on_sync(self, remote_member, message):
+        """remote_member has pushed its view of the group to us; merge it
+        and reply with our own"""
+        self.locally_disseminate(message.meta_data.get("members", {}))
+        self.send_message_to_member_id(
+            swimmsg.sync_ack(self.membership_view()),
+            remote_member.remote_member_id
+        )
+
+    def on_sync_ack(self, message):
+        """A member we pushed our view of the group to has replied with
+        its own"""
+        self.locally_disseminate(message.meta_data.get("members", {}))
+
+    def on_join_request(self, remote_member, message):
+        """remote_member wishes to join the group via us; note that it is
+        alive and send it our entire view of the group"""
+        previous_state = remote_member.state
+        previous_incarnation = remote_member.incarnation_number
+        if remote_member.on_disseminated_data(
+                message.meta_data.get("incarnation", 0),
+                "alive"
+            ):
+            self.member_updated(remote_member, previous_state,
+                                previous_incarnation)
+        self.send_message_to_member_id(
+            swimmsg.join_ack(self.membership_view()),
+            remote_member.remote_member_id
+        )
+
+    def on_join_ack(self, message):
+        """A seed member has let us join the group and sent us its view
+        of the group"""
+        self.joined = True
+        self.locally_disseminate(message.meta_data.get("members", {}))
+
+    def on_leave(self, remote_member, message):
+        """remote_member is gracefully leaving the group"""
+        previous_state = remote_member.state
+        previous_incarnation = remote_member.incarnation_number
+        if remote_member.on_disseminated_data(
+                message.meta_data.get("incarnation", 0),
+                "left"
+            ):
+            self.member_updated(remote_member, previous_state,
+                                previous_incarnation)
+
+    def leave(self):
+        """Gracefully leave the group; all members we believe to be alive
+        are told (and will disseminate the news to any others)"""
+        leave_msg = swimmsg.leave(self.incarnation_number)
+        for member in self.expected_remote_members:
+            if member.state in ("alive", "suspect"):
+                self.send_message_to_member_id(
+                    leave_msg,
+                    member.remote_member_id
+                )
+        self.left = True
+        if self.hash_ring is not None:
+            self.hash_ring.remove(self.member_id)
+        self.close()
 
     def get_piggyback_data_to_send(self):
         """Construct piggyback data for infection style dissemination
-        inspired by section 4.1 of the paper"""
-        # Futures: Limit the number of nodes we will report on (to give bounded
-        # message size/load as opposed to fastest possible dissemination)
+        inspired by section 4.1 of the paper. We always report our own
+        liveness, plus as many recent membership changes from the
+        dissemination buffer as fit in its byte budget (to give bounded
+        message size/load as the group grows).
 
+        The same (unmodifiable) piggyback data is returned for as long as
+        the selected changes, our incarnation and our view are unchanged,
+        so e.g. a broadcast only builds (and encodes) it once."""
+        budget_bytes = (
+            self.dissemination_buffer.budget_bytes -
+            self.dissemination_buffer.entry_size(
+                self.member_id, self.incarnation_number
+            )
+        )
+        selected = self.dissemination_buffer.select(
+            len(self.expected_remote_members) + 1,
+            budget_bytes
+        )
+        if self.metrics is not None:
+            self._piggyback_entries.observe(len(selected))
+        cache_key = (self.incarnation_number, self.view_digest)
+        if (selected is self._piggyback_selected and
+                cache_key == self._piggyback_key):
+            return self._piggyback_data
         alive_nodes = [(self.member_id, self.incarnation_number)]
         dead_nodes = []
-        for member in self.expected_remote_members:
-            if member.state == "alive":
-                alive_nodes.append((
-                    member.remote_member_id,
-                    member.incarnation_number
-                ))
-            elif member.state == "dead":
-                dead_nodes.append((
-                    member.remote_member_id, member.incarnation_number
-                ))
-        piggyback_data = {
+        nodes_by_state = swimmsg.PiggybackData({
             "alive"  : alive_nodes,
             "dead"  : dead_nodes,
-        }
-        return piggyback_data
+        })
+        for member_id, state, incarnation in selected:
+            nodes_by_state.setdefault(state, []).append(
+                (member_id, incarnation)
+            )
+        nodes_by_state["digest"] = self.view_digest
+        self._piggyback_selected = selected
+        self._piggyback_key = cache_key
+        self._piggyback_data = nodes_by_state
+        return nodes_by_state
+
+    def member_updated(self, remote_member, previous_state=None,
+                       previous_incarnation=None):
+        """Our view of remote_member has changed; keep the ping rotation
+        up to date and queue the change up for infection style
+        dissemination. (previous_incarnation is None if its incarnation
+        hasn't changed.)"""
+        if (self._subscribers and remote_member.remote_member_id
+                not in self._changed_members):
+            if previous_incarnation is None:
+                previous_incarnation = remote_member.incarnation_number
+            self._changed_members[remote_member.remote_member_id] = (
+                remote_member, previous_state, previous_incarnation
+            )
+        self._index_member(remote_member)
+        if self.hash_ring is not None:
+            if remote_member.state in HASH_RING_STATES:
+                self.hash_ring.add(remote_member.remote_member_id)
+            else:
+                self.hash_ring.remove(remote_member.remote_member_id)
+        if remote_member.state == "left" and previous_state != "left":
+            remote_member.stop_checking_for_failure()
+            self._remove_from_rotation(remote_member)
+        elif previous_state == "left" and remote_member.state != "left":
+            self._add_to_rotation(remote_member)
+        elif (previous_state == "dead" and remote_member.state == "alive" and
+              self.push_pull_interval):
+            # A partition may have healed; make sure we both catch up
+            self._pending_push_pulls.add(remote_member.remote_member_id)
+        disseminate = self.enable_infection_dissemination
+        if remote_member.state == "suspect":
+            self._suspect(remote_member, previous_state)
+        elif previous_state == "suspect":
+            remote_member.cancel_suspicion()
+            suspected_incarnation = self._suspected_incarnations.pop(
+                remote_member.remote_member_id, None
+            )
+            if (remote_member.state == "alive" and
+                    remote_member.incarnation_number > suspected_incarnation):
+                self.suspicions_refuted += 1
+                if self.metrics is not None:
+                    self.record_suspicion("refuted")
+            elif remote_member.state == "alive":
+                # We've heard from it directly (e.g. it acked a ping) in
+                # the incarnation in which it's suspected. Only it can
+                # refute the suspicion, by reincarnating (see section 4.2
+                # of the paper); the others won't believe it alive in the
+                # same incarnation, so there's no point disseminating that
+                disseminate = False
+        self._update_view_digest(remote_member)
+        if disseminate:
+            self.dissemination_buffer.enqueue(
+                remote_member.remote_member_id,
+                remote_member.state,
+                remote_member.incarnation_number
+            )
+
+    def _index_member(self, remote_member):
+        """Keep the per-state indexes up to date with a change to
+        remote_member (in constant time)"""
+        self.view_version += 1
+        members_by_state = self._members_by_state
+        state_code = remote_member.state_code
+        member_id = remote_member.remote_member_id
+        if member_id in members_by_state[state_code]:
+            return
+        for code, member_ids in enumerate(members_by_state):
+            if member_id in member_ids:
+                member_ids.remove(member_id)
+                self._frozen_by_state[code] = None
+        members_by_state[state_code].add(member_id)
+        self._frozen_by_state[state_code] = None
+
+    def count(self, state="alive"):
+        """How many remote members we believe to be in 'state' (one of
+        STATE_NAMES), in constant time"""
+        return len(self._members_by_state[STATE_CODES[state]])
+
+    def members_in_state(self, state="alive"):
+        """Iterates over the RemoteMembers we believe to be in 'state' (one
+        of STATE_NAMES), without visiting any others; our view of the group
+        mustn't change during the iteration (take a snapshot() if it
+        might)"""
+        remote_members_by_id = self._remote_members_by_id
+        for member_id in self._members_by_state[STATE_CODES[state]]:
+            yield remote_members_by_id[member_id]
+
+    def snapshot(self):
+        """Returns an immutable MembershipSnapshot of our view of the group.
+        Snapshots are shared until our view changes, and then only the
+        sets of members in states which have changed are rebuilt."""
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self.view_version:
+            return snapshot
+        frozen_by_state = self._frozen_by_state
+        for state in DISSEMINATED_STATES:
+            code = STATE_CODES[state]
+            if frozen_by_state[code] is None:
+                frozen_by_state[code] = frozenset(self._members_by_state[code])
+        self._snapshot = MembershipSnapshot(
+            self.view_version,
+            *[frozen_by_state[STATE_CODES[state]]
+              for state in DISSEMINATED_STATES]
+        )
+        return self._snapshot
+
+    def suspicion_timeout(self):
+        """How long a suspected member has to refute the suspicion (section
+        4.2 of the paper) before we declare it dead; this grows with log10
+        of the group size, as does the time taken for the suspicion (and
+        the refutation) to disseminate"""
+        n_members = len(self.expected_remote_members) + 1
+        return (self.suspicion_multiplier *
+                max(1.0, math.log10(n_members)) *
+                swimprotocol.SWIM.T)
+
+    def _suspect(self, remote_member, previous_state):
+        """remote_member has become suspect (perhaps in a newer
+        incarnation); (re)start the clock on declaring it dead"""
+        if previous_state != "suspect":
+            self.suspicions_raised += 1
+            if self.metrics is not None:
+                self.record_suspicion("raised")
+        self._suspected_incarnations[remote_member.remote_member_id] = (
+            remote_member.incarnation_number
+        )
+        remote_member.cancel_suspicion()
+        remote_member.suspicion_timer = self.scheduler.schedule(
+            self.time_now + self.suspicion_timeout(),
+            lambda time_now: self._suspicion_expired(remote_member)
+        )
+
+    def _suspicion_expired(self, remote_member):
+        """remote_member has not refuted our suspicion in time"""
+        remote_member.suspicion_timer = None
+        if remote_member.state == "suspect":
+            self.suspicions_confirmed += 1
+            if self.metrics is not None:
+                self.record_suspicion("confirmed")
+            remote_member.node_failed()
 
     def send_message_to_member_id(self, message, remote_member_id):
         """ Send a message to a specific member"""
@@ -141,12 +1155,51 @@ class Membership(object):
         id matching 'from_sender' if one can be found; None otherwise"""
         return self._remote_members_by_id.get(member_id, None)
 
+    def _add_remote_member(self, member_id, incarnation, state):
+        """Start tracking a member we hadn't previously heard of"""
+        remote_member = RemoteMember(member_id)
+        remote_member.incarnation_number = incarnation
+        remote_member.state = state
+        remote_member.start(self)
+        self.expected_remote_members.append(remote_member)
+        self._remote_members_by_id[member_id] = remote_member
+        self._add_to_rotation(remote_member)
+        self.member_updated(remote_member)
+        return remote_member
+
     def on_incoming_message(self, message, from_sender_id):
         """We've received a message from the sender identified by
         'from_sender_id# """
+        if self.left:
+            return
         self.last_received_message = message
         self.received_messages = self.received_messages + 1
+        disseminate = bool(
+            message.has_piggyback_data and self.enable_infection_dissemination
+        )
+        if disseminate:
+            # (Checking the digest doesn't require a deserialised message's
+            # piggyback data to be decoded)
+            if message.piggyback_digest == self.view_digest:
+                # The sender's view of the group is identical to ours, so
+                # there's nothing for us to merge
+                disseminate = False
+                self.merges_skipped += 1
+            else:
+                self._view_mismatch_member_id = from_sender_id
         logical_from_sender = self._remote_member_from_id(from_sender_id)
+        if logical_from_sender is None and disseminate:
+            # The sender may have joined recently, in which case its
+            # piggyback data will introduce it to us
+            disseminate = False
+            self.locally_disseminate(message.piggyback_data)
+            logical_from_sender = self._remote_member_from_id(from_sender_id)
+        if logical_from_sender is None and message.message_name == "join":
+            logical_from_sender = self._add_remote_member(
+                from_sender_id,
+                message.meta_data.get("incarnation", 0),
+                "alive"
+            )
         if logical_from_sender is None:
             # Could be a message sent by recently added or
             # removed node; log & ignore.
@@ -154,34 +1207,38 @@ class Membership(object):
                 self.member_id, from_sender_id, message
             )
         else:
-            logical_from_sender.handle_incoming_message(message)
-            if message.piggyback_data and self.enable_infection_dissemination:
+            # (Merging the sender's piggyback data first means that if it
+            # has refuted our suspicion of it by reincarnating, we hear of
+            # that before its message tells us it's alive)
+            if disseminate:
                 self.locally_disseminate(message.piggyback_data)
+            logical_from_sender.handle_incoming_message(message)
 
     def locally_disseminate(self, piggyback_data):
-        """Handle data which has been disseminated to us"""
-        alive_nodes = piggyback_data.get("alive", [])
-        dead_nodes = piggyback_data.get("dead", [])
-        for member_id, incarnation in alive_nodes:
-            remote_node = self._remote_member_from_id(member_id)
-            if remote_node:
-                remote_node.on_disseminated_data(incarnation, "alive")
-        for member_id, incarnation in dead_nodes:
-            if member_id == self.member_id:
-                if incarnation >= self.incarnation_number:
-                    self.incarnation_number = incarnation + 1
-                    # Futures: if we hear a rumour of
-                    # our own death in our
-                    # current (or a future) incarnation
-                    #  then we should
-                    # broadcast our liveness to quash this?
-            else:
+        """Handle data which has been disseminated to us. Members we hear
+        are alive but hadn't previously heard of are added to our view."""
+        for state in DISSEMINATED_STATES:
+            for member_id, incarnation in piggyback_data.get(state, []):
+                if member_id == self.member_id:
+                    if (state != "alive" and not self.left and
+                            incarnation >= self.incarnation_number):
+                        self._update_incarnation(incarnation + 1)
+                        # Futures: if we hear a rumour of
+                        # our own death in our
+                        # current (or a future) incarnation
+                        #  then we should
+                        # broadcast our liveness to quash this?
+                    continue
                 remote_node = self._remote_member_from_id(member_id)
-                if remote_node:
-                    remote_node.on_disseminated_data(
-                        incarnation,
-                        "dead"
-                    )
+                if remote_node is None:
+                    if state in ("alive", "suspect"):
+                        self._add_remote_member(member_id, incarnation, state)
+                else:
+                    previous_state = remote_node.state
+                    previous_incarnation = remote_node.incarnation_number
+                    if remote_node.on_disseminated_data(incarnation, state):
+                        self.member_updated(remote_node, previous_state,
+                                            previous_incarnation)
 
     def member_indirectly_reachable(
             self,
@@ -215,20 +1272,49 @@ class Membership(object):
 
 class FailureDetectionTransaction(object):
     """ Class to handle failure detection """
+    __slots__ = (
+        "start_time",
+        "owner",
+        "remote_member_id",
+        "ack_received",
+        "ping_req_ack_received",
+        "response_timeout",
+        "state",
+        "_timeout",
+        "ping_req_time",
+    )
+
     def __init__(self, time_now, owner, remote_member_id):
         self.start_time = time_now
         self.owner = owner
         self.remote_member_id = remote_member_id
         self.ack_received = False
         self.ping_req_ack_received = False
-        self.response_timeout = 2
+        self.response_timeout = owner.probe_timeout()
         self.state = "idle"
+        self._timeout = None
+        self.ping_req_time = None
 
     def start(self):
         """Start checking the remote node for failure"""
         self.state = "ping_sent"
+        self._schedule_timeout(self.start_time + self.response_timeout)
         self.owner.send_ping()
 
+    def _schedule_timeout(self, deadline):
+        """Arrange for on_tick to be called once time passes deadline"""
+        self._cancel_timeout()
+        self._timeout = self.owner.membership.scheduler.schedule(
+            deadline,
+            self.on_tick
+        )
+
+    def _cancel_timeout(self):
+        """We no longer need to be told about the passage of time"""
+        if self._timeout is not None:
+            self.owner.membership.scheduler.cancel(self._timeout)
+            self._timeout = None
+
     def on_tick(self, time_now):
         """Time is marching on - do we need to time any operations out?
         (time_now should be some sort of monotonic time)"""
@@ -242,39 +1328,112 @@ class FailureDetectionTransaction(object):
             if time_now > self.start_time + self.response_timeout:
                 # Direct ping has failed; let's try indirect ping (ping_req)
                 self.state = "ping_req_sent"
+                self.ping_req_time = self.owner.membership.now()
+                self._schedule_timeout(
+                    self.start_time + (self.response_timeout * 2)
+                )
                 self.owner.send_ping_reqs()
         elif self.state == "ping_req_sent":
             if time_now > self.start_time + (self.response_timeout * 2):
                 # print "FailureDetectionTransaction not heard back "\
-                #      "regarding %s; assuming failure" % self.remote_member_id
+                #      "regarding %s; suspect failure" % self.remote_member_id
                 self.state = "failure_detected"
-                self.owner.node_failed()
+                self._cancel_timeout()
+                if self.owner.membership.metrics is not None:
+                    self.owner.membership.record_probe_outcome("timeout")
+                self.owner.node_suspected()
+
+    def abandon(self):
+        """We're no longer interested in the liveness of this node"""
+        self.state = "abandoned"
+        self._cancel_timeout()
 
     def on_ack(self):
         """We pinged a node ourselves and it responded directly to us"""
+        membership = self.owner.membership
+        rtt_sample = membership.now() - self.start_time
+        self.owner.rtt_estimator.add_sample(rtt_sample)
+        if membership.metrics is not None:
+            membership.record_probe_outcome("ack", rtt_sample)
         self.state = "alive"
+        self._cancel_timeout()
         self.owner.node_alive()
 
     def on_ping_req_ack(self):
         """We have received a ping_req_ack - so we know that a node we
         sent a ping_req to managed, on our behalf, to ping the node
         we're checking."""
+        membership = self.owner.membership
+        rtt_sample = None
+        if self.ping_req_time is not None:
+            # The indirect round trip is (roughly) two direct ones
+            rtt_sample = (membership.now() - self.ping_req_time) / 2.0
+            self.owner.rtt_estimator.add_sample(rtt_sample)
+        if membership.metrics is not None:
+            membership.record_probe_outcome("indirect_ack", rtt_sample)
         self.state = "alive"
+        self._cancel_timeout()
         self.owner.node_alive()
 
 
 class RemoteMember(object):
     """  Represents a remote member of the distributed process group;
     handles  messages communicated between this node and the remote
-    member and maintains 'state' about the remote member's liveness. """
-    def __init__(self, remote_member_id):
+    member and maintains 'state' about the remote member's liveness.
+
+    Every member holds one of these for every other member of the group,
+    so they are kept compact: attributes live in __slots__ rather than a
+    per-instance dict, the state is held as an integer code, and the round
+    trip time estimator is only allocated once it's needed. """
+    __slots__ = (
+        "remote_member_id",
+        "incarnation_number",
+        "state_code",
+        "failure_detection_transaction",
+        "membership",
+        "view_digest",  # our contribution to Membership.view_digest
+        "suspicion_timer",
+        "rotation_index",  # our position in our ProbeRotation
+        "zone",
+        "_rtt_estimator",
+    )
+
+    def __init__(self, remote_member_id, zone=None):
         """
         """
         self.remote_member_id = remote_member_id
+        self.zone = zone
         self.incarnation_number = 0
-        self.state = "unknown"
+        self.state_code = STATE_UNKNOWN
         self.failure_detection_transaction = None
         self.membership = None
+        self.view_digest = 0
+        self.suspicion_timer = None
+        self.rotation_index = None
+        self._rtt_estimator = None
+
+    @property
+    def state(self):
+        """Our view of the remote member's liveness: one of
+        STATE_NAMES"""
+        return STATE_NAMES[self.state_code]
+
+    @state.setter
+    def state(self, state):
+        self.state_code = STATE_CODES[state]
+
+    @property
+    def rtt_estimator(self):
+        """Our estimate of the round trip time to the remote member"""
+        if self._rtt_estimator is None:
+            if self.membership is None:
+                self._rtt_estimator = rtt.RTTEstimator()
+            else:
+                self._rtt_estimator = rtt.RTTEstimator(
+                    self.membership.min_probe_timeout,
+                    self.membership.max_probe_timeout
+                )
+        return self._rtt_estimator
 
     def __str__(self):
         return 'RemoteMember(remote_member_id=%s, state=%s)' % (
@@ -283,22 +1442,43 @@ class RemoteMember(object):
 
     def on_disseminated_data(self, incarnation, state):
         """ Piggyback data was received pertaining to the state
-        of this node; update our state accordingly if appropriate. """
+        of this node; update our state accordingly if appropriate.
+        Returns True if our view of this node changed. """
         if incarnation > self.incarnation_number:
             # This is info about a newer incarnation that we have info
             # about; believe what we're told.
             self.incarnation_number = incarnation
-            self.state = state
+            self.state_code = STATE_CODES[state]
+            return True
         elif incarnation == self.incarnation_number:
-            # if same incarnation, only accept rumours of death as
-            # node must reincarnate to clear these up if it is
-            # actually alive.
-            if state == "dead":
-                self.state = "dead"
+            # if same incarnation, only accept rumours of suspicion, death
+            # (or of having left) as node must reincarnate to clear these up
+            # if it is actually alive. Death trumps suspicion and having
+            # left trumps death.
+            state_code = STATE_CODES[state]
+            if (_STATE_PRECEDENCE[state_code] >
+                    _STATE_PRECEDENCE[self.state_code]):
+                self.state_code = state_code
+                return True
+        return False
+
+    def has_rtt_estimate(self):
+        """Have we an estimate of the round trip time to the remote member
+        (without allocating an estimator if not)?"""
+        return self._rtt_estimator is not None
+
+    def probe_timeout(self):
+        """How long to wait for the remote member to answer a probe"""
+        if self._rtt_estimator is None:
+            return self.membership.max_probe_timeout
+        return self._rtt_estimator.timeout()
 
     def start(self, membership):
         """Prepare to become operational"""
         self.membership = membership
+        if self._rtt_estimator is not None:
+            self._rtt_estimator.min_timeout = membership.min_probe_timeout
+            self._rtt_estimator.max_timeout = membership.max_probe_timeout
 
     def on_tick(self, time_now):
         """Time is marching forwards - do we need to time-out any
@@ -315,6 +1495,12 @@ class RemoteMember(object):
         of this node?"""
         return self.failure_detection_transaction is not None
 
+    def stop_checking_for_failure(self):
+        """Abandon any liveness check in progress"""
+        if self.failure_detection_transaction is not None:
+            self.failure_detection_transaction.abandon()
+            self.failure_detection_transaction = None
+
     def begin_checking_for_failure(self, time_now):
         """Let's check the liveness of this node"""
         assert self.membership is not None
@@ -328,13 +1514,35 @@ class RemoteMember(object):
 
     def node_alive(self):
         """This node appears to be alive"""
+        previous_state = self.state
         self.state = "alive"
         self.failure_detection_transaction = None
+        if previous_state != self.state:
+            self.membership.member_updated(self, previous_state)
+
+    def node_suspected(self):
+        """This node couldn't be reached, directly or indirectly; suspect
+        that it has failed (unless we already believe it has)"""
+        previous_state = self.state
+        if self.state not in ("dead", "left"):
+            self.state = "suspect"
+        self.failure_detection_transaction = None
+        if previous_state != self.state:
+            self.membership.member_updated(self, previous_state)
+
+    def cancel_suspicion(self):
+        """Stop the clock on declaring this node dead"""
+        if self.suspicion_timer is not None:
+            self.membership.scheduler.cancel(self.suspicion_timer)
+            self.suspicion_timer = None
 
     def node_failed(self):
         """This node appears to be failed/unreachable"""
+        previous_state = self.state
         self.state = "dead"
         self.failure_detection_transaction = None
+        if previous_state != self.state:
+            self.membership.member_updated(self, previous_state)
 
     def send_ping(self):
         """ Send a ping (along with some piggyback data) to the remote
@@ -432,3 +1640,13 @@ class RemoteMember(object):
                             self.remote_member_id,
                             message
                         )
+            elif message.message_name == 'join':
+                self.membership.on_join_request(self, message)
+            elif message.message_name == 'join_ack':
+                self.membership.on_join_ack(message)
+            elif message.message_name == 'leave':
+                self.membership.on_leave(self, message)
+            elif message.message_name == 'sync':
+                self.membership.on_sync(self, message)
+            elif message.message_name == 'sync_ack':
+                self.membership.on_sync_ack(message)
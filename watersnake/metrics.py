@@ -0,0 +1,222 @@
+""" Metrics (counters, gauges and histograms) describing the operation of a
+protocol based on the SWIM protocol described in
+http://www.cs.cornell.edu/~asdas/research/dsn02-SWIM.pdf ("the paper").
+
+Instrumented objects (Membership, MessageTransport) take an optional
+MetricsRegistry; with none (the default) each instrumentation point costs a
+single attribute test. A registry can be snapshotted as plain data, or
+rendered in the Prometheus text exposition format. """
+
+import bisect
+import os
+import tempfile
+
+# Histogram bucket upper bounds (the +Inf bucket is implicit)
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+RTT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+               0.5, 1.0, 2.0)
+SIZE_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Counter(object):
+    """ A monotonically increasing count """
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        """Increase the count"""
+        self.value += amount
+
+    def snapshot(self):
+        """The current count"""
+        return self.value
+
+
+class Gauge(object):
+    """ A value which may go up and down; either set explicitly or read
+    from 'function' whenever it's snapshotted """
+    __slots__ = ("value", "function")
+
+    def __init__(self, function=None):
+        self.value = 0
+        self.function = function
+
+    def set(self, value):
+        """Set the current value"""
+        self.value = value
+
+    def snapshot(self):
+        """The current value"""
+        if self.function is not None:
+            return self.function()
+        return self.value
+
+
+class Histogram(object):
+    """ Counts of observations falling into buckets with the given upper
+    bounds, plus their sum and count """
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        """Record an observation"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        """{"buckets": [(upper bound, cumulative count)], "sum", "count"}"""
+        cumulative = []
+        total = 0
+        for upper_bound, count in zip(self.buckets + (float("inf"),),
+                                      self.counts):
+            total += count
+            cumulative.append((upper_bound, total))
+        return {"buckets": cumulative, "sum": self.sum, "count": self.count}
+
+
+class MetricFamily(object):
+    """ A named metric, with one child Counter, Gauge or Histogram per
+    combination of label values """
+    def __init__(self, name, help_text, metric_type, label_names, factory):
+        self.name = name
+        self.help_text = help_text
+        self.metric_type = metric_type
+        self.label_names = tuple(label_names)
+        self._factory = factory
+        self.children = {}
+
+    def labels(self, *label_values):
+        """The child for the given label values (created on first use)"""
+        child = self.children.get(label_values)
+        if child is None:
+            assert len(label_values) == len(self.label_names)
+            child = self._factory()
+            self.children[label_values] = child
+        return child
+
+    def snapshot(self):
+        """{label values: child snapshot}"""
+        return dict((label_values, child.snapshot())
+                    for label_values, child in self.children.iteritems())
+
+
+class MetricsRegistry(object):
+    """ A collection of named metric families """
+    def __init__(self, prefix="watersnake_"):
+        self.prefix = prefix
+        self.families = {}
+
+    def _family(self, name, help_text, metric_type, label_names, factory):
+        """Get (or create) the family 'name'"""
+        name = self.prefix + name
+        family = self.families.get(name)
+        if family is None:
+            family = MetricFamily(name, help_text, metric_type, label_names,
+                                  factory)
+            self.families[name] = family
+        assert family.metric_type == metric_type
+        return family
+
+    def counter(self, name, help_text, label_names=()):
+        """Get (or create) a family of counters"""
+        return self._family(name, help_text, "counter", label_names, Counter)
+
+    def gauge(self, name, help_text, label_names=(), function=None):
+        """Get (or create) a family of gauges; if given, function() is the
+        value of every gauge in the family"""
+        return self._family(name, help_text, "gauge", label_names,
+                            lambda: Gauge(function))
+
+    def histogram(self, name, help_text, buckets, label_names=()):
+        """Get (or create) a family of histograms"""
+        buckets = tuple(sorted(buckets))
+        return self._family(name, help_text, "histogram", label_names,
+                            lambda: Histogram(buckets))
+
+    def snapshot(self):
+        """The current value of every metric, as
+        {name: {"type", "help", "label_names", "samples": {label values:
+        value}}}"""
+        return dict((name, {
+            "type": family.metric_type,
+            "help": family.help_text,
+            "label_names": family.label_names,
+            "samples": family.snapshot(),
+        }) for name, family in self.families.iteritems())
+
+    def to_prometheus_text(self):
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        for name, family in sorted(self.snapshot().iteritems()):
+            lines.append("# HELP %s %s" % (name, family["help"]))
+            lines.append("# TYPE %s %s" % (name, family["type"]))
+            for label_values, value in sorted(family["samples"].iteritems()):
+                labels = zip(family["label_names"], label_values)
+                if family["type"] != "histogram":
+                    lines.append(_sample_line(name, labels, value))
+                    continue
+                for upper_bound, count in value["buckets"]:
+                    lines.append(_sample_line(
+                        name + "_bucket",
+                        labels + [("le", upper_bound)],
+                        count
+                    ))
+                lines.append(_sample_line(name + "_sum", labels,
+                                          value["sum"]))
+                lines.append(_sample_line(name + "_count", labels,
+                                          value["count"]))
+        lines.append("")
+        return "\n".join(lines)
+
+    def write_prometheus_file(self, path):
+        """Atomically replace the file at path with the Prometheus text
+        rendering of our metrics (e.g. for node_exporter's textfile
+        collector)"""
+        directory = os.path.dirname(os.path.abspath(path))
+        handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w") as temp_file:
+                temp_file.write(self.to_prometheus_text())
+            os.rename(temp_path, path)
+        except:
+            os.unlink(temp_path)
+            raise
+
+
+def _format_value(value):
+    """Format a sample value (or 'le' bound) as Prometheus expects"""
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _sample_line(name, labels, value):
+    """A single line of Prometheus text"""
+    if not labels:
+        return "%s %s" % (name, _format_value(value))
+    return "%s{%s} %s" % (
+        name,
+        ",".join('%s="%s"' % (label_name, _escape(label_value))
+                 for label_name, label_value in labels),
+        _format_value(value)
+    )
+
+
+def _escape(label_value):
+    """Escape a label value for Prometheus text"""
+    if not isinstance(label_value, basestring):
+        return _format_value(label_value)
+    return label_value.replace("\\", "\\\\").replace('"', '\\"').replace(
+        "\n", "\\n"
+    )
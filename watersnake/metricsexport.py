@@ -0,0 +1,63 @@
+""" Export of the metrics (see watersnake.metrics) recorded by members of a
+group running a protocol based on the SWIM protocol described in
+http://www.cs.cornell.edu/~asdas/research/dsn02-SWIM.pdf ("the paper"),
+in the Prometheus text format, built on the twisted reactor. """
+# Disable 'Invalid name'                             pylint: disable=C0103
+
+from twisted.internet import protocol, task
+
+
+class MetricsTextProtocol(protocol.Protocol):
+    """ Writes the Prometheus text rendering of the factory's registry to
+    each connection, then closes it (so e.g. 'nc localhost PORT' or a unix
+    socket reader can scrape it) """
+    def connectionMade(self):
+        """twisted callback - a client has connected"""
+        self.transport.write(self.factory.registry.to_prometheus_text())
+        self.transport.loseConnection()
+
+
+class MetricsTextFactory(protocol.Factory):
+    """ Factory for MetricsTextProtocol connections serving registry """
+    protocol = MetricsTextProtocol
+
+    def __init__(self, registry):
+        self.registry = registry
+
+
+def listen_tcp(registry, reactor, port=0, interface="127.0.0.1"):
+    """Serve registry's metrics to anyone connecting to port; returns the
+    twisted listening port"""
+    return reactor.listenTCP(port, MetricsTextFactory(registry),
+                             interface=interface)
+
+
+def listen_unix(registry, reactor, path):
+    """Serve registry's metrics to anyone connecting to the unix socket at
+    path; returns the twisted listening port"""
+    return reactor.listenUNIX(path, MetricsTextFactory(registry))
+
+
+class MetricsFileWriter(object):
+    """ Periodically rewrites the file at path with the Prometheus text
+    rendering of registry (as expected by e.g. node_exporter's textfile
+    collector) """
+    def __init__(self, registry, path, reactor, period=10.0):
+        self.registry = registry
+        self.path = path
+        self.period = period
+        self._loop = task.LoopingCall(self.write)
+        self._loop.clock = reactor
+
+    def start(self):
+        """Start writing; returns a deferred which fires when stopped"""
+        return self._loop.start(self.period, now=True)
+
+    def stop(self):
+        """Stop writing"""
+        if self._loop.running:
+            self._loop.stop()
+
+    def write(self):
+        """Write the file now"""
+        self.registry.write_prometheus_file(self.path)
@@ -0,0 +1,70 @@
+""" Round trip time estimation used to derive probe timeouts for a protocol
+based on the SWIM protocol described in
+http://www.cs.cornell.edu/~asdas/research/dsn02-SWIM.pdf ("the paper") """
+
+import watersnake.swimprotocol as swimprotocol
+
+# Bounds (in seconds) on the time we wait for a probe to be answered
+DEFAULT_MIN_PROBE_TIMEOUT = 0.05
+DEFAULT_MAX_PROBE_TIMEOUT = swimprotocol.SWIM.T
+
+
+class RTTEstimator(object):
+    """ Smoothed estimate of the round trip time to a single remote member,
+    maintained as an exponentially weighted moving average of samples and of
+    their deviation from it (as TCP does, RFC 6298).
+
+    The probe timeout derived from the estimate is clamped to
+    [min_timeout, max_timeout]; until a sample has been taken it is
+    max_timeout. """
+    __slots__ = ("min_timeout", "max_timeout", "srtt", "rttvar", "samples")
+
+    ALPHA = 0.125  # gain applied to the smoothed round trip time
+    BETA = 0.25  # gain applied to the round trip time variation
+    K = 4  # deviations allowed above the smoothed round trip time
+
+    def __init__(
+            self,
+            min_timeout=DEFAULT_MIN_PROBE_TIMEOUT,
+            max_timeout=DEFAULT_MAX_PROBE_TIMEOUT
+        ):
+        assert 0 <= min_timeout <= max_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.srtt = None
+        self.rttvar = None
+        self.samples = 0
+
+    def __str__(self):
+        return 'RTTEstimator(srtt=%s, rttvar=%s, samples=%s)' % (
+            self.srtt, self.rttvar, self.samples
+        )
+
+    def add_sample(self, rtt):
+        """Account for a measured round trip time (in seconds)"""
+        rtt = max(0.0, rtt)
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2.0
+        else:
+            self.rttvar += self.BETA * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += self.ALPHA * (rtt - self.srtt)
+        self.samples += 1
+
+    def timeout(self):
+        """How long to wait for a probe to be answered"""
+        if self.srtt is None:
+            return self.max_timeout
+        return min(
+            self.max_timeout,
+            max(self.min_timeout, self.srtt + self.K * self.rttvar)
+        )
+
+    def snapshot(self):
+        """The current estimate, as a dict"""
+        return {
+            "srtt" : self.srtt,
+            "rttvar" : self.rttvar,
+            "samples" : self.samples,
+            "timeout" : self.timeout(),
+        }
@@ -0,0 +1,75 @@
+""" Deadline scheduling for a protocol based on the SWIM protocol described in
+http://www.cs.cornell.edu/~asdas/research/dsn02-SWIM.pdf ("the paper") """
+
+import heapq
+import itertools
+
+# Seconds after a deadline at which to run it, when arranging to be woken
+# for it (deadlines only expire once time has moved beyond them)
+DEADLINE_SLACK = 0.001
+
+
+class DeadlineScheduler(object):
+    """ A heap of deadlines, each with a callback to be invoked once time has
+    moved beyond it. Running expired deadlines costs time proportional to the
+    number of deadlines which have expired (rather than to the number of
+    remote members which might conceivably have something to time out).
+    Cancelled deadlines are discarded lazily.
+
+    If 'wakeup' is set, wakeup(deadline) is called whenever a deadline is
+    scheduled which is earlier than any other, so that whoever runs
+    expired deadlines can do so promptly (see udptransport.MembershipTicker
+    and simulation.ClusterSimulator), DEADLINE_SLACK after the deadline.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._sequence = itertools.count()
+        self._pending = 0
+        self.wakeup = None
+
+    def __len__(self):
+        """Number of deadlines which are scheduled and not cancelled"""
+        return self._pending
+
+    def schedule(self, deadline, callback):
+        """Arrange for callback(time_now) to be called from the first
+        run_expired(time_now) where time_now > deadline. Returns a handle
+        which may be passed to cancel()."""
+        entry = [deadline, next(self._sequence), callback]
+        heapq.heappush(self._heap, entry)
+        self._pending += 1
+        if self.wakeup is not None and self._heap[0] is entry:
+            self.wakeup(deadline)
+        return entry
+
+    def cancel(self, entry):
+        """Cancel a scheduled deadline (if it hasn't already expired)"""
+        if entry[2] is not None:
+            entry[2] = None
+            self._pending -= 1
+
+    def next_deadline(self):
+        """The earliest deadline still scheduled (or None)"""
+        heap = self._heap
+        while heap and heap[0][2] is None:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def run_expired(self, time_now):
+        """Invoke the callbacks of all deadlines that time_now has moved
+        beyond. Deadlines scheduled by those callbacks are not run until the
+        next call, even if they have already expired."""
+        heap = self._heap
+        expired = []
+        while heap and heap[0][0] < time_now:
+            entry = heapq.heappop(heap)
+            if entry[2] is not None:
+                expired.append(entry)
+        for entry in expired:
+            callback = entry[2]
+            if callback is not None:
+                entry[2] = None
+                self._pending -= 1
+                callback(time_now)
+        return len(expired)
@@ -0,0 +1,198 @@
+""" Persistent state for warm restarts of members of a group running a
+protocol based on the SWIM protocol described in
+http://www.cs.cornell.edu/~asdas/research/dsn02-SWIM.pdf ("the paper"),
+see Membership.enable_state_file().
+
+A member which restarts with incarnation 1 and no idea of who else is in
+the group can't refute rumours of its death in earlier incarnations, and
+only learns of the others as it probes them (one per protocol period). A
+state file records an incarnation at least as high as any it has taken
+(a lease on those up to it, see Membership.enable_state_file()) and a
+compact snapshot of its last view of the group, so that on restarting it
+can take a higher incarnation and seed its member table.
+
+The file is a header, the members' fields in columns (which are packed
+and unpacked a column at a time, rather than a member at a time) and a
+CRC32 of all of them:
+    magic "WSST", version (B), incarnation (Q), member count (I),
+    our member id length (H) and member id (UTF-8)
+    each member's incarnation (Q), then state code (B), then id length (H)
+    each member's id (UTF-8)
+    crc32 (I)
+all in network byte order. It's read in a single bulk read, and written
+atomically (to a temporary file which is renamed over it). """
+
+import collections
+import os
+import struct
+import tempfile
+import threading
+import zlib
+
+MAGIC = b"WSST"
+VERSION = 1
+
+_HEADER = struct.Struct("!4sBQI")
+_ID_LENGTH = struct.Struct("!H")
+_CRC = struct.Struct("!I")
+
+# The contents of a state file: our member id and incarnation (lease), and a
+# list of (member id, incarnation, state code) for each member in our view
+SavedState = collections.namedtuple(
+    "SavedState",
+    ("member_id", "incarnation", "members")
+)
+
+
+def _utf8(member_id):
+    """member_id as UTF-8"""
+    if isinstance(member_id, unicode):
+        return member_id.encode("utf-8")
+    return member_id
+
+
+def encode_state(member_id, incarnation, members):
+    """The contents of a state file for member_id at incarnation with a
+    view of the group given by members, a list of (member id,
+    incarnation, state code)"""
+    member_ids, incarnations, state_codes = (
+        zip(*members) if members else ((), (), ())
+    )
+    member_ids = [x.encode("utf-8") if isinstance(x, unicode) else x
+                  for x in member_ids]
+    count = len(member_ids)
+    member_id = _utf8(member_id)
+    data = b"".join([
+        _HEADER.pack(MAGIC, VERSION, incarnation, count),
+        _ID_LENGTH.pack(len(member_id)),
+        member_id,
+        struct.pack("!%dQ" % count, *incarnations),
+        struct.pack("!%dB" % count, *state_codes),
+        struct.pack("!%dH" % count, *[len(x) for x in member_ids]),
+        b"".join(member_ids),
+    ])
+    return data + _CRC.pack(zlib.crc32(data) & 0xffffffff)
+
+
+def decode_state(buff):
+    """The SavedState held in buff (the contents of a state file); raises
+    ValueError if it's corrupt"""
+    if len(buff) < _HEADER.size + _ID_LENGTH.size + _CRC.size:
+        raise ValueError("Truncated state")
+    body_end = len(buff) - _CRC.size
+    crc, = _CRC.unpack_from(buff, body_end)
+    if zlib.crc32(buff[:body_end]) & 0xffffffff != crc:
+        raise ValueError("Bad checksum")
+    magic, version, incarnation, count = _HEADER.unpack_from(buff)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Unsupported format/version")
+    offset = _HEADER.size
+    length, = _ID_LENGTH.unpack_from(buff, offset)
+    offset += _ID_LENGTH.size
+    member_id = buff[offset:offset + length].decode("utf-8")
+    offset += length
+    columns = []
+    for code in "QBH":
+        column = struct.Struct("!%d%s" % (count, code))
+        if offset + column.size > body_end:
+            raise ValueError("Truncated state")
+        columns.append(column.unpack_from(buff, offset))
+        offset += column.size
+    incarnations, state_codes, lengths = columns
+    if offset + sum(lengths) != body_end:
+        raise ValueError("Truncated state")
+    members = []
+    for remote_incarnation, state_code, length in zip(incarnations,
+                                                      state_codes, lengths):
+        end = offset + length
+        members.append((buff[offset:end].decode("utf-8"),
+                        remote_incarnation, state_code))
+        offset = end
+    return SavedState(member_id, incarnation, members)
+
+
+def read_state(path):
+    """The SavedState in the file at path, or None if there isn't one
+    (raises ValueError if it's corrupt)"""
+    try:
+        with open(path, "rb") as state_file:
+            buff = state_file.read()
+    except IOError:
+        if not os.path.exists(path):
+            return None
+        raise
+    return decode_state(buff)
+
+
+def write_state(path, data):
+    """Atomically replace the file at path with data (the output of
+    encode_state()), syncing it to disk"""
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.rename(temp_path, path)
+    except:
+        os.unlink(temp_path)
+        raise
+
+
+class StateFileWriter(object):
+    """ Writes state to the file at path from a background thread, so that
+    neither a member's tick nor the reactor wait on the disk. Only the most
+    recently submitted state is written; any submitted while a write is in
+    progress replace one another. 'writes' counts the files written. """
+    def __init__(self, path):
+        self.path = path
+        self.writes = 0
+        self._pending = None
+        self._writing = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run,
+                                        name="StateFileWriter")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, data):
+        """Write data (the output of encode_state()) to the file soon"""
+        with self._condition:
+            self._pending = data
+            self._condition.notify_all()
+
+    def flush(self):
+        """Wait until the state submitted so far has been written"""
+        with self._condition:
+            while self._pending is not None or self._writing:
+                self._condition.wait()
+
+    def close(self):
+        """Write any pending state, then stop the thread"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        """Write each state submitted, until closed"""
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                data, self._pending = self._pending, None
+                if data is None:
+                    return
+                self._writing = True
+            try:
+                write_state(self.path, data)
+                self.writes += 1
+            except (IOError, OSError) as error:
+                print "Warning: couldn't write state file '%s': %s" % (
+                    self.path, error
+                )
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
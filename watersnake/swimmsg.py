@@ -4,11 +4,14 @@ http://www.cs.cornell.edu/~asdas/research/dsn02-SWIM.pdf ("the paper") """
 # Disable 'Too few public methods'                   pylint: disable=R0903
 # Disable 'has no member'                            pylint: disable=E1101
 
+import struct
+
 import cjson
 
 class SWIMMessage(object):
     """Class for representing SWIM messages"""
-    MESSAGE_NAMES = [u'ping', u'ack', u'ping_req', u'ping_req_ack', u'test']
+    MESSAGE_NAMES = [u'ping', u'ack', u'ping_req', u'ping_req_ack', u'test',
+                     u'join', u'join_ack', u'leave', u'sync', u'sync_ack']
     def __init__(self, message_name, meta_data=None, piggyback_data=None):
         assert message_name in SWIMMessage.MESSAGE_NAMES, (
             'Invalid message name: %s not in %s' % (message_name,
@@ -31,6 +34,19 @@ class SWIMMessage(object):
         return (self.equals_ignoring_piggyback_data(other) and
                 self.piggyback_data == other.piggyback_data)
 
+    @property
+    def piggyback_digest(self):
+        """The digest of the sender's view of the group carried in our
+        piggyback data (None if there isn't one)"""
+        if not self.piggyback_data:
+            return None
+        return self.piggyback_data.get(u"digest")
+
+    @property
+    def has_piggyback_data(self):
+        """Is there any piggyback data?"""
+        return bool(self.piggyback_data)
+
     def equals_ignoring_piggyback_data(self, other):
         """Is this message the  as 'other', if we ignore piggyback data? """
         return (isinstance(other, SWIMMessage) and
@@ -38,6 +54,30 @@ class SWIMMessage(object):
                 self.meta_data == other.meta_data)
 
 
+class PiggybackData(dict):
+    """Piggyback data which a member sends on many messages (see
+    Membership.get_piggyback_data_to_send()), and so mustn't be modified.
+    Each serialiser caches its encoding in 'encodings' (by serialiser), so
+    that it's only encoded once however many messages carry it."""
+    __slots__ = ("encodings",)
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.encodings = {}
+
+
+def _encode_once(piggyback_data, serialiser, encode):
+    """encode(piggyback_data), cached in piggyback_data for serialiser if
+    it's PiggybackData"""
+    encodings = getattr(piggyback_data, "encodings", None)
+    if encodings is None:
+        return encode(piggyback_data)
+    encoded = encodings.get(serialiser)
+    if encoded is None:
+        encoded = encodings[serialiser] = encode(piggyback_data)
+    return encoded
+
+
 class SWIMDeserialisationException(Exception):
     """Exception class raised when a SWIM message cannot be constructed from
     a buffer received from the wire"""
@@ -47,22 +87,34 @@ class SWIMDeserialisationException(Exception):
 class SWIMJSONMessageSerialiser(object):
     """A class capable of serialising / deserialising SWIMMessages using
     the JSON format"""
+    _MESSAGE_FORMAT = (
+        '{"message_name": %s, "meta_data": %s, "piggyback_data": %s}'
+    )
+
     @staticmethod
     def to_buffer(swim_message):
         """Serialises the swim_message object to a form suitable for sending
-        on the wire"""
-        message_as_dict = {
-            u"message_name" : swim_message.message_name,
-            u"meta_data" : swim_message.meta_data,
-            u"piggyback_data" : swim_message.piggyback_data
-        }
-        return cjson.encode(message_as_dict)
+        on the wire (encoding PiggybackData only once)"""
+        cls = SWIMJSONMessageSerialiser
+        piggyback_data = swim_message.piggyback_data
+        if piggyback_data is None:
+            encoded_piggyback = "null"
+        else:
+            encoded_piggyback = _encode_once(piggyback_data, cls,
+                                             cjson.encode)
+        return cls._MESSAGE_FORMAT % (
+            cjson.encode(swim_message.message_name),
+            cjson.encode(swim_message.meta_data),
+            encoded_piggyback
+        )
 
     @staticmethod
     def from_buffer(buff):
         """Parses buffer and deserialises the swim_message object and returns
         it if possible;  raises a SWIMDeserialisationException otherwise."""
         try:
+            if isinstance(buff, memoryview):
+                buff = buff.tobytes()
             message_as_dict = cjson.decode(buff)
             return SWIMMessage(message_name=message_as_dict["message_name"],
                                meta_data=message_as_dict["meta_data"],
@@ -71,6 +123,543 @@ class SWIMJSONMessageSerialiser(object):
             raise SWIMDeserialisationException()
 
 
+def _message_from_wire(message_name, meta_data, piggyback_data):
+    """Construct a SWIMMessage from fields which have already been validated
+    by a deserialiser (skipping the SWIMMessage constructor checks)"""
+    message = SWIMMessage.__new__(SWIMMessage)
+    message.message_name = message_name
+    message.meta_data = meta_data
+    message.piggyback_data = piggyback_data
+    return message
+
+
+def _encode_varint(value, out):
+    """Append the unsigned LEB128 encoding of value to bytearray 'out'"""
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_varint(buff, offset):
+    """Decode an unsigned LEB128 value from bytearray 'buff' at offset;
+    returns (value, new_offset)"""
+    value = 0
+    shift = 0
+    while True:
+        byte = buff[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _encode_bytes(value, out):
+    """Append a length-prefixed byte string to bytearray 'out'"""
+    _encode_varint(len(value), out)
+    out.extend(value)
+
+
+def _decode_bytes(buff, offset):
+    """Decode a length-prefixed byte string; returns (value, new_offset)"""
+    length, offset = _decode_varint(buff, offset)
+    end = offset + length
+    if end > len(buff):
+        raise ValueError("Truncated buffer")
+    return str(buff[offset:end]), end
+
+
+def _encode_member_ids(member_ids):
+    """Encode a member id table (each id as varint length + utf-8 bytes,
+    without the leading count)"""
+    out = bytearray()
+    for member_id in member_ids:
+        if isinstance(member_id, unicode):
+            member_id = member_id.encode("utf-8")
+        if len(member_id) < 0x80:
+            out.append(len(member_id))
+            out.extend(member_id)
+        else:
+            _encode_bytes(member_id, out)
+    return str(out)
+
+
+_MEMBER_ID_TYPES = frozenset([str, unicode])
+_INCARNATION_TYPES = frozenset([int, long])
+
+
+def _is_piggyback_section(entries):
+    """Can 'entries' be encoded as a compact list of (member_id, incarnation)
+    pairs?"""
+    if not isinstance(entries, (list, tuple)):
+        return False
+    try:
+        for member_id, incarnation in entries:
+            if (type(member_id) not in _MEMBER_ID_TYPES or
+                    type(incarnation) not in _INCARNATION_TYPES or
+                    incarnation < 0):
+                return False
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+class SWIMBinaryMessageSerialiser(object):
+    """A class capable of serialising / deserialising SWIMMessages using
+    a compact binary format:
+
+        magic (1 byte), version (1 byte), message type (1 byte), flags (1 byte)
+        member id table: varint count, then varint length + utf-8 bytes per id
+        meta data (if flagged): varint id indices of requested_by_member_id
+            and member_id_to_ping, or length-prefixed JSON for anything else
+        piggyback data (if flagged): varint section count, then per section a
+            state code byte, varint entry count and (varint id index, varint
+            incarnation) pairs; then the 8 byte view digest (if flagged);
+            anything else is length-prefixed JSON
+
+    The leading magic byte can never start a JSON document, so receivers can
+    accept both this and the JSON format while a codec change rolls out (see
+    from_buffer())."""
+    MAGIC = 0xb5
+    VERSION = 1
+    PIGGYBACK_STATES = [u"alive", u"dead", u"left", u"suspect"]
+    META_ID_KEYS = (u"requested_by_member_id", u"member_id_to_ping")
+
+    FLAG_META_IDS = 0x01
+    FLAG_META_JSON = 0x02
+    FLAG_PIGGYBACK = 0x04
+    FLAG_PIGGYBACK_JSON = 0x08
+    FLAG_DIGEST = 0x10
+    _DIGEST = struct.Struct("!Q")
+
+    _MESSAGE_TYPES = dict(
+        (name, code) for code, name in enumerate(SWIMMessage.MESSAGE_NAMES)
+    )
+    _STATE_CODES = dict(
+        (name, code) for code, name in enumerate(PIGGYBACK_STATES)
+    )
+
+    @staticmethod
+    def _encode_piggyback(piggyback_data):
+        """Returns (flags, member id indices, encoded member id table, body)
+        for the piggyback part of a message"""
+        cls = SWIMBinaryMessageSerialiser
+        member_ids = []
+        member_indices = {}
+        sections = []
+        extra = {}
+        digest = None
+        for key, entries in piggyback_data.iteritems():
+            if (key in cls._STATE_CODES and
+                    _is_piggyback_section(entries)):
+                sections.append((cls._STATE_CODES[key], entries))
+            elif (key == u"digest" and
+                  type(entries) in _INCARNATION_TYPES and
+                  0 <= entries < 2 ** 64):
+                digest = entries
+            else:
+                extra[key] = entries
+        flags = cls.FLAG_PIGGYBACK
+        body = bytearray()
+        _encode_varint(len(sections), body)
+        for state_code, entries in sections:
+            body.append(state_code)
+            _encode_varint(len(entries), body)
+            for member_id, incarnation in entries:
+                # Inlined single byte varint fast paths (the common case)
+                index = member_indices.get(member_id)
+                if index is None:
+                    index = member_indices[member_id] = len(member_ids)
+                    member_ids.append(member_id)
+                if index < 0x80:
+                    body.append(index)
+                else:
+                    _encode_varint(index, body)
+                if incarnation < 0x80:
+                    body.append(incarnation)
+                else:
+                    _encode_varint(incarnation, body)
+        if digest is not None:
+            flags |= cls.FLAG_DIGEST
+            body.extend(cls._DIGEST.pack(digest))
+        if extra:
+            flags |= cls.FLAG_PIGGYBACK_JSON
+            _encode_bytes(cjson.encode(extra), body)
+        return flags, member_indices, _encode_member_ids(member_ids), body
+
+    @staticmethod
+    def to_buffer(swim_message):
+        """Serialises the swim_message object to a form suitable for sending
+        on the wire. The piggyback data's member ids come first in the member
+        id table, so that the encoding of PiggybackData can be reused for
+        every message carrying it."""
+        cls = SWIMBinaryMessageSerialiser
+        piggyback_data = swim_message.piggyback_data
+        if piggyback_data is None:
+            flags = 0
+            member_indices = {}
+            member_id_table = piggyback_body = ""
+        else:
+            flags, member_indices, member_id_table, piggyback_body = (
+                _encode_once(piggyback_data, cls, cls._encode_piggyback)
+            )
+        extra_ids = []
+
+        def index_of(member_id):
+            """Index of member_id in the member id table"""
+            index = member_indices.get(member_id)
+            if index is None:
+                if member_id in extra_ids:
+                    return len(member_indices) + extra_ids.index(member_id)
+                index = len(member_indices) + len(extra_ids)
+                extra_ids.append(member_id)
+            return index
+
+        meta_body = bytearray()
+        meta_data = swim_message.meta_data
+        if meta_data is not None:
+            if (len(meta_data) == 2 and
+                    all(isinstance(meta_data.get(key), basestring)
+                        for key in cls.META_ID_KEYS)):
+                flags |= cls.FLAG_META_IDS
+                for key in cls.META_ID_KEYS:
+                    _encode_varint(index_of(meta_data[key]), meta_body)
+            else:
+                flags |= cls.FLAG_META_JSON
+                _encode_bytes(cjson.encode(meta_data), meta_body)
+
+        buff = bytearray((
+            cls.MAGIC,
+            cls.VERSION,
+            cls._MESSAGE_TYPES[swim_message.message_name],
+            flags
+        ))
+        _encode_varint(len(member_indices) + len(extra_ids), buff)
+        buff.extend(member_id_table)
+        buff.extend(_encode_member_ids(extra_ids))
+        buff.extend(meta_body)
+        buff.extend(piggyback_body)
+        return str(buff)
+
+    @staticmethod
+    def _member_id_at(buff, offset, index):
+        """Decode the member id at index in the member id table starting at
+        offset"""
+        for _ in xrange(index + 1):
+            length = buff[offset]
+            if length < 0x80:
+                offset += 1
+            else:
+                length, offset = _decode_varint(buff, offset)
+            start, offset = offset, offset + length
+        return buff[start:offset].decode("utf-8")
+
+    @staticmethod
+    def from_buffer(buff):
+        """Parses buffer (a str, bytearray or memoryview) and deserialises
+        the swim_message object and returns it if possible;  raises a
+        SWIMDeserialisationException otherwise.
+
+        The structure of the whole buffer is validated, but the piggyback
+        data (apart from its digest) is only decoded if and when it's
+        accessed (see _BinarySWIMMessage)."""
+        cls = SWIMBinaryMessageSerialiser
+        try:
+            buff = bytearray(buff)
+            if buff[0] != cls.MAGIC or buff[1] != cls.VERSION:
+                raise ValueError("Unsupported format/version")
+            message_name = SWIMMessage.MESSAGE_NAMES[buff[2]]
+            flags = buff[3]
+            n_member_ids, offset = _decode_varint(buff, 4)
+            member_ids_offset = offset
+            for _ in xrange(n_member_ids):
+                length = buff[offset]
+                if length < 0x80:
+                    offset += 1
+                else:
+                    length, offset = _decode_varint(buff, offset)
+                offset += length
+            if offset > len(buff):
+                raise ValueError("Truncated buffer")
+
+            meta_data = None
+            if flags & cls.FLAG_META_IDS:
+                meta_data = {}
+                for key in cls.META_ID_KEYS:
+                    index, offset = _decode_varint(buff, offset)
+                    if index >= n_member_ids:
+                        raise ValueError("Bad member id index")
+                    meta_data[key] = cls._member_id_at(
+                        buff, member_ids_offset, index
+                    )
+            elif flags & cls.FLAG_META_JSON:
+                encoded, offset = _decode_bytes(buff, offset)
+                meta_data = cjson.decode(encoded)
+                if not isinstance(meta_data, dict):
+                    raise ValueError("Bad meta data")
+
+            if not flags & cls.FLAG_PIGGYBACK:
+                if offset != len(buff):
+                    raise ValueError("Trailing bytes")
+                return _message_from_wire(message_name, meta_data, None)
+
+            # Skip over (but check) the piggyback sections
+            piggyback_offset = offset
+            n_sections, offset = _decode_varint(buff, offset)
+            for _ in xrange(n_sections):
+                if buff[offset] >= len(cls.PIGGYBACK_STATES):
+                    raise ValueError("Bad state")
+                n_entries, offset = _decode_varint(buff, offset + 1)
+                for _ in xrange(n_entries):
+                    # Inlined single byte varint fast paths
+                    index = buff[offset]
+                    if index < 0x80:
+                        offset += 1
+                    else:
+                        index, offset = _decode_varint(buff, offset)
+                    if index >= n_member_ids:
+                        raise ValueError("Bad member id index")
+                    if buff[offset] < 0x80:
+                        offset += 1
+                    else:
+                        _, offset = _decode_varint(buff, offset)
+            digest = None
+            if flags & cls.FLAG_DIGEST:
+                digest = cls._DIGEST.unpack_from(buff, offset)[0]
+                offset += cls._DIGEST.size
+            if flags & cls.FLAG_PIGGYBACK_JSON:
+                length, offset = _decode_varint(buff, offset)
+                offset += length
+            if offset != len(buff):
+                raise ValueError("Trailing bytes")
+            message = _BinarySWIMMessage.__new__(_BinarySWIMMessage)
+            message.message_name = message_name
+            message.meta_data = meta_data
+            message._piggyback_data = None
+            message._undecoded = (buff, member_ids_offset, n_member_ids,
+                                  piggyback_offset, flags)
+            message._digest = digest
+            message._has_piggyback_data = bool(
+                n_sections or flags & (cls.FLAG_DIGEST |
+                                       cls.FLAG_PIGGYBACK_JSON)
+            )
+            return message
+        except Exception as _:
+            raise SWIMDeserialisationException()
+
+    @staticmethod
+    def _decode_piggyback(buff, member_ids_offset, n_member_ids, offset,
+                          flags):
+        """Decode the piggyback data of a message which from_buffer() has
+        already validated the structure of"""
+        cls = SWIMBinaryMessageSerialiser
+        member_ids = []
+        ids_offset = member_ids_offset
+        for _ in xrange(n_member_ids):
+            length = buff[ids_offset]
+            if length < 0x80:
+                ids_offset += 1
+            else:
+                length, ids_offset = _decode_varint(buff, ids_offset)
+            end = ids_offset + length
+            member_ids.append(buff[ids_offset:end].decode("utf-8"))
+            ids_offset = end
+
+        piggyback_data = {}
+        n_sections, offset = _decode_varint(buff, offset)
+        for _ in xrange(n_sections):
+            state = cls.PIGGYBACK_STATES[buff[offset]]
+            n_entries, offset = _decode_varint(buff, offset + 1)
+            entries = []
+            for _ in xrange(n_entries):
+                # Inlined single byte varint fast paths
+                index = buff[offset]
+                if index < 0x80:
+                    offset += 1
+                else:
+                    index, offset = _decode_varint(buff, offset)
+                incarnation = buff[offset]
+                if incarnation < 0x80:
+                    offset += 1
+                else:
+                    incarnation, offset = _decode_varint(buff, offset)
+                entries.append([member_ids[index], incarnation])
+            piggyback_data[state] = entries
+        if flags & cls.FLAG_DIGEST:
+            piggyback_data[u"digest"] = cls._DIGEST.unpack_from(
+                buff, offset
+            )[0]
+            offset += cls._DIGEST.size
+        if flags & cls.FLAG_PIGGYBACK_JSON:
+            encoded, offset = _decode_bytes(buff, offset)
+            extra = cjson.decode(encoded)
+            if not isinstance(extra, dict):
+                raise ValueError("Bad piggyback data")
+            piggyback_data.update(extra)
+        return piggyback_data
+
+
+class _BinarySWIMMessage(SWIMMessage):
+    """ A SWIMMessage deserialised by SWIMBinaryMessageSerialiser, which
+    holds on to (a copy of) its buffer and only decodes its piggyback data
+    when it's first accessed: a receiver whose view already matches the
+    sender's (see piggyback_digest) need never decode it. Piggyback data
+    which turns out to be undecodable (e.g. invalid utf-8 in a member id)
+    is treated as empty. """
+    def _get_piggyback_data(self):
+        """Decode the piggyback data, if we haven't already"""
+        if self._undecoded is not None:
+            try:
+                self._piggyback_data = (
+                    SWIMBinaryMessageSerialiser._decode_piggyback(
+                        *self._undecoded
+                    )
+                )
+            except Exception as _:
+                self._piggyback_data = {}
+            self._undecoded = None
+        return self._piggyback_data
+
+    def _set_piggyback_data(self, piggyback_data):
+        """Replace the piggyback data"""
+        self._undecoded = None
+        self._piggyback_data = piggyback_data
+
+    piggyback_data = property(_get_piggyback_data, _set_piggyback_data)
+
+    @property
+    def piggyback_digest(self):
+        if self._undecoded is not None:
+            return self._digest
+        return SWIMMessage.piggyback_digest.fget(self)
+
+    @property
+    def has_piggyback_data(self):
+        if self._undecoded is not None:
+            return self._has_piggyback_data
+        return SWIMMessage.has_piggyback_data.fget(self)
+
+
+# First byte of a buffer holding several serialised messages (for a single
+# recipient); like SWIMBinaryMessageSerialiser.MAGIC, it can't start JSON
+COMPOUND_MAGIC = 0xb6
+_COMPOUND_PREFIX = chr(COMPOUND_MAGIC)
+_BINARY_PREFIX = chr(SWIMBinaryMessageSerialiser.MAGIC)
+
+
+def _varint_size(value):
+    """Number of bytes in the LEB128 encoding of value"""
+    size = 1
+    while value > 0x7f:
+        value >>= 7
+        size += 1
+    return size
+
+
+def compound_entry_size(buff):
+    """Bytes that including serialised message buff in a compound buffer
+    costs"""
+    return _varint_size(len(buff)) + len(buff)
+
+
+def to_compound_buffer(buffers):
+    """Packs several serialised messages into one buffer:
+    magic (1 byte), varint count, then each as varint length + bytes"""
+    out = bytearray((COMPOUND_MAGIC,))
+    _encode_varint(len(buffers), out)
+    for buff in buffers:
+        _encode_bytes(buff, out)
+    return str(out)
+
+
+def is_compound(buff):
+    """Was buff produced by to_compound_buffer()?"""
+    return buff[:1] == _COMPOUND_PREFIX
+
+
+def _decode_view_varint(view, offset):
+    """Decode an unsigned LEB128 value from memoryview 'view' at offset;
+    returns (value, new_offset)"""
+    value = 0
+    shift = 0
+    while True:
+        byte = ord(view[offset])
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def split_compound_buffer(buff):
+    """Returns the list of serialised messages packed into buff by
+    to_compound_buffer(), as memoryviews of buff (so nothing is copied);
+    raises a SWIMDeserialisationException if this isn't possible."""
+    try:
+        view = memoryview(buff)
+        if view[:1] != _COMPOUND_PREFIX:
+            raise ValueError("Not a compound buffer")
+        count, offset = _decode_view_varint(view, 1)
+        buffers = []
+        for _ in xrange(count):
+            length, offset = _decode_view_varint(view, offset)
+            end = offset + length
+            if end > len(view):
+                raise ValueError("Truncated buffer")
+            buffers.append(view[offset:end])
+            offset = end
+        if offset != len(view):
+            raise ValueError("Trailing bytes")
+        return buffers
+    except Exception as _:
+        raise SWIMDeserialisationException()
+
+
+def merge_piggyback_data(piggyback_datas):
+    """Combines the piggyback data of several messages into one, so that
+    messages sent together need only carry it once: each (state, member id)
+    appears once, with the highest incarnation seen; the digest (and
+    anything else) is taken from the last of them. The result is
+    PiggybackData, so it's only encoded once; if they're all the same object
+    (as when a member's messages from one tick share it) it's returned as
+    is, with any encodings already cached."""
+    distinct = []
+    for piggyback_data in piggyback_datas:
+        if not any(piggyback_data is seen for seen in distinct):
+            distinct.append(piggyback_data)
+    if len(distinct) == 1 and isinstance(distinct[0], PiggybackData):
+        return distinct[0]
+    merged = PiggybackData()
+    for piggyback_data in distinct:
+        for key, value in piggyback_data.iteritems():
+            if isinstance(value, list) and isinstance(merged.get(key), list):
+                merged[key] = merged[key] + value
+            else:
+                merged[key] = value
+    for key, entries in merged.iteritems():
+        if key == u"digest" or not isinstance(entries, list):
+            continue
+        incarnations = {}
+        for member_id, incarnation in entries:
+            if incarnation >= incarnations.get(member_id, incarnation):
+                incarnations[member_id] = incarnation
+        if len(incarnations) < len(entries):
+            merged[key] = [[member_id, incarnation] for member_id, incarnation
+                           in incarnations.iteritems()]
+    return merged
+
+
+def from_buffer(buff):
+    """Deserialises a buffer produced by any of the supported serialisers,
+    so that members can be migrated from one wire format to another without
+    a flag day; raises a SWIMDeserialisationException if this isn't
+    possible."""
+    if buff[:1] == _BINARY_PREFIX:
+        return SWIMBinaryMessageSerialiser.from_buffer(buff)
+    return SWIMJSONMessageSerialiser.from_buffer(buff)
+
+
 def ping(meta_data=None, piggyback_data=None):
     """ Factory function to create a ping SWIM message """
     return SWIMMessage(message_name="ping",
@@ -115,3 +704,41 @@ def ping_req_ack(
     return SWIMMessage(message_name="ping_req_ack",
                        meta_data=meta_data,
                        piggyback_data=piggyback_data)
+
+
+def join(incarnation, piggyback_data=None):
+    """ Factory function to create a join SWIM message """
+    return SWIMMessage(message_name="join",
+                       meta_data={"incarnation" : incarnation},
+                       piggyback_data=piggyback_data)
+
+
+def join_ack(members, piggyback_data=None):
+    """ Factory function to create a join_ack SWIM message carrying
+    the sender's view of the group ({state: [[member_id, incarnation]]}) """
+    return SWIMMessage(message_name="join_ack",
+                       meta_data={"members" : members},
+                       piggyback_data=piggyback_data)
+
+
+def leave(incarnation, piggyback_data=None):
+    """ Factory function to create a leave SWIM message """
+    return SWIMMessage(message_name="leave",
+                       meta_data={"incarnation" : incarnation},
+                       piggyback_data=piggyback_data)
+
+
+def sync(members, piggyback_data=None):
+    """ Factory function to create a (push-pull) sync SWIM message carrying
+    the sender's view of the group ({state: [[member_id, incarnation]]}) """
+    return SWIMMessage(message_name="sync",
+                       meta_data={"members" : members},
+                       piggyback_data=piggyback_data)
+
+
+def sync_ack(members, piggyback_data=None):
+    """ Factory function to create a (push-pull) sync_ack SWIM message
+    carrying the sender's view of the group """
+    return SWIMMessage(message_name="sync_ack",
+                       meta_data={"members" : members},
+                       piggyback_data=piggyback_data)
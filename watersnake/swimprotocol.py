@@ -8,3 +8,4 @@ class SWIM(object):
     the paper."""
     T = 2.0  # SWIM protocol period (in seconds)
     K = 3   # SWIM protocol failure detection subgroup size
+    LAMBDA = 3  # SWIM dissemination retransmit multiplier (lambda*log(n))
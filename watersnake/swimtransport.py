@@ -1,17 +1,83 @@
 """ Implementation of a protocol based ont SWIM protocol described in
 http://www.cs.cornell.edu/~asdas/research/dsn02-SWIM.pdf ("the paper") """
+import collections
+import copy
+import timeit
+import watersnake.metrics as metrics
 import watersnake.swimmsg as swimmsg
 
+# Largest frame (in bytes) that coalesced messages are packed into; leaves
+# room for transport framing within a typical 1500 byte MTU
+DEFAULT_COALESCE_BUDGET_BYTES = 1200
+
+# Compound frame magic byte plus (up to) a two byte varint message count
+_COMPOUND_HEADER_BYTES = 3
+
 
 class MessageTransport(object):
     """Abstract base class for real "MessageTransport" classes capable of
-    sending and receiving messages using the network """
-    def __init__(self):
+    sending and receiving messages using the network.
+
+    Outgoing messages are encoded by 'serialiser' (one of the
+    swimmsg serialiser classes); incoming messages may be in any format
+    swimmsg understands. """
+    # Should a MessageRouter hand messages for members registered with it
+    # straight to them, rather than serialising and sending them?
+    deliver_locally = False
+
+    def __init__(self, serialiser=swimmsg.SWIMJSONMessageSerialiser):
+        self.serialiser = serialiser
         self.message_router = None
         self.sent_messages = 0
         self.received_messages = 0
         self.sent_bytes = 0
         self.received_bytes = 0
+        self.sent_frames = 0
+        self.metrics = None
+        self.coalesce_budget_bytes = None
+        self._outbox = collections.OrderedDict()
+
+    def enable_metrics(self, registry):
+        """Start recording per message type counts, sizes and encode/decode
+        times in registry, a metrics.MetricsRegistry"""
+        self.metrics = registry
+        self._messages_sent = registry.counter(
+            "messages_sent_total", "Messages sent", ("type",)
+        )
+        self._bytes_sent = registry.counter(
+            "message_bytes_sent_total", "Bytes of messages sent", ("type",)
+        )
+        self._messages_received = registry.counter(
+            "messages_received_total", "Messages received", ("type",)
+        )
+        self._bytes_received = registry.counter(
+            "message_bytes_received_total",
+            "Bytes of messages received",
+            ("type",)
+        )
+        self._encode_seconds = registry.histogram(
+            "encode_seconds",
+            "Time taken to serialise outgoing messages",
+            metrics.LATENCY_BUCKETS,
+            ("type",)
+        )
+        self._decode_seconds = registry.histogram(
+            "decode_seconds",
+            "Time taken to deserialise incoming messages",
+            metrics.LATENCY_BUCKETS,
+            ("type",)
+        )
+
+    def enable_coalescing(
+            self,
+            budget_bytes=DEFAULT_COALESCE_BUDGET_BYTES
+        ):
+        """Rather than sending each message as it's sent, queue messages up
+        until flush() and then send those for the same recipient together,
+        carrying their piggyback data once, in compound frames of up to
+        budget_bytes. Derived classes arrange for flush() to be called
+        soon after a message is queued (see schedule_flush())."""
+        self.coalesce_budget_bytes = budget_bytes
 
     def register_message_router(self, message_router):
         """Hook transport up to the message router object so we can deliver
@@ -21,9 +87,87 @@ class MessageTransport(object):
     def send_message_to(self, address, message, from_sender):
         """Send message to the member identified by address"""
         self.sent_messages += 1
-        serialised_buff = swimmsg.SWIMJSONMessageSerialiser.to_buffer(message)
-        self.sent_bytes = self.sent_bytes + len(serialised_buff)
-        self.send_message_impl(address, serialised_buff, from_sender)
+        if self.coalesce_budget_bytes is not None:
+            # Queue a copy: the sender may send the same message object to
+            # other recipients (with different piggyback data) before we
+            # flush, and we merge the piggyback data of queued messages
+            message = copy.copy(message)
+            queued = self._outbox.get((address, from_sender))
+            if queued is not None:
+                queued.append(message)
+                return
+            if not self._outbox:
+                self.schedule_flush()
+            self._outbox[(address, from_sender)] = [message]
+            return
+        self._send_frame(address, [self._serialise(message)], from_sender)
+
+    def _serialise(self, message):
+        """Serialise an outgoing message"""
+        if self.metrics is None:
+            serialised_buff = self.serialiser.to_buffer(message)
+        else:
+            started = timeit.default_timer()
+            serialised_buff = self.serialiser.to_buffer(message)
+            self._record(
+                message.message_name,
+                len(serialised_buff),
+                timeit.default_timer() - started,
+                self._messages_sent,
+                self._bytes_sent,
+                self._encode_seconds
+            )
+        return serialised_buff
+
+    def _send_frame(self, address, serialised_buffs, from_sender):
+        """Send one or more serialised messages as a single frame"""
+        if len(serialised_buffs) == 1:
+            frame = serialised_buffs[0]
+        else:
+            frame = swimmsg.to_compound_buffer(serialised_buffs)
+        self.sent_frames += 1
+        self.sent_bytes = self.sent_bytes + len(frame)
+        self.send_message_impl(address, frame, from_sender)
+
+    def schedule_flush(self):
+        """A message has been queued while coalescing; derived classes
+        should arrange for flush() to be called soon (the caller must
+        otherwise call it)"""
+
+    def flush(self):
+        """Send every message queued while coalescing (including any queued
+        in the meantime, e.g. replies from in-process recipients, which
+        join any still queued for the same recipient)"""
+        outbox = self._outbox
+        while outbox:
+            (address, from_sender), messages = outbox.popitem(last=False)
+            self._send_coalesced(address, messages, from_sender)
+
+    def _send_coalesced(self, address, messages, from_sender):
+        """Send messages (our own copies of those queued for address) in as
+        few frames as the budget allows, with their piggyback data merged
+        into the first of them"""
+        if len(messages) > 1:
+            piggyback_data = swimmsg.merge_piggyback_data([
+                message.piggyback_data for message in messages
+                if message.piggyback_data
+            ])
+            for message in messages:
+                message.piggyback_data = None
+            messages[0].piggyback_data = piggyback_data or None
+        budget_bytes = self.coalesce_budget_bytes
+        frame = []
+        frame_bytes = _COMPOUND_HEADER_BYTES
+        for message in messages:
+            serialised_buff = self._serialise(message)
+            entry_bytes = swimmsg.compound_entry_size(serialised_buff)
+            if frame and frame_bytes + entry_bytes > budget_bytes:
+                self._send_frame(address, frame, from_sender)
+                frame = []
+                frame_bytes = _COMPOUND_HEADER_BYTES
+            frame.append(serialised_buff)
+            frame_bytes += entry_bytes
+        self._send_frame(address, frame, from_sender)
 
     def send_message_impl(self, address, message, from_sender):
         """Takes care of the nuts and bolts of message transmission"""
@@ -32,19 +176,52 @@ class MessageTransport(object):
     def on_incoming_message(self, address, message, from_sender):
         """We've received a message off the wire and need to route it to any
         local objects that may be interested in this message. """
-        self.received_messages += 1
         self.received_bytes = self.received_bytes + len(message)
-        message = swimmsg.SWIMJSONMessageSerialiser.from_buffer(message)
-        self.message_router.on_incoming_message(address, message, from_sender)
+        if swimmsg.is_compound(message):
+            for serialised_buff in swimmsg.split_compound_buffer(message):
+                self._route_incoming(address, serialised_buff, from_sender)
+        else:
+            self._route_incoming(address, message, from_sender)
         # Derived class should hook this up to a socket
 
+    def _route_incoming(self, address, message, from_sender):
+        """Deserialise a single incoming message and route it"""
+        self.received_messages += 1
+        if self.metrics is None:
+            message = swimmsg.from_buffer(message)
+        else:
+            started = timeit.default_timer()
+            size = len(message)
+            message = swimmsg.from_buffer(message)
+            self._record(
+                message.message_name,
+                size,
+                timeit.default_timer() - started,
+                self._messages_received,
+                self._bytes_received,
+                self._decode_seconds
+            )
+        self.message_router.on_incoming_message(address, message, from_sender)
+
+    @staticmethod
+    def _record(message_name, size, seconds, messages, size_bytes, timing):
+        """Record a message sent or received (only called with metrics
+        enabled)"""
+        messages.labels(message_name).inc()
+        size_bytes.labels(message_name).inc(size)
+        timing.labels(message_name).observe(seconds)
+
 
 class LoopbackMessageTransport(MessageTransport):
     """ This is a specialization of MessageTransport that can only transport
      messages to other local objects (i.e. can't use a real network).
     Intended for unit testing or modeling use; not production use. """
-    def __init__(self, record_messages=False):
-        MessageTransport.__init__(self)
+    def __init__(
+            self,
+            record_messages=False,
+            serialiser=swimmsg.SWIMJSONMessageSerialiser
+        ):
+        MessageTransport.__init__(self, serialiser)
         self._blocked_routes = []
         self.record_messages = record_messages
         self.messages_sent = {}
@@ -55,6 +232,10 @@ class LoopbackMessageTransport(MessageTransport):
         dropped. """
         self._blocked_routes.append((from_address, to_address))
 
+    def heal_partition_between(self, from_address, to_address):
+        """ Undoes simulate_partition_between(from_address, to_address) """
+        self._blocked_routes.remove((from_address, to_address))
+
     def send_message_impl(self, address, message, from_sender):
         """For LoopbackMessageTransport all reachable entities are local
         in-process objects, so sending a message can just be treated
@@ -105,6 +286,7 @@ class MessageRouter(object):
         self.transport = message_transport
         self.transport.register_message_router(self)
         self.members = {}
+        self.local_messages = 0
 
     def register_for_messages(self, member_id, member):
         """ The object 'member' wishes to receive all messages sent
@@ -117,7 +299,14 @@ class MessageRouter(object):
 
     def send_message_to(self, recipient_member_id, message, from_sender):
         """ Send  'message' (from 'from_sender') to the recipient identifed by
-        'recipient_member_id'"""
+        'recipient_member_id' (handing it straight to the recipient if it's
+        registered with us and the transport allows it)"""
+        if self.transport.deliver_locally:
+            member = self.members.get(recipient_member_id)
+            if member is not None:
+                self.local_messages += 1
+                member.on_incoming_message(message, from_sender)
+                return
         self.transport.send_message_to(
             recipient_member_id,
             message,
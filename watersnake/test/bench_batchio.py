@@ -0,0 +1,92 @@
+""" Benchmark of the cost of sending and receiving datagrams on localhost,
+one system call per datagram compared with batches of them (with sendmmsg
+and recvmmsg). One socket sends a datagram to each of a few hundred peers'
+sockets, and then receives one from each of them. """
+
+import socket
+import timeit
+
+import watersnake.batchio as batchio
+import watersnake.swimmsg as swimmsg
+import watersnake.udptransport as udptransport
+
+import bench_swimmsg
+
+
+def _socket():
+    """A non-blocking UDP socket bound to localhost"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    sock.bind(("127.0.0.1", 0))
+    sock.setblocking(False)
+    return sock
+
+
+def _drain(sock):
+    """Discard every datagram waiting on sock"""
+    while True:
+        try:
+            sock.recv(65536)
+        except socket.error:
+            return
+
+
+def bench_batchio(n_peers=300, rounds=20):
+    """Returns {"sendto"/"mmsg": {send_us, receive_us, send_syscalls,
+    receive_syscalls}}, all per datagram"""
+    datagram = udptransport.encode_frame(
+        "10.0.0.1:7946",
+        "10.0.0.2:7946",
+        swimmsg.SWIMBinaryMessageSerialiser.to_buffer(
+            bench_swimmsg.typical_message(10)
+        )
+    )
+    results = {}
+    modes = [("sendto", False)]
+    if batchio.HAVE_MMSG:
+        modes.append(("mmsg", True))
+    for name, use_mmsg in modes:
+        node = _socket()
+        peers = [_socket() for _ in xrange(n_peers)]
+        sender = batchio.DatagramBatchSender(node, use_mmsg)
+        receiver = batchio.DatagramBatchReceiver(node, 8192, use_mmsg)
+        peer_senders = [batchio.DatagramBatchSender(peer) for peer in peers]
+        outgoing = [(datagram, peer.getsockname()) for peer in peers]
+        send_seconds = receive_seconds = 0.0
+        for _ in xrange(rounds):
+            send_seconds += timeit.timeit(lambda: sender.send(outgoing),
+                                          number=1)
+            for peer, peer_sender in zip(peers, peer_senders):
+                _drain(peer)
+                peer_sender.send([(datagram, node.getsockname())])
+
+            def receive():
+                """Receive every datagram the peers sent us"""
+                received = 0
+                while received < n_peers:
+                    received += len(receiver.receive())
+            receive_seconds += timeit.timeit(receive, number=1)
+        for sock in [node] + peers:
+            sock.close()
+        n_datagrams = float(n_peers * rounds)
+        results[name] = {
+            "send_us": send_seconds * 1e6 / n_datagrams,
+            "receive_us": receive_seconds * 1e6 / n_datagrams,
+            "send_syscalls": sender.syscalls / n_datagrams,
+            "receive_syscalls": receiver.syscalls / n_datagrams,
+        }
+    return results
+
+
+def main():
+    """Print the cost of sending and receiving each datagram"""
+    for name, result in sorted(bench_batchio().items()):
+        print ("%-8s send_us=%.2f receive_us=%.2f send_syscalls=%.3f "
+               "receive_syscalls=%.3f" % (
+                   name, result["send_us"], result["receive_us"],
+                   result["send_syscalls"], result["receive_syscalls"]
+               ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+""" Benchmark of group convergence time over the loopback transport, with
+and without periodic push-pull anti-entropy syncs. """
+
+import random
+
+import watersnake.membership as membership
+import watersnake.swimprotocol as swimprotocol
+import watersnake.swimtransport as swimtransport
+
+
+class LoopbackCluster(object):
+    """A group of members connected by a LoopbackMessageTransport"""
+    def __init__(self, n_members, **membership_kwargs):
+        self.transport = swimtransport.LoopbackMessageTransport()
+        self.router = swimtransport.MessageRouter(self.transport)
+        self.member_ids = ["m%s" % n for n in range(n_members)]
+        self.members = [
+            membership.Membership(
+                member_id,
+                [membership.RemoteMember(x)
+                 for x in self.member_ids if x != member_id],
+                self.router,
+                **membership_kwargs
+            )
+            for member_id in self.member_ids
+        ]
+        self.tick_count = 0
+        for member in self.members:
+            member.start()
+
+    def tick(self):
+        """Advance every member by one protocol period"""
+        self.tick_count += 1
+        for member in self.members:
+            member.tick(self.tick_count * swimprotocol.SWIM.T)
+        self.transport.flush()
+
+    def all_alive(self):
+        """Does every member believe every other member is alive?"""
+        return all(
+            all(remote_member.state == "alive"
+                for remote_member in member.expected_remote_members)
+            for member in self.members
+        )
+
+    def ticks_until_all_alive(self, max_ticks=1000):
+        """Tick until the group has converged; returns the number of ticks"""
+        start_tick = self.tick_count
+        while not self.all_alive() and self.tick_count - start_tick < max_ticks:
+            self.tick()
+        return self.tick_count - start_tick
+
+    def partition(self, side_a, side_b, blocked=True):
+        """Block (or unblock) all traffic between two sets of member ids"""
+        for id_a in side_a:
+            for id_b in side_b:
+                for route in [(id_a, id_b), (id_b, id_a)]:
+                    if blocked:
+                        self.transport.simulate_partition_between(*route)
+                    else:
+                        self.transport.heal_partition_between(*route)
+
+
+def bench_convergence(group_sizes=(20, 50, 100), push_pull_interval=3 * 2.0,
+                      partition_ticks=60, seed=0):
+    """Returns {scenario: {push-pull on/off: {group size: ticks}}} for
+    initial convergence and for reconvergence after a partition heals"""
+    results = {"startup": {}, "partition_heal": {}}
+    for label, interval in [("push_pull", push_pull_interval),
+                            ("no_push_pull", None)]:
+        results["startup"][label] = {}
+        results["partition_heal"][label] = {}
+        for n_members in group_sizes:
+            random.seed(seed)
+            cluster = LoopbackCluster(n_members, push_pull_interval=interval)
+            results["startup"][label][n_members] = \
+                cluster.ticks_until_all_alive()
+            side_a = cluster.member_ids[:n_members / 2]
+            side_b = cluster.member_ids[n_members / 2:]
+            cluster.partition(side_a, side_b)
+            for _ in range(partition_ticks):
+                cluster.tick()
+            cluster.partition(side_a, side_b, blocked=False)
+            results["partition_heal"][label][n_members] = \
+                cluster.ticks_until_all_alive()
+    return results
+
+
+def bench_messages_per_period(group_sizes=(20, 50, 100), periods=20,
+                              coalesce_budget_bytes=None, seed=0):
+    """Returns {group size: {messages, frames, bytes}}: the messages, frames
+    (see MessageTransport.enable_coalescing()) and bytes each member sends
+    per protocol period once the group has converged"""
+    results = {}
+    for n_members in group_sizes:
+        random.seed(seed)
+        cluster = LoopbackCluster(n_members)
+        if coalesce_budget_bytes is not None:
+            cluster.transport.enable_coalescing(coalesce_budget_bytes)
+        cluster.ticks_until_all_alive()
+        sent_messages = cluster.transport.sent_messages
+        sent_frames = cluster.transport.sent_frames
+        sent_bytes = cluster.transport.sent_bytes
+        for _ in range(periods):
+            cluster.tick()
+        member_periods = float(n_members * periods)
+        results[n_members] = {
+            "messages": (cluster.transport.sent_messages - sent_messages) /
+                        member_periods,
+            "frames": (cluster.transport.sent_frames - sent_frames) /
+                      member_periods,
+            "bytes": (cluster.transport.sent_bytes - sent_bytes) /
+                     member_periods,
+        }
+    return results
+
+
+def main():
+    """Print convergence times and steady state load"""
+    for scenario, scenario_results in sorted(bench_convergence().items()):
+        for label, results in sorted(scenario_results.items()):
+            for n_members, ticks in sorted(results.items()):
+                print "%-15s %-13s members=%-5s ticks=%s" % (
+                    scenario, label, n_members, ticks
+                )
+    for label, budget in [
+            ("steady_state", None),
+            ("coalesced", swimtransport.DEFAULT_COALESCE_BUDGET_BYTES),
+        ]:
+        for n_members, result in sorted(
+                bench_messages_per_period(coalesce_budget_bytes=budget).items()
+            ):
+            print "%-15s members=%-5s messages=%.2f frames=%.2f " \
+                "bytes=%.1f" % (label, n_members, result["messages"],
+                                result["frames"], result["bytes"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+""" Benchmark of the cost of handling piggyback data in steady state, when
+the receiver's view of the group already matches the sender's. """
+
+import random
+import timeit
+
+import watersnake.membership as membership
+import watersnake.swimmsg as swimmsg
+import watersnake.swimtransport as swimtransport
+
+
+def converged_membership(n_members, member_id="member-0"):
+    """A Membership which believes all n_members members are alive"""
+    router = swimtransport.MessageRouter(swimtransport.MessageTransport())
+    member_ids = ["member-%s" % n for n in range(n_members)]
+    member = membership.Membership(
+        member_id,
+        [membership.RemoteMember(x) for x in member_ids if x != member_id],
+        router
+    )
+    member.start()
+    member.locally_disseminate(
+        {"alive": [[x, 1] for x in member_ids if x != member_id]}
+    )
+    return member
+
+
+def bench_steady_state_receive(n_members=1000, entries=(0, 20, 50),
+                               number=2000, seed=0):
+    """Returns {with/without digest: {entries: microseconds per message}}
+    for receiving messages whose piggyback data tells us nothing new"""
+    random.seed(seed)
+    receiver = converged_membership(n_members)
+    sender = converged_membership(n_members, "member-1")
+    results = {"digest": {}, "no_digest": {}}
+    for n_entries in entries:
+        piggyback_data = {
+            "alive": [["member-%s" % n, 1]
+                      for n in random.sample(xrange(n_members), n_entries)],
+            "dead": [],
+        }
+        piggyback_data["alive"].append(["member-1", 1])
+        for label, digest in [("digest", sender.view_digest),
+                              ("no_digest", None)]:
+            message = swimmsg.test(
+                piggyback_data=dict(piggyback_data, digest=digest)
+            )
+            elapsed = timeit.timeit(
+                lambda: receiver.on_incoming_message(message, "member-1"),
+                number=number
+            )
+            results[label][n_entries] = elapsed * 1e6 / number
+    return results
+
+
+def bench_piggyback(group_sizes=(100, 1000, 10000), n_entries=20,
+                    number=200, seed=0):
+    """Returns {group size: {build_us, merge_us}}: the microseconds taken
+    by get_piggyback_data_to_send (with every member's liveness still
+    being disseminated) and by locally_disseminate (of n_entries updates
+    which tell us nothing new)"""
+    results = {}
+    for n_members in group_sizes:
+        random.seed(seed)
+        member = converged_membership(n_members)
+        piggyback_data = {
+            "alive": [["member-%s" % n, 1]
+                      for n in random.sample(xrange(1, n_members), n_entries)],
+            "dead": [],
+        }
+        build = timeit.timeit(member.get_piggyback_data_to_send,
+                              number=number)
+        merge = timeit.timeit(
+            lambda: member.locally_disseminate(piggyback_data),
+            number=number
+        )
+        results[n_members] = {
+            "build_us": build * 1e6 / number,
+            "merge_us": merge * 1e6 / number,
+        }
+    return results
+
+
+def main():
+    """Print steady state receive and piggyback handling cost"""
+    for label, results in sorted(bench_steady_state_receive().items()):
+        for n_entries, receive_us in sorted(results.items()):
+            print "%-10s entries=%-4s receive_us=%.1f" % (
+                label, n_entries, receive_us
+            )
+    for n_members, result in sorted(bench_piggyback().items()):
+        print "piggyback  members=%-6s build_us=%.1f merge_us=%.1f" % (
+            n_members, result["build_us"], result["merge_us"]
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+""" Benchmark of the consistent hash ring: lookup throughput, and the cost
+of updating the ring incrementally as members come and go compared with
+rebuilding it from scratch. """
+
+import random
+import timeit
+
+import watersnake.hashring as hashring
+
+
+def bench_hashring(group_sizes=(100, 1000), vnodes=hashring.DEFAULT_VNODES,
+                   number=2000, n_churn=50, seed=0):
+    """Returns {group size: {owner_us, preference_list_us, churn_us,
+    rebuild_us}}: the microseconds per key lookup (and per preference list
+    of 3 owners), per member removed or re-added, and to rebuild the ring
+    from scratch instead"""
+    results = {}
+    for n_members in group_sizes:
+        random.seed(seed)
+        member_ids = ["member-%s" % n for n in range(n_members)]
+        ring = hashring.ConsistentHashRing(vnodes)
+        for member_id in member_ids:
+            ring.add(member_id)
+        keys = ["key-%s" % random.getrandbits(32) for _ in xrange(number)]
+        owner = timeit.timeit(lambda: [ring.owner(key) for key in keys],
+                              number=1)
+        preference_list = timeit.timeit(
+            lambda: [ring.preference_list(key, 3) for key in keys],
+            number=1
+        )
+        churned = random.sample(member_ids, n_churn)
+
+        def churn():
+            """Remove then re-add some members"""
+            for member_id in churned:
+                ring.remove(member_id)
+            for member_id in churned:
+                ring.add(member_id)
+
+        def rebuild():
+            """Build the ring from scratch"""
+            hashring.ConsistentHashRing(vnodes).update(member_ids)
+        results[n_members] = {
+            "owner_us": owner * 1e6 / number,
+            "preference_list_us": preference_list * 1e6 / number,
+            "churn_us": timeit.timeit(churn, number=1) * 1e6 / (2 * n_churn),
+            "rebuild_us": timeit.timeit(rebuild, number=1) * 1e6,
+        }
+    return results
+
+
+def main():
+    """Print the cost of ring lookups and updates"""
+    for n_members, result in sorted(bench_hashring().items()):
+        print ("members=%-6s owner_us=%.2f preference_list_us=%.2f "
+               "churn_us=%.1f rebuild_us=%.0f" % (
+                   n_members, result["owner_us"],
+                   result["preference_list_us"], result["churn_us"],
+                   result["rebuild_us"]
+               ))
+
+
+if __name__ == "__main__":
+    main()
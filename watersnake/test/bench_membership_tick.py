@@ -0,0 +1,155 @@
+""" Benchmark of the cost of Membership.tick(), of choosing members to
+probe, and of querying our view of the group, against group size. """
+
+import random
+import timeit
+
+import watersnake.membership as membership
+import watersnake.swimmsg as swimmsg
+import watersnake.swimprotocol as swimprotocol
+import watersnake.swimtransport as swimtransport
+
+import bench_dissemination
+
+
+class AckingMessageTransport(swimtransport.MessageTransport):
+    """A transport on which every remote member immediately acks every
+    ping (and which discards everything else)"""
+    def send_message_to(self, address, message, from_sender):
+        self.sent_messages += 1
+        if message.message_name == "ping":
+            self.message_router.on_incoming_message(
+                from_sender, swimmsg.ack(), address
+            )
+
+
+def bench_tick(group_sizes=(100, 1000, 10000), n_ticks=500, seed=0):
+    """Returns {scenario: {group size: microseconds per tick}} for a member
+    of a healthy group (all pings acked) and of a group from which it is
+    partitioned (all messages go unanswered)"""
+    results = {}
+    for scenario, transport_class in [
+            ("healthy", AckingMessageTransport),
+            ("partitioned", swimtransport.MessageTransport),
+        ]:
+        results[scenario] = {}
+        for n_members in group_sizes:
+            random.seed(seed)
+            router = swimtransport.MessageRouter(transport_class())
+            member = membership.Membership(
+                "member-0",
+                [membership.RemoteMember("member-%s" % n)
+                 for n in range(1, n_members)],
+                router,
+                enable_infection_dissemination=False
+            )
+            member.start()
+            ticks = iter(xrange(n_ticks))
+            elapsed = timeit.timeit(
+                lambda: member.tick(next(ticks) * swimprotocol.SWIM.T),
+                number=n_ticks
+            )
+            results[scenario][n_members] = elapsed * 1e6 / n_ticks
+    return results
+
+
+def bench_probe_selection(group_sizes=(100, 1000, 10000), number=2000,
+                          seed=0):
+    """Returns {group size: {ping_req_us, rotation_churn_us}}: the
+    microseconds taken to choose ping_req helpers for a member (with a
+    tenth of the group dead), and to remove a member from the ping rotation
+    and insert it again"""
+    results = {}
+    for n_members in group_sizes:
+        random.seed(seed)
+        router = swimtransport.MessageRouter(swimtransport.MessageTransport())
+        member = membership.Membership(
+            "member-0",
+            [membership.RemoteMember("member-%s" % n)
+             for n in range(1, n_members)],
+            router,
+            enable_infection_dissemination=False
+        )
+        member.start()
+        member.tick(0)
+        for remote_member in member.expected_remote_members[::10]:
+            remote_member.state = "dead"
+        targets = [random.choice(member.expected_remote_members)
+                   for _ in xrange(number)]
+        ping_req = timeit.timeit(
+            lambda: [member.select_nodes_to_ping_req(target.remote_member_id)
+                     for target in targets],
+            number=1
+        )
+
+        def churn():
+            """Remove and reinsert each target"""
+            for target in targets:
+                member._remove_from_rotation(target)
+                member._add_to_rotation(target)
+        rotation_churn = timeit.timeit(churn, number=1)
+        results[n_members] = {
+            "ping_req_us": ping_req * 1e6 / number,
+            "rotation_churn_us": rotation_churn * 1e6 / number,
+        }
+    return results
+
+
+def bench_view_queries(group_sizes=(100, 1000, 10000), number=1000):
+    """Returns {group size: {scan_count_us, count_us, snapshot_us,
+    changed_snapshot_us}}: the microseconds taken to count the alive
+    members by scanning them all and with Membership.count(), and to take
+    a snapshot of the view with and without a change since the last one"""
+    results = {}
+    for n_members in group_sizes:
+        member = bench_dissemination.converged_membership(n_members)
+        remote_member = member.expected_remote_members[0]
+        scan = timeit.timeit(
+            lambda: sum(1 for x in member.expected_remote_members
+                        if x.state == "alive"),
+            number=number
+        )
+        count = timeit.timeit(lambda: member.count("alive"), number=number)
+        snapshot = timeit.timeit(member.snapshot, number=number)
+
+        def change_and_snapshot():
+            """Declare a member dead (or alive again), then take a
+            snapshot"""
+            previous_state = remote_member.state
+            remote_member.state = ("alive" if previous_state == "dead"
+                                   else "dead")
+            member.member_updated(remote_member, previous_state)
+            member.snapshot()
+        changed_snapshot = timeit.timeit(change_and_snapshot, number=number)
+        results[n_members] = {
+            "scan_count_us": scan * 1e6 / number,
+            "count_us": count * 1e6 / number,
+            "snapshot_us": snapshot * 1e6 / number,
+            "changed_snapshot_us": changed_snapshot * 1e6 / number,
+        }
+    return results
+
+
+def main():
+    """Print tick and probe selection cost against group size"""
+    for scenario, results in sorted(bench_tick().items()):
+        for n_members, tick_us in sorted(results.items()):
+            print "%-12s members=%-8s tick_us=%.1f" % (
+                scenario, n_members, tick_us
+            )
+    for n_members, result in sorted(bench_probe_selection().items()):
+        print "%-12s members=%-8s ping_req_us=%.1f rotation_churn_us=%.1f" % (
+            "selection", n_members, result["ping_req_us"],
+            result["rotation_churn_us"]
+        )
+    for n_members, result in sorted(bench_view_queries().items()):
+        print ("%-12s members=%-8s scan_count_us=%.1f count_us=%.2f "
+               "snapshot_us=%.2f changed_snapshot_us=%.1f" % (
+                   "view", n_members, result["scan_count_us"],
+                   result["count_us"], result["snapshot_us"],
+                   result["changed_snapshot_us"]
+               ))
+
+
+if __name__ == "__main__":
+    main()
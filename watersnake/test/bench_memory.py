@@ -0,0 +1,69 @@
+""" Benchmark of the memory used by a member's view of the group: the
+resident memory taken up by a Membership (and its RemoteMembers) per
+remote member, for groups of 1k and 10k members. """
+
+import gc
+import resource
+
+import watersnake.membership as membership
+import watersnake.swimtransport as swimtransport
+
+
+def resident_bytes():
+    """Current resident set size of this process (peak resident set size
+    where /proc isn't available)"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except IOError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def bench_memory(group_sizes=(1000, 10000)):
+    """Returns {group size: {stage: bytes per remote member}}, where stage
+    is 'created' (every member's state unknown) or 'converged' (every
+    member alive). Dissemination is disabled, so that transient
+    dissemination buffer entries aren't counted."""
+    results = {}
+    for n_members in group_sizes:
+        member_ids = ["member-%s" % n for n in range(n_members)]
+        gc.collect()
+        before = resident_bytes()
+        router = swimtransport.MessageRouter(
+            swimtransport.LoopbackMessageTransport()
+        )
+        member = membership.Membership(
+            member_ids[0],
+            [membership.RemoteMember(x) for x in member_ids[1:]],
+            router,
+            enable_infection_dissemination=False
+        )
+        member.start()
+        gc.collect()
+        created = resident_bytes()
+        member.locally_disseminate(
+            {"alive": [[x, 1] for x in member_ids[1:]]}
+        )
+        gc.collect()
+        converged = resident_bytes()
+        results[n_members] = {
+            "created": float(created - before) / n_members,
+            "converged": float(converged - before) / n_members,
+        }
+        del member, router
+    return results
+
+
+def main():
+    """Print memory used per remote member"""
+    for n_members, results in sorted(bench_memory().items()):
+        print "members=%-6s created_bytes_per_member=%.0f " \
+              "converged_bytes_per_member=%.0f " \
+              "converged_group_total_mb=%.0f" % (
+                  n_members, results["created"], results["converged"],
+                  results["converged"] * n_members * n_members / 2 ** 20
+              )
+
+
+if __name__ == "__main__":
+    main()
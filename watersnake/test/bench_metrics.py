@@ -0,0 +1,62 @@
+""" Benchmark of the cost of recording metrics, compared with not doing so
+(the default). """
+
+import random
+import timeit
+
+import watersnake.membership as membership
+import watersnake.metrics as metrics
+import watersnake.swimprotocol as swimprotocol
+import watersnake.swimtransport as swimtransport
+
+
+def _run_group(n_members, n_ticks, registry, seed):
+    """Seconds taken for a loopback group to run n_ticks protocol periods"""
+    random.seed(seed)
+    transport = swimtransport.LoopbackMessageTransport()
+    if registry is not None:
+        transport.enable_metrics(registry)
+    router = swimtransport.MessageRouter(transport)
+    member_ids = ["member-%s" % n for n in range(n_members)]
+    members = [
+        membership.Membership(
+            member_id,
+            [membership.RemoteMember(x) for x in member_ids
+             if x != member_id],
+            router,
+            metrics_registry=registry
+        )
+        for member_id in member_ids
+    ]
+    for member in members:
+        member.start()
+
+    def run():
+        """Tick every member n_ticks times"""
+        for tick in xrange(n_ticks):
+            for member in members:
+                member.tick(tick * swimprotocol.SWIM.T)
+    return timeit.timeit(run, number=1), transport.sent_messages
+
+
+def bench_metrics(n_members=50, n_ticks=200, seed=0):
+    """Returns {"disabled"/"enabled": microseconds per message sent} for a
+    loopback group"""
+    results = {}
+    for scenario, registry in [
+            ("disabled", None),
+            ("enabled", metrics.MetricsRegistry()),
+        ]:
+        elapsed, sent_messages = _run_group(n_members, n_ticks, registry, seed)
+        results[scenario] = elapsed * 1e6 / sent_messages
+    return results
+
+
+def main():
+    """Print the cost of each message with and without metrics"""
+    for scenario, message_us in sorted(bench_metrics().items()):
+        print "%-10s message_us=%.2f" % (scenario, message_us)
+
+
+if __name__ == "__main__":
+    main()
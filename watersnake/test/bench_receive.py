@@ -0,0 +1,104 @@
+""" Benchmark of the cost of receiving messages: the time taken to route a
+datagram to a member whose view already matches the sender's, and the
+(garbage collector tracked) objects allocated to decode each message. """
+
+import gc
+import timeit
+
+import watersnake.swimmsg as swimmsg
+import watersnake.swimtransport as swimtransport
+import watersnake.udptransport as udptransport
+
+import bench_dissemination
+import bench_swimmsg
+
+
+def _objects_per_message(decode, number):
+    """The number of gc tracked objects allocated (and kept alive) by each
+    call of decode()"""
+    gc.collect()
+    gc.disable()
+    try:
+        before = len(gc.get_objects())
+        messages = [decode() for _ in xrange(number)]
+        allocated = len(gc.get_objects()) - before - 1  # (messages)
+    finally:
+        gc.enable()
+    del messages
+    return allocated / float(number)
+
+
+def bench_receive_allocations(n_piggyback_entries=(10, 50), number=2000):
+    """Returns {serialiser: {entries: {objects, objects_materialised}}}: the
+    objects allocated to decode a message, before and after its piggyback
+    data is accessed"""
+    results = {}
+    for name, serialiser in bench_swimmsg.SERIALISERS:
+        results[name] = {}
+        for n_entries in n_piggyback_entries:
+            buff = memoryview(
+                serialiser.to_buffer(bench_swimmsg.typical_message(n_entries))
+            )
+
+            def decode_materialised():
+                """Decode the message, and its piggyback data"""
+                message = swimmsg.from_buffer(buff)
+                message.piggyback_data.get("alive")
+                return message
+            results[name][n_entries] = {
+                "objects": _objects_per_message(
+                    lambda: swimmsg.from_buffer(buff), number
+                ),
+                "objects_materialised": _objects_per_message(
+                    decode_materialised, number
+                ),
+            }
+    return results
+
+
+def bench_datagram_receive(n_members=1000, n_entries=20, number=2000):
+    """Returns {serialiser: microseconds} to receive a framed datagram (as
+    a memoryview of a receive buffer) carrying n_entries piggybacked updates
+    which tell the receiver nothing new"""
+    results = {}
+    for name, serialiser in bench_swimmsg.SERIALISERS:
+        receiver = bench_dissemination.converged_membership(n_members)
+        sender = bench_dissemination.converged_membership(n_members,
+                                                          "member-1")
+        transport = udptransport.UDPMessageTransport(serialiser=serialiser)
+        transport.message_router = swimtransport.MessageRouter(transport)
+        transport.message_router.members[receiver.member_id] = receiver
+        transport.address_book["member-1"] = ("127.0.0.1", 1)
+        piggyback_data = sender.get_piggyback_data_to_send()
+        piggyback_data = dict(
+            piggyback_data,
+            alive=[["member-%s" % n, 1] for n in range(2, 2 + n_entries)]
+        )
+        datagram = memoryview(bytearray(udptransport.encode_frame(
+            "member-1",
+            receiver.member_id,
+            serialiser.to_buffer(swimmsg.test(piggyback_data=piggyback_data))
+        )))
+        elapsed = timeit.timeit(
+            lambda: transport.datagramReceived(datagram, ("127.0.0.1", 1)),
+            number=number
+        )
+        assert transport.dropped_messages == 0
+        results[name] = elapsed * 1e6 / number
+    return results
+
+
+def main():
+    """Print the cost of receiving messages"""
+    for name, results in sorted(bench_receive_allocations().items()):
+        for n_entries, result in sorted(results.items()):
+            print "%-8s entries=%-4s objects=%.1f objects_materialised=%.1f" % (
+                name, n_entries, result["objects"],
+                result["objects_materialised"]
+            )
+    for name, receive_us in sorted(bench_datagram_receive().items()):
+        print "%-8s datagram receive_us=%.1f" % (name, receive_us)
+
+
+if __name__ == "__main__":
+    main()
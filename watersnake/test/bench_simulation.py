@@ -0,0 +1,161 @@
+""" Benchmark of the protocol at scale, using the discrete-event cluster
+simulator: convergence time, false positive rate and bandwidth for a range
+of group sizes, network latencies and packet loss rates, how quickly the
+group reconverges as its members are restarted one by one, and the traffic
+between zones with and without zone-aware probing. """
+
+import shutil
+import sys
+import tempfile
+import time
+
+import watersnake.simulation as simulation
+
+SCENARIOS = [
+    ("lan", simulation.uniform_latency(0.0002, 0.001), 0.0),
+    ("wan", simulation.exponential_latency(0.03, 0.01), 0.0),
+    ("lossy_wan", simulation.exponential_latency(0.03, 0.01), 0.05),
+]
+
+
+def bench_simulation(group_sizes=(100, 300), periods=100, seed=0):
+    """Returns {scenario: {group size: simulator report}}; each report
+    includes the wall clock seconds the simulation took"""
+    results = {}
+    for label, latency, loss_rate in SCENARIOS:
+        results[label] = {}
+        for n_members in group_sizes:
+            start = time.time()
+            simulator = simulation.ClusterSimulator(
+                n_members,
+                latency=latency,
+                loss_rate=loss_rate,
+                seed=seed
+            )
+            simulator.run_until_converged(max_periods=periods)
+            simulator.run(periods - simulator.periods())
+            report = simulator.report()
+            report["wall_seconds"] = time.time() - start
+            results[label][n_members] = report
+    return results
+
+
+def bench_rolling_restart(group_sizes=(50, 100), restarts=5,
+                          downtime_periods=3, seed=0):
+    """Returns {"cold"/"warm": {group size: {mean_periods, max_periods,
+    messages}}}: the protocol periods taken for the group to reconverge
+    after each of a number of members in turn is down for downtime_periods
+    then restarts, from scratch or from its state file, and the messages
+    sent while it was down and the group reconverged (per restart)"""
+    results = {}
+    for label in ("cold", "warm"):
+        results[label] = {}
+        for n_members in group_sizes:
+            state_dir = tempfile.mkdtemp() if label == "warm" else None
+            try:
+                simulator = simulation.ClusterSimulator(
+                    n_members,
+                    latency=simulation.uniform_latency(0.0002, 0.001),
+                    seed=seed,
+                    state_dir=state_dir
+                )
+                simulator.run_until_converged()
+                periods = []
+                sent_messages = simulator.transport.sent_messages
+                for member_id in simulator.member_ids[:restarts]:
+                    simulator.fail_member(member_id)
+                    simulator.run(downtime_periods)
+                    simulator.restart_member(member_id)
+                    periods.append(simulator.run_until_converged())
+                messages = simulator.transport.sent_messages - sent_messages
+            finally:
+                if state_dir is not None:
+                    shutil.rmtree(state_dir)
+            results[label][n_members] = {
+                "mean_periods": sum(periods) / float(len(periods)),
+                "max_periods": max(periods),
+                "messages": messages / float(restarts),
+            }
+    return results
+
+
+def bench_zone_aware_probing(group_sizes=(60, 150), n_zones=3,
+                             periods=30, failures=3, seed=0):
+    """Returns {policy: {group size: {cross_zone_bytes, cross_zone_share,
+    detection_periods}}} for members spread across n_zones zones (with lan
+    latency within a zone and wan latency between them), probing uniformly
+    or with zone-aware probing: the bytes each member sends to other zones
+    per protocol period (and their share of all it sends) over 'periods'
+    periods of a healthy group, and the mean protocol periods it then takes
+    for every member to detect each of a number of failures in turn"""
+    results = {}
+    for label, zone_aware_probing in [
+            ("uniform", None),
+            ("zone_aware", {}),
+        ]:
+        results[label] = {}
+        for n_members in group_sizes:
+            simulator = simulation.ClusterSimulator(
+                n_members,
+                latency=simulation.uniform_latency(0.0002, 0.001),
+                seed=seed,
+                n_zones=n_zones,
+                cross_zone_latency=simulation.exponential_latency(0.03, 0.01),
+                zone_aware_probing=zone_aware_probing
+            )
+            simulator.run_until_converged()
+            transport = simulator.transport
+            cross_zone_bytes = transport.cross_zone_bytes
+            sent_bytes = transport.sent_bytes
+            simulator.run(periods)
+            cross_zone_bytes = transport.cross_zone_bytes - cross_zone_bytes
+            sent_bytes = transport.sent_bytes - sent_bytes
+            detection_periods = []
+            for member_id in simulator.member_ids[1:failures + 1]:
+                simulator.fail_member(member_id)
+                detection_periods.append(simulator.run_until_converged())
+            results[label][n_members] = {
+                "cross_zone_bytes":
+                    cross_zone_bytes / float(n_members * periods),
+                "cross_zone_share": cross_zone_bytes / float(sent_bytes),
+                "detection_periods":
+                    sum(detection_periods) / float(failures),
+            }
+    return results
+
+
+def main():
+    """Print simulation results; group sizes may be given on the command
+    line"""
+    group_sizes = [int(arg) for arg in sys.argv[1:]] or (100, 300)
+    for label, results in sorted(bench_simulation(group_sizes).items()):
+        for n_members, report in sorted(results.items()):
+            print "%-10s members=%-6s converged_after=%-5s " \
+                  "false_suspicions/member/period=%.4f " \
+                  "false_deaths/member/period=%.4f " \
+                  "bytes/member/period=%.0f wall_seconds=%.1f" % (
+                      label, n_members, report["converged_after_periods"],
+                      report["false_suspicion_rate"],
+                      report["false_positive_rate"],
+                      report["bytes_per_member_per_period"],
+                      report["wall_seconds"]
+                  )
+    for label, results in sorted(bench_rolling_restart().items()):
+        for n_members, result in sorted(results.items()):
+            print "%-10s members=%-6s mean_periods=%.1f max_periods=%s " \
+                  "messages/restart=%.0f" % (
+                      "restart_" + label, n_members, result["mean_periods"],
+                      result["max_periods"], result["messages"]
+                  )
+    for label, results in sorted(bench_zone_aware_probing().items()):
+        for n_members, result in sorted(results.items()):
+            print "%-10s members=%-6s cross_zone_bytes/member/period=%.0f " \
+                  "cross_zone_share=%.2f detection_periods=%.1f" % (
+                      label, n_members, result["cross_zone_bytes"],
+                      result["cross_zone_share"],
+                      result["detection_periods"]
+                  )
+
+
+if __name__ == "__main__":
+    main()
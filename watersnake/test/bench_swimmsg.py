@@ -0,0 +1,76 @@
+""" Micro-benchmark comparing the bytes on the wire and encode/decode cost of
+the watersnake message serialisers. """
+
+import timeit
+
+import watersnake.swimmsg as swimmsg
+
+SERIALISERS = [
+    ("json", swimmsg.SWIMJSONMessageSerialiser),
+    ("binary", swimmsg.SWIMBinaryMessageSerialiser),
+]
+
+
+def typical_message(n_piggyback_entries):
+    """A ping_req carrying n_piggyback_entries membership updates"""
+    member_ids = ["10.0.%s.%s:7946" % (n / 256, n % 256)
+                  for n in range(n_piggyback_entries + 2)]
+    return swimmsg.ping_req(
+        member_ids[0],
+        member_ids[-1],
+        piggyback_data=swimmsg.PiggybackData({
+            "alive": [[member_id, 3] for member_id in member_ids[2:]],
+            "dead": [],
+        })
+    )
+
+
+def bench_serialisers(n_piggyback_entries=(0, 10, 50), number=2000):
+    """Returns {serialiser: {entries: {bytes, encode_us,
+    encode_shared_piggyback_us, decode_us}}}; encode_us encodes messages
+    with fresh piggyback data each time, so the serialiser can't reuse its
+    encoding as it does for messages sharing PiggybackData
+    (encode_shared_piggyback_us)"""
+    results = {}
+    for name, serialiser in SERIALISERS:
+        results[name] = {}
+        for n_entries in n_piggyback_entries:
+            message = typical_message(n_entries)
+            buff = serialiser.to_buffer(message)
+
+            def encode_fresh():
+                """Encode the message with fresh piggyback data"""
+                message.piggyback_data.encodings.clear()
+                serialiser.to_buffer(message)
+            encode = timeit.timeit(encode_fresh, number=number)
+            encode_shared = timeit.timeit(
+                lambda: serialiser.to_buffer(message),
+                number=number
+            )
+            decode = timeit.timeit(lambda: serialiser.from_buffer(buff),
+                                   number=number)
+            results[name][n_entries] = {
+                "bytes": len(buff),
+                "encode_us": encode * 1e6 / number,
+                "encode_shared_piggyback_us": encode_shared * 1e6 / number,
+                "decode_us": decode * 1e6 / number,
+            }
+    return results
+
+
+def main():
+    """Print a comparison of the serialisers"""
+    results = bench_serialisers()
+    print "%-8s %8s %8s %10s %10s %10s" % (
+        "codec", "entries", "bytes", "encode_us", "shared_us", "decode_us"
+    )
+    for name, _ in SERIALISERS:
+        for n_entries, result in sorted(results[name].items()):
+            print "%-8s %8s %8s %10.1f %10.1f %10.1f" % (
+                name, n_entries, result["bytes"], result["encode_us"],
+                result["encode_shared_piggyback_us"], result["decode_us"]
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+""" Benchmark of many watersnake members sharing a single twisted reactor,
+each with its own UDP socket on localhost. """
+
+from twisted.internet import reactor
+
+import watersnake.membership as membership
+import watersnake.swimmsg as swimmsg
+import watersnake.swimtransport as swimtransport
+import watersnake.udptransport as udptransport
+
+
+def bench_udp_reactor(n_members=200, period=0.05, duration=5.0,
+                      serialiser=swimmsg.SWIMBinaryMessageSerialiser):
+    """Run n_members members ticking every 'period' seconds for 'duration'
+    seconds; returns message throughput"""
+    address_book = {}
+    member_ids = ["member-%s" % n for n in range(n_members)]
+    transports = []
+    ports = []
+    tickers = []
+    for member_id in member_ids:
+        transport = udptransport.UDPMessageTransport(address_book, serialiser)
+        router = swimtransport.MessageRouter(transport)
+        ports.append(transport.listen(reactor))
+        address_book[member_id] = transport.local_address()
+        member = membership.Membership(
+            member_id,
+            [membership.RemoteMember(x) for x in member_ids if x != member_id],
+            router
+        )
+        member.start()
+        transports.append(transport)
+        tickers.append(udptransport.MembershipTicker(member, reactor, period))
+
+    for ticker in tickers:
+        ticker.start()
+    start_time = reactor.seconds()
+    reactor.callLater(duration, reactor.stop)
+    reactor.run()
+    elapsed = reactor.seconds() - start_time
+    for port in ports:
+        port.stopListening()
+    received = sum(transport.received_messages for transport in transports)
+    return {
+        "members": n_members,
+        "sent_per_second": sum(t.sent_messages for t in transports) / elapsed,
+        "received_per_second": received / elapsed,
+        "received_bytes_per_second":
+            sum(t.received_bytes for t in transports) / elapsed,
+    }
+
+
+def main():
+    """Print message throughput"""
+    result = bench_udp_reactor()
+    print "members=%(members)s sent/s=%(sent_per_second).0f " \
+          "received/s=%(received_per_second).0f " \
+          "received-bytes/s=%(received_bytes_per_second).0f" % result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+""" Benchmark/capacity planning sweep using the vectorised protocol model:
+startup convergence time and bandwidth across group sizes, K, packet loss
+rates and piggyback budgets. """
+
+import sys
+import time
+
+try:
+    import watersnake.vectormodel as vectormodel
+except ImportError:  # numpy isn't installed
+    vectormodel = None
+
+
+def bench_vectormodel(group_sizes=(1000,), k=(1, 3), loss_rate=(0.0, 0.05),
+                      budget_bytes=(256, 512), max_periods=500, seed=0):
+    """Returns {group size: [(parameters, report)]}; each report includes
+    the wall clock seconds the model took"""
+    results = {}
+    for n_members in group_sizes:
+        start = time.time()
+        results[n_members] = vectormodel.sweep(
+            n_members,
+            max_periods=max_periods,
+            seed=seed,
+            k=k,
+            loss_rate=loss_rate,
+            budget_bytes=budget_bytes
+        )
+        wall_seconds = (time.time() - start) / len(results[n_members])
+        for _, report in results[n_members]:
+            report["wall_seconds"] = wall_seconds
+    return results
+
+
+def main():
+    """Print sweep results; group sizes may be given on the command line"""
+    if vectormodel is None:
+        print "numpy is not installed; skipping"
+        return
+    group_sizes = [int(arg) for arg in sys.argv[1:]] or (1000,)
+    for n_members, results in sorted(bench_vectormodel(group_sizes).items()):
+        for params, report in results:
+            print "members=%-6s k=%s loss_rate=%-4s budget_bytes=%-4s " \
+                  "converged_after_seconds=%-6s " \
+                  "bytes/member/period=%.0f wall_seconds=%.1f" % (
+                      n_members, params["k"], params["loss_rate"],
+                      params["budget_bytes"],
+                      report["converged_after_seconds"],
+                      report["bytes_per_member_per_period"],
+                      report["wall_seconds"]
+                  )
+
+
+if __name__ == "__main__":
+    main()
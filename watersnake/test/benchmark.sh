@@ -0,0 +1,8 @@
+#! /bin/bash
+# set -e
+# set -x
+export DIV="------------------------------------------------------------------------------------------------"
+cd "$(dirname "$0")"
+for BENCH in ./bench_*.py; do
+    echo $DIV && echo "$BENCH:" && PYTHONPATH=../../ python $BENCH
+done
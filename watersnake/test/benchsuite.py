@@ -0,0 +1,167 @@
+""" Reproducible benchmark suite for the protocol hot paths, with regression
+tracking.
+
+    python benchsuite.py run [--output results.json] [--repeat 3]
+    python benchsuite.py compare baseline.json results.json [--threshold 0.1]
+
+'run' runs each benchmark below (all with fixed seeds) 'repeat' times,
+keeping the best (lowest) value of each measurement, and writes them as JSON.
+Every measurement is a cost (microseconds, ticks, messages or bytes), so
+'compare' flags as a regression any which has grown by more than 'threshold'
+(a proportion) relative to the baseline, exiting non-zero if there are any.
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+import bench_batchio
+import bench_convergence
+import bench_dissemination
+import bench_hashring
+import bench_membership_tick
+import bench_receive
+import bench_simulation
+import bench_swimmsg
+
+# (name, benchmark function, keyword arguments)
+SUITE = [
+    ("serialisers", bench_swimmsg.bench_serialisers, {}),
+    ("steady_state_receive",
+     bench_dissemination.bench_steady_state_receive, {}),
+    ("receive_allocations", bench_receive.bench_receive_allocations, {}),
+    ("datagram_receive", bench_receive.bench_datagram_receive, {}),
+    ("batchio", bench_batchio.bench_batchio, {}),
+    ("piggyback", bench_dissemination.bench_piggyback,
+     {"group_sizes": (100, 1000)}),
+    ("tick", bench_membership_tick.bench_tick,
+     {"group_sizes": (100, 1000, 10000)}),
+    ("probe_selection", bench_membership_tick.bench_probe_selection, {}),
+    ("view_queries", bench_membership_tick.bench_view_queries, {}),
+    ("hashring", bench_hashring.bench_hashring, {}),
+    ("convergence", bench_convergence.bench_convergence, {}),
+    ("messages_per_period", bench_convergence.bench_messages_per_period, {}),
+    ("messages_per_period_coalesced",
+     bench_convergence.bench_messages_per_period,
+     {"coalesce_budget_bytes": 1200}),
+    ("rolling_restart", bench_simulation.bench_rolling_restart,
+     {"group_sizes": (50,)}),
+    ("zone_aware_probing", bench_simulation.bench_zone_aware_probing,
+     {"group_sizes": (60,)}),
+]
+
+DEFAULT_THRESHOLD = 0.1
+
+
+def flatten(results, prefix=""):
+    """Flattens nested benchmark results into {"a/b/c": value}"""
+    flat = {}
+    for key, value in results.items():
+        name = "%s/%s" % (prefix, key) if prefix else str(key)
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        else:
+            flat[name] = value
+    return flat
+
+
+def run_suite(repeat=3, names=None, suite=None):
+    """Returns {measurement name: best value over 'repeat' runs}"""
+    best = {}
+    for name, function, kwargs in suite or SUITE:
+        if names and name not in names:
+            continue
+        for _ in range(repeat):
+            random.seed(0)
+            for key, value in flatten(function(**kwargs), name).items():
+                if value is not None and (key not in best or
+                                          value < best[key]):
+                    best[key] = value
+    return best
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Returns [(measurement name, baseline, current, ratio)] for every
+    measurement in both baseline and current, and the names of those which
+    have regressed (grown by more than threshold)"""
+    rows = []
+    regressions = []
+    for key in sorted(set(baseline) & set(current)):
+        before, after = baseline[key], current[key]
+        ratio = after / float(before) if before else None
+        rows.append((key, before, after, ratio))
+        if after > before * (1 + threshold) and (before or after):
+            regressions.append(key)
+    return rows, regressions
+
+
+def _run(args):
+    """The 'run' command"""
+    document = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.time(),
+        "repeat": args.repeat,
+        "results": run_suite(args.repeat, args.bench),
+    }
+    output = json.dumps(document, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print output
+    return 0
+
+
+def _compare(args):
+    """The 'compare' command"""
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+    with open(args.current) as current_file:
+        current = json.load(current_file)["results"]
+    rows, regressions = compare(baseline, current, args.threshold)
+    for key, before, after, ratio in rows:
+        print "%-60s %12.2f %12.2f %7s %s" % (
+            key, before, after,
+            "-" if ratio is None else "%.2fx" % ratio,
+            "REGRESSION" if key in regressions else ""
+        )
+    for key in sorted(set(baseline) ^ set(current)):
+        print "%-60s only in %s" % (
+            key, "baseline" if key in baseline else "current"
+        )
+    print "%s regression(s) beyond %.0f%%" % (
+        len(regressions), args.threshold * 100
+    )
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers()
+    run_parser = commands.add_parser("run", help="run the suite")
+    run_parser.add_argument("--output", help="JSON file to write")
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--bench", action="append",
+                            choices=[name for name, _, _ in SUITE],
+                            help="only run these benchmarks")
+    run_parser.set_defaults(command=_run)
+    compare_parser = commands.add_parser(
+        "compare",
+        help="compare two sets of results"
+    )
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float,
+                                default=DEFAULT_THRESHOLD)
+    compare_parser.set_defaults(command=_compare)
+    args = parser.parse_args(argv)
+    return args.command(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,4 +3,4 @@
 # set -x
 export DIV="------------------------------------------------------------------------------------------------"
 cd "$(dirname "$0")"
-PYTHONPATH=../../ python -m cProfile /usr/local/bin/trial ./test_membership.py
+PYTHONPATH=../../ python -m cProfile /usr/local/bin/trial ./test_*.py
@@ -0,0 +1,56 @@
+""" Unit tests for watersnake batchio module. """
+# Disable 'Line too long'                   pylint: disable=C0301
+
+import socket
+
+# Related third party imports
+import twisted.trial.unittest
+
+import watersnake.batchio as batchio
+
+
+class TestBatchIO(twisted.trial.unittest.TestCase):
+    """
+    Tests batched datagram socket I/O on localhost
+    """
+
+    def _socket(self):
+        """ A non-blocking UDP socket bound to localhost """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(sock.close)
+        sock.bind(("127.0.0.1", 0))
+        sock.setblocking(False)
+        return sock
+
+    def _receive_all(self, receiver):
+        """ Receive datagrams until there are none left """
+        received = []
+        while True:
+            try:
+                received.extend((datagram.tobytes(), source) for datagram, source in receiver.receive())
+            except socket.error:
+                return received
+
+    def test_batch_round_trip(self):
+        """Test that batches of datagrams are sent and received intact, with and without sendmmsg/recvmmsg"""
+        for use_mmsg in [None, False]:
+            sending, receiving = self._socket(), self._socket()
+            sender = batchio.DatagramBatchSender(sending, use_mmsg)
+            receiver = batchio.DatagramBatchReceiver(receiving, 2048, use_mmsg)
+            self.assertEqual(sender.use_mmsg, use_mmsg is None and batchio.HAVE_MMSG)
+            datagrams = [("datagram %s " % n) * (n % 50) for n in range(100)]
+            self.assertEqual(sender.send([(datagram, receiving.getsockname()) for datagram in datagrams]), 0)
+            self.assertEqual(self._receive_all(receiver), [(datagram, sending.getsockname()) for datagram in datagrams])
+            expected_syscalls = 2 if sender.use_mmsg else len(datagrams)
+            self.assertEqual(sender.syscalls, expected_syscalls)
+            self.assertEqual(receiver.syscalls, expected_syscalls + 1)
+
+    def test_unsendable_datagram_skipped(self):
+        """Test that a datagram which can't be sent doesn't prevent the rest of its batch being sent"""
+        for use_mmsg in [None, False]:
+            sending, receiving = self._socket(), self._socket()
+            sender = batchio.DatagramBatchSender(sending, use_mmsg)
+            receiver = batchio.DatagramBatchReceiver(receiving, 2048, use_mmsg)
+            destination = receiving.getsockname()
+            self.assertEqual(sender.send([("a", destination), ("b", ("127.0.0.1", 0)), ("c", destination)]), 1)
+            self.assertEqual([datagram for datagram, _ in self._receive_all(receiver)], ["a", "c"])
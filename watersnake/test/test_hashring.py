@@ -0,0 +1,77 @@
+""" Unit tests for watersnake hashring module. """
+# Disable 'Line too long'                   pylint: disable=C0301
+
+# Related third party imports
+import twisted.trial.unittest
+
+import watersnake.hashring as hashring
+import watersnake.membership as membership
+import watersnake.swimprotocol as swimprotocol
+import watersnake.swimtransport as swimtransport
+
+KEYS = ["key-%s" % n for n in range(2000)]
+
+
+class TestConsistentHashRing(twisted.trial.unittest.TestCase):
+    """
+    Tests the Watersnake consistent hash ring
+    """
+
+    def test_incremental_updates_match_rebuild(self):
+        """Test that adding and removing members gives the same ring as building it from scratch, and only moves the keys of the member removed"""
+        ring = hashring.ConsistentHashRing(vnodes=50)
+        for n in range(20):
+            ring.add("member-%s" % n)
+        owners = dict((key, ring.owner(key)) for key in KEYS)
+        self.assertEqual(len(set(owners.values())), 20)
+        ring.remove("member-7")
+        ring.remove("member-7")
+        rebuilt = hashring.ConsistentHashRing(vnodes=50)
+        rebuilt.update("member-%s" % n for n in range(20) if n != 7)
+        rebuilt.update(["member-3"])
+        self.assertEqual((len(ring), len(rebuilt)), (19, 19))
+        self.assertFalse("member-7" in ring)
+        for key in KEYS:
+            self.assertEqual(ring.owner(key), rebuilt.owner(key))
+            if owners[key] != "member-7":
+                self.assertEqual(ring.owner(key), owners[key])
+        ring.add("member-7")
+        self.assertEqual(dict((key, ring.owner(key)) for key in KEYS), owners)
+
+    def test_preference_list(self):
+        """Test that a key's preference list is its owner followed by other distinct members"""
+        ring = hashring.ConsistentHashRing(vnodes=10)
+        self.assertEqual((ring.owner("key"), ring.preference_list("key", 3)), (None, []))
+        for member_id in "ABCDE":
+            ring.add(member_id)
+        for key in KEYS[:100]:
+            preferred = ring.preference_list(key, 3)
+            self.assertEqual(len(set(preferred)), 3)
+            self.assertEqual(preferred[0], ring.owner(key))
+            self.assertEqual(sorted(ring.preference_list(key, 10)), list("ABCDE"))
+
+    def test_follows_membership(self):
+        """Test that a membership's hash ring holds the members it believes to be alive"""
+        transport = swimtransport.LoopbackMessageTransport()
+        router = swimtransport.MessageRouter(transport)
+        member_ids = ["A", "B", "C", "D"]
+        members = [membership.Membership(member_id, [membership.RemoteMember(x) for x in member_ids if x != member_id], router) for member_id in member_ids]
+        ring = members[0].enable_hash_ring(vnodes=20)
+        self.assertEqual(len(ring), 1)
+        for member in members:
+            member.start()
+        for tick in range(5):
+            for member in members:
+                member.tick(tick * swimprotocol.SWIM.T)
+        self.assertEqual(len(ring), 4)
+        transport.simulate_partition_between("A", "D")
+        transport.simulate_partition_between("B", "D")
+        transport.simulate_partition_between("C", "D")
+        tick = 5
+        while members[0]._remote_member_from_id("D").state != "dead":
+            for member in members[:3]:
+                member.tick(tick * swimprotocol.SWIM.T)
+            tick += 1
+        self.assertEqual(len(ring), 3)
+        self.assertFalse("D" in ring)
+        self.assertTrue(all(ring.owner(key) in "ABC" for key in KEYS))
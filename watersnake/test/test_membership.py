@@ -5,7 +5,11 @@
 # Related third party imports
 import twisted.trial.unittest
 
+import watersnake.dissemination as dissemination
 import watersnake.membership as membership
+import watersnake.metrics as metrics
+import watersnake.rtt as rtt
+import watersnake.scheduler as scheduler
 import watersnake.swimmsg as swimmsg
 import watersnake.swimprotocol as swimprotocol
 import watersnake.swimtransport as swimtransport
@@ -132,6 +136,17 @@ class TestWaterSnake(twisted.trial.unittest.TestCase):
             self.assertEqual(mess.piggyback_data, deserialised_mess.piggyback_data)
             self.assertEqual(mess, deserialised_mess)
 
+    def test_binary_wire_format(self):
+        """Test that members converge when using the binary wire format"""
+        self._create_harness(n_members=10)
+        self.transport.serialiser = swimmsg.SWIMBinaryMessageSerialiser
+        for member in self.members:
+            member.start()
+        for _ in range(10):
+            self.do_tick()
+        for member in self.members:
+            assert all([remote_member.state == "alive" for remote_member in member.expected_remote_members])
+
     def test_deserialise_bad_message(self):
         """Test message deserialisation raises an exception on receipt of a grossly bad message"""
         self.assertRaises(swimmsg.SWIMDeserialisationException,
@@ -289,12 +304,82 @@ class TestWaterSnake(twisted.trial.unittest.TestCase):
         self.do_tick()
         self.do_tick()
 
-        # with 2 remote members, after 5 ticks (assuming zero network latency), all nodes should have been pinged and found to be alive (as we have
-        # implemented the "strong completeness" round-robin mechanism described in section 4.3 of the SWIM paper)
+        # with 2 remote members, after 5 ticks (assuming zero network latency), all nodes should have been pinged (as we have
+        # implemented the "strong completeness" round-robin mechanism described in section 4.3 of the SWIM paper); unreachable
+        # nodes are only suspected at this point, as the suspicion timeout has yet to expire
         for member in self.members:
             # states = [(remote_member.remote_member_id, remote_member.state) for remote_member in member.expected_remote_members]
             # print "For member %s remote_member states are %s" % (member, states)
+            assert any([remote_member.state == "suspect" for remote_member in member.expected_remote_members])
+            assert not any([remote_member.state == "dead" for remote_member in member.expected_remote_members])
+
+        for _ in range(5):
+            self.do_tick()
+
+        # Nobody has been able to refute the suspicions, so they have now been confirmed
+        for member in self.members:
             assert any([remote_member.state == "dead" for remote_member in member.expected_remote_members])
+            self.assertEqual(member.suspicions_refuted, 0)
+        self.assertTrue(sum(member.suspicions_confirmed for member in self.members) >= 2)
+
+    def test_suspicion_refuted(self):
+        """Test that a suspected member refutes the suspicion by reincarnating rather than being declared dead"""
+        self._create_harness(n_members=3)
+        for member in self.members:
+            member.start()
+        while not self._all_alive():
+            self.do_tick()
+        node_a, node_b = self.members[0], self.members[1]
+        remote_node_b = node_a._remote_member_from_id("B")
+        self.assertEqual(node_b.incarnation_number, 1)
+        remote_node_b.node_suspected()
+        self.assertEqual(remote_node_b.state, "suspect")
+        self.assertEqual(node_a.suspicions_raised, 1)
+        for _ in range(10):
+            self.do_tick()
+        self.assertTrue(self._all_alive())
+        self.assertTrue(node_b.incarnation_number > 1)
+        self.assertEqual(remote_node_b.incarnation_number, node_b.incarnation_number)
+        self.assertEqual(node_a.suspicions_refuted, 1)
+        self.assertEqual(node_a.suspicions_confirmed, 0)
+        self.assertEqual(len(node_a.scheduler), 1 if remote_node_b.is_currently_being_checked() else 0)
+
+    def test_suspicion_cleared_in_same_incarnation(self):
+        """Test that hearing directly from a suspected member in the same incarnation clears our suspicion without counting it as refuted or disseminating it, and that suspicions are counted in metrics"""
+        self._create_harness(n_members=3)
+        for member in self.members:
+            member.start()
+        while not self._all_alive():
+            self.do_tick()
+        node_a = self.members[0]
+        registry = metrics.MetricsRegistry()
+        node_a.enable_metrics(registry)
+        remote_node_b = node_a._remote_member_from_id("B")
+        remote_node_b.node_suspected()
+        version = node_a.dissemination_buffer.version
+        remote_node_b.node_alive()
+        self.assertEqual((remote_node_b.state, remote_node_b.incarnation_number), ("alive", 1))
+        self.assertEqual(node_a.dissemination_buffer.version, version)
+        self.assertEqual(node_a.suspicions_refuted, 0)
+        self.assertEqual(len(node_a.scheduler), 0)
+        remote_node_b.node_suspected()
+        node_a.locally_disseminate({"alive": [("B", 2)]})
+        self.assertEqual(node_a.dissemination_buffer.version, version + 2)
+        self.assertEqual((node_a.suspicions_raised, node_a.suspicions_refuted), (2, 1))
+        samples = registry.snapshot()["watersnake_suspicions_total"]["samples"]
+        self.assertEqual(samples, {("raised",): 2, ("refuted",): 1, ("confirmed",): 0})
+
+    def test_suspicion_precedence(self):
+        """Test that at the same incarnation suspicion overrides liveness, but not death"""
+        remote_member = membership.RemoteMember("B")
+        self.assertTrue(remote_member.on_disseminated_data(1, "alive"))
+        self.assertFalse(remote_member.on_disseminated_data(1, "alive"))
+        self.assertTrue(remote_member.on_disseminated_data(1, "suspect"))
+        self.assertFalse(remote_member.on_disseminated_data(1, "alive"))
+        self.assertTrue(remote_member.on_disseminated_data(1, "dead"))
+        self.assertFalse(remote_member.on_disseminated_data(1, "suspect"))
+        self.assertTrue(remote_member.on_disseminated_data(2, "alive"))
+        self.assertEqual(remote_member.state, "alive")
 
     def test_simple_dissemination(self):
         """Test that piggyback_data containing 'infection style' state info
@@ -315,6 +400,546 @@ class TestWaterSnake(twisted.trial.unittest.TestCase):
         self.assertEqual(remote_node_c.state, 'dead')
         self.assertEqual(node_a.incarnation_number, 4)
 
+    def test_dissemination_buffer_ordering_and_retransmits(self):
+        """Test that the dissemination buffer sends least-sent updates first and
+        forgets updates once they have been sent lambda*log(n) times"""
+        buff = dissemination.DisseminationBuffer(retransmit_multiplier=1)
+        limit = buff.retransmit_limit(10)
+        buff.enqueue("B", "alive", 1)
+        self.assertEqual(buff.select(10), [("B", "alive", 1)])
+        buff.enqueue("C", "dead", 2)
+        self.assertEqual(buff.select(10, budget_bytes=buff.entry_size("C", 2)), [("C", "dead", 2)])
+        # A newer update about a member supersedes the queued one
+        buff.enqueue("B", "dead", 1)
+        self.assertEqual(buff.select(10), [("B", "dead", 1), ("C", "dead", 2)])
+        for _ in range(limit):
+            buff.select(10)
+        self.assertEqual(len(buff), 0)
+        self.assertEqual(buff.select(10), [])
+
+    def test_piggyback_size_is_bounded(self):
+        """Test that piggyback data only carries queued changes, within the byte budget"""
+        self._create_harness(n_members=100)
+        node_a = self.members[0]
+        piggyback_data = node_a.get_piggyback_data_to_send()
+        self.assertEqual(piggyback_data["alive"], [("A", 1)])
+        self.assertEqual(piggyback_data["dead"], [])
+        node_a.locally_disseminate({
+            "alive": [(member.remote_member_id, 1) for member in node_a.expected_remote_members],
+            "dead": [],
+        })
+        piggyback_data = node_a.get_piggyback_data_to_send()
+        self.assertLess(len(piggyback_data["alive"]), 100)
+        self.assertLessEqual(
+            sum(node_a.dissemination_buffer.entry_size(member_id, incarnation)
+                for member_id, incarnation in piggyback_data["alive"]),
+            node_a.dissemination_buffer.budget_bytes
+        )
+
+
+    def test_piggyback_is_cached(self):
+        """Test that piggyback data is only rebuilt when the view changes, and updates still stop being sent after lambda*log(n) transmissions"""
+        self._create_harness(n_members=20)
+        node_a = self.members[0]
+        node_a.locally_disseminate({"alive": [("B", 2), ("C", 2)]})
+        piggyback_data = node_a.get_piggyback_data_to_send()
+        self.assertEqual(sorted(piggyback_data["alive"]), [("A", 1), ("B", 2), ("C", 2)])
+        self.assertTrue(node_a.get_piggyback_data_to_send() is piggyback_data)
+        node_a.locally_disseminate({"dead": [("D", 1)]})
+        piggyback_data = node_a.get_piggyback_data_to_send()
+        self.assertEqual(piggyback_data["dead"], [("D", 1)])
+        # B and C have already been sent twice, so reach their limit first
+        for _ in range(node_a.dissemination_buffer.retransmit_limit(20) - 3):
+            self.assertTrue(node_a.get_piggyback_data_to_send() is piggyback_data)
+        piggyback_data = node_a.get_piggyback_data_to_send()
+        self.assertEqual(piggyback_data["alive"], [("A", 1)])
+        self.assertEqual(piggyback_data["dead"], [("D", 1)])
+        self.assertTrue(node_a.get_piggyback_data_to_send() is piggyback_data)
+        self.assertEqual(len(node_a.dissemination_buffer), 0)
+        self.assertEqual(node_a.get_piggyback_data_to_send()["dead"], [])
+
+    def test_deadline_scheduler(self):
+        """Test that only expired, uncancelled deadlines are run, in order"""
+        fired = []
+        deadlines = scheduler.DeadlineScheduler()
+        deadlines.schedule(4, lambda time_now: fired.append(("b", time_now)))
+        deadlines.schedule(2, lambda time_now: fired.append(("a", time_now)))
+        cancelled = deadlines.schedule(3, lambda time_now: fired.append(("c", time_now)))
+        deadlines.cancel(cancelled)
+        self.assertEqual(len(deadlines), 2)
+        self.assertEqual(deadlines.next_deadline(), 2)
+        self.assertEqual(deadlines.run_expired(2), 0)
+        self.assertEqual(deadlines.run_expired(5), 2)
+        self.assertEqual(fired, [("a", 5), ("b", 5)])
+        self.assertEqual(len(deadlines), 0)
+
+    def test_remote_member_is_compact(self):
+        """Test that RemoteMembers hold their state as an integer code, without a per-instance dict"""
+        remote_member = membership.RemoteMember("B")
+        self.assertFalse(hasattr(remote_member, "__dict__"))
+        self.assertEqual(remote_member.state, "unknown")
+        self.assertEqual(remote_member.state_code, membership.STATE_UNKNOWN)
+        for state in membership.STATE_NAMES:
+            remote_member.state = state
+            self.assertEqual(remote_member.state, state)
+            self.assertEqual(membership.STATE_NAMES[remote_member.state_code], state)
+        self.assertRaises(KeyError, setattr, remote_member, "state", "undead")
+
+    def test_rtt_estimator(self):
+        """Test that probe timeouts track measured round trip times within their floor and ceiling"""
+        estimator = rtt.RTTEstimator(min_timeout=0.1, max_timeout=2.0)
+        self.assertEqual(estimator.timeout(), 2.0)
+        for _ in range(50):
+            estimator.add_sample(0.2)
+        self.assertAlmostEqual(estimator.srtt, 0.2)
+        self.assertTrue(0.2 <= estimator.timeout() < 0.25)
+        for _ in range(50):
+            estimator.add_sample(0.001)
+        self.assertEqual(estimator.timeout(), 0.1)
+        for _ in range(50):
+            estimator.add_sample(30)
+        self.assertEqual(estimator.timeout(), 2.0)
+        self.assertEqual(estimator.snapshot()["samples"], 150)
+
+    def test_adaptive_probe_timeout(self):
+        """Test that members measure round trip times to each other and derive probe timeouts from them"""
+        self._create_harness(n_members=5)
+        for member in self.members:
+            # Every ack arrives 10ms into the protocol period
+            member.clock = lambda: self.tick_count * swimprotocol.SWIM.T + 0.01
+            member.start()
+        for _ in range(10):
+            self.do_tick()
+        for member in self.members:
+            estimates = member.rtt_estimates()
+            self.assertEqual(sorted(estimates.keys()), sorted(remote_member.remote_member_id for remote_member in member.expected_remote_members))
+            for estimate in estimates.values():
+                if estimate["samples"]:
+                    self.assertAlmostEqual(estimate["srtt"], 0.01)
+                    self.assertTrue(member.min_probe_timeout <= estimate["timeout"] < member.max_probe_timeout)
+                else:
+                    self.assertEqual(estimate["timeout"], member.max_probe_timeout)
+            self.assertTrue(any(estimate["samples"] for estimate in estimates.values()))
+
+    def test_tick_only_visits_failure_detection_in_progress(self):
+        """Test that failure detection timeouts are scheduled rather than polled on every tick"""
+        self._create_harness(n_members=20, enable_infection_dissemination=False)
+        for member in self.members[1:]:
+            self.transport.simulate_partition_between(member.member_id, "A")
+        for member in self.members:
+            member.start()
+        node_a = self.members[0]
+        self.do_tick()
+        # Each member has at most one deadline pending: for the member it has just pinged
+        self.assertTrue(all(len(member.scheduler) <= 1 for member in self.members))
+        for _ in range(40):
+            self.do_tick()
+        self.assertTrue(all([remote_member.state == "dead" for remote_member in node_a.expected_remote_members]))
+
+    def test_coalesced_messages(self):
+        """Test that a group whose transport coalesces messages to the same recipient converges and detects failures in fewer frames"""
+        self._create_harness(n_members=10)
+        self.transport.enable_coalescing()
+        for member in self.members:
+            member.start()
+        for _ in range(10):
+            self.do_tick()
+            self.transport.flush()
+        self.assertTrue(self._all_alive())
+        self.assertTrue(self.transport.sent_frames < self.transport.sent_messages)
+        self.assertEqual(self.transport.received_messages, self.transport.sent_messages)
+        node_j = self.members[-1]
+        for member in self.members[:-1]:
+            self.transport.simulate_partition_between(node_j.member_id, member.member_id)
+        for _ in range(40):
+            self.do_tick()
+            self.transport.flush()
+        self.assertTrue(all(member.expected_remote_members[-1].state == "dead" for member in self.members[:-1]))
+
+    def test_coalescing_budget(self):
+        """Test that queued messages are sent together, in frames no larger than the budget, with their piggyback data merged"""
+        self._create_harness(n_members=2)
+        node_a, node_b = self.members
+        for member in self.members:
+            member.start()
+        self.transport.enable_coalescing(budget_bytes=250)
+        for n in range(10):
+            node_a.send_message_to_member_id(swimmsg.test(meta_data={"n": n}), node_b.member_id)
+        self.assertEqual(node_b.received_messages, 0)
+        self.transport.flush()
+        self.assertEqual(node_b.received_messages, 10)
+        self.assertEqual(node_b.last_received_message.meta_data, {"n": 9})
+        self.assertTrue(1 < self.transport.sent_frames < 10)
+        self.assertTrue(self.transport.sent_bytes <= 250 * self.transport.sent_frames)
+
+    def test_coalesced_broadcast(self):
+        """Test that a message broadcast to several coalescing recipients reaches each with our piggyback data, whatever else is queued for them"""
+        self._create_harness(n_members=4)
+        node_a = self.members[0]
+        for member in self.members:
+            member.start()
+        self.transport.enable_coalescing()
+        frames = []
+        send_message_impl = self.transport.send_message_impl
+
+        def record_frame(address, message, from_sender):
+            """Note each frame sent, then send it"""
+            frames.append((address, message))
+            send_message_impl(address, message, from_sender)
+        self.transport.send_message_impl = record_frame
+        node_a.send_message_to_member_id(swimmsg.test(meta_data={"n": 1}), "B")
+        node_a.broadcast_message(swimmsg.test(meta_data={"n": 2}))
+        self.transport.flush()
+        self.assertEqual(sorted(address for address, _ in frames), ["B", "C", "D"])
+        for address, frame in frames:
+            if swimmsg.is_compound(frame):
+                messages = [swimmsg.from_buffer(buff) for buff in swimmsg.split_compound_buffer(frame)]
+            else:
+                messages = [swimmsg.from_buffer(frame)]
+            self.assertEqual([message.meta_data["n"] for message in messages], [1, 2] if address == "B" else [2])
+            self.assertEqual(messages[0].piggyback_data["alive"][0], ["A", node_a.incarnation_number])
+            self.assertEqual(messages[0].piggyback_digest, node_a.view_digest)
+            self.assertTrue(all(not message.has_piggyback_data for message in messages[1:]))
+
+    def _all_alive(self):
+        """Does every member believe that every other member is alive?"""
+        return all(all([remote_member.state == "alive" for remote_member in member.expected_remote_members])
+                   for member in self.members)
+
+    def test_join_via_seed(self):
+        """Test that a member with no static member list joins the group via a seed member"""
+        self._create_harness(n_members=10)
+        for member in self.members:
+            member.start()
+        while not self._all_alive():
+            self.do_tick()
+        joiner = membership.Membership("Z", [], self.router, seed_member_ids=["Z", "A"])
+        joiner.start()
+        self.assertFalse(joiner.joined)
+        self.members.append(joiner)
+        self.do_tick()
+        self.assertTrue(joiner.joined)
+        self.assertEqual(sorted(member.remote_member_id for member in joiner.expected_remote_members),
+                         [member.member_id for member in self.members[:-1]])
+        for _ in range(10):
+            self.do_tick()
+        self.assertTrue(self._all_alive())
+        for member in self.members[:-1]:
+            self.assertEqual(len(member.expected_remote_members), 10)
+            self.assertEqual(len(member.nodes_to_ping), 10)
+
+    def test_leave(self):
+        """Test that a member gracefully leaving is removed from the ping rotation rather than detected as failed"""
+        self._create_harness(n_members=5)
+        for member in self.members:
+            member.start()
+        while not self._all_alive():
+            self.do_tick()
+        leaver = self.members.pop()
+        leaver.leave()
+        for _ in range(10):
+            self.do_tick()
+        for member in self.members:
+            remote_leaver = member._remote_member_from_id(leaver.member_id)
+            self.assertEqual(remote_leaver.state, "left")
+            self.assertNotIn(remote_leaver, member.nodes_to_ping)
+            self.assertFalse(remote_leaver.is_currently_being_checked())
+        self.assertTrue(all(all(remote_member.state == "alive" for remote_member in member.expected_remote_members
+                                if remote_member.remote_member_id != leaver.member_id)
+                            for member in self.members))
+
+    def test_ping_rotation(self):
+        """Test that every member is pinged exactly once per round, in a fresh order each round, as members join and leave mid-round"""
+        self._create_harness(n_members=2)
+        node_a = self.members[0]
+        node_a.start()
+        for n in range(10):
+            node_a._add_remote_member("new-%s" % n, 0, "alive")
+        node_a._select_node_to_ping()
+        while node_a._next_node_to_ping < len(node_a.nodes_to_ping):
+            node_a._select_node_to_ping()
+        rounds = []
+        for n in range(20):
+            pinged = [node_a._select_node_to_ping() for _ in range(len(node_a.nodes_to_ping) / 2)]
+            joiner = node_a._add_remote_member("joiner-%s" % n, 0, "alive")
+            leaver = [member for member in node_a.nodes_to_ping if member is not joiner][n * 7 % 10]
+            leaver.state = "left"
+            node_a.member_updated(leaver, "alive")
+            pinged.extend(node_a._select_node_to_ping() for _ in range(len(node_a.nodes_to_ping) - node_a._next_node_to_ping))
+            self.assertEqual(len(set(pinged)), len(pinged))
+            self.assertEqual(set(pinged) - set([leaver]), set(node_a.nodes_to_ping))
+            self.assertTrue(joiner in pinged)
+            self.assertTrue(all(member.rotation_index == index for index, member in enumerate(node_a.nodes_to_ping)))
+            rounds.append([member for member in pinged if member in node_a.nodes_to_ping])
+        self.assertEqual(len(node_a.nodes_to_ping), 11)
+        self.assertTrue(all(member.state != "left" for member in node_a.nodes_to_ping))
+        self.assertNotEqual(rounds[-1], [node_a._select_node_to_ping() for _ in range(len(node_a.nodes_to_ping))])
+
+    def test_probe_rotation_remove_before_first_round(self):
+        """Test that members can be removed from a rotation before it's first shuffled, and are then never pinged"""
+        remote_members = [membership.RemoteMember(member_id) for member_id in "BCDE"]
+        rotation = membership.ProbeRotation(remote_members)
+        rotation.remove(remote_members[1])
+        rotation.remove(remote_members[3])
+        self.assertEqual(sorted(member.remote_member_id for member in rotation.members), ["B", "D"])
+        self.assertTrue(all(member.rotation_index == index for index, member in enumerate(rotation.members)))
+        self.assertEqual(remote_members[1].rotation_index, None)
+        self.assertEqual(sorted(rotation.next_member().remote_member_id for _ in range(2)), ["B", "D"])
+
+    def test_ping_req_selection(self):
+        """Test that ping_req helpers are K distinct members other than the target, excluding dead and left members"""
+        self._create_harness(n_members=40)
+        node_a = self.members[0]
+        node_a.start()
+        node_a._select_node_to_ping()
+        remote_members = node_a.expected_remote_members
+        for index, remote_member in enumerate(remote_members[:30]):
+            remote_member.state = "dead" if index % 2 else "left"
+        for target in remote_members:
+            selected = node_a.select_nodes_to_ping_req(target.remote_member_id)
+            self.assertEqual(len(selected), swimprotocol.SWIM.K)
+            self.assertEqual(len(set(selected)), len(selected))
+            self.assertTrue(all(member.state not in ("dead", "left") and member is not target for member in selected))
+        for remote_member in remote_members[30:37]:
+            remote_member.state = "dead"
+        self.assertEqual(node_a.select_nodes_to_ping_req(remote_members[37].remote_member_id), [remote_members[38]])
+
+    def test_zone_aware_probing(self):
+        """Test that members in other zones are pinged in a bounded proportion of periods, each still once per round, and that ping_req helpers are chosen from our own zone first"""
+        router = swimtransport.MessageRouter(swimtransport.LoopbackMessageTransport())
+        remote_members = ([membership.RemoteMember("a%s" % n, "a") for n in range(10)] +
+                          [membership.RemoteMember("b%s" % n) for n in range(20)])
+        node = membership.Membership("A", remote_members, router, zone="a")
+        node.enable_zone_aware_probing(cross_zone_probe_rate=0.25, zone_of=lambda member_id: member_id[0])
+        node.start()
+        pinged = [node._select_node_to_ping() for _ in range(400)]
+        self.assertEqual([member.zone for member in pinged[:8]], ["a", "a", "a", "b"] * 2)
+        for remote_member in remote_members:
+            self.assertEqual(pinged.count(remote_member), 30 if remote_member.zone == "a" else 5)
+        joiner = node._add_remote_member("b20", 0, "alive")
+        self.assertEqual(joiner.zone, "b")
+        self.assertFalse(joiner in node.nodes_to_ping)
+        pinged = [node._select_node_to_ping() for _ in range(84)]
+        self.assertTrue(joiner in pinged)
+        for target in remote_members[:12]:
+            selected = node.select_nodes_to_ping_req(target.remote_member_id)
+            self.assertEqual([member.zone for member in selected], ["a"] * swimprotocol.SWIM.K)
+            self.assertFalse(target in selected)
+        for remote_member in remote_members[2:10]:
+            remote_member.state = "dead"
+        selected = node.select_nodes_to_ping_req("b0")
+        self.assertEqual(sorted(member.remote_member_id for member in selected[:2]), ["a0", "a1"])
+        self.assertEqual([member.zone for member in selected[2:]], ["b"])
+        self.assertRaises(ValueError, membership.Membership("B", [], router).enable_zone_aware_probing)
+
+    def test_coalesced_events_in_same_incarnation(self):
+        """Test that a member changing state and back in the same incarnation within a batch produces no event, and that incarnation_changed is only reported when its incarnation has changed"""
+        self._create_harness(n_members=3)
+        node_a = self.members[0]
+        for member in self.members:
+            member.start()
+        while not self._all_alive():
+            self.do_tick()
+        batches = []
+        node_a.subscribe(batches.append)
+        remote_node_b = node_a._remote_member_from_id("B")
+        remote_node_b.node_suspected()
+        remote_node_b.node_alive()
+        node_a.deliver_events()
+        self.assertEqual(batches, [])
+        remote_node_b.node_suspected()
+        node_a.locally_disseminate({"alive": [("B", 2)]})
+        node_a.deliver_events()
+        self.assertEqual(batches, [[membership.MembershipEvent("incarnation_changed", "B", "alive", 2, "alive")]])
+
+    def test_failing_subscriber(self):
+        """Test that a subscriber raising an exception doesn't stop the others receiving events, nor the tick completing"""
+        self._create_harness(n_members=3)
+        node_a = self.members[0]
+        batches = []
+
+        def fail(events):
+            """A broken subscriber"""
+            raise RuntimeError("broken subscriber")
+        node_a.subscribe(fail)
+        node_a.subscribe(batches.append)
+        for member in self.members:
+            member.start()
+        while not self._all_alive():
+            self.do_tick()
+        node_a.deliver_events()
+        self.assertEqual(sorted(event.member_id for batch in batches for event in batch), ["B", "C"])
+        self.assertEqual(node_a._changed_members, {})
+
+    def test_membership_events(self):
+        """Test that subscribers are given one batch per tick of coalesced events for members joining, changing state and failing"""
+        self._create_harness(n_members=5)
+        node_a = self.members[0]
+        batches = []
+        node_a.subscribe(batches.append)
+        for member in self.members:
+            member.start()
+        while not self._all_alive():
+            self.do_tick()
+        node_a.deliver_events()
+        self.assertTrue(len(batches) <= self.tick_count + 1)
+        events = [event for batch in batches for event in batch]
+        self.assertTrue(all(len(set(event.member_id for event in batch)) == len(batch) for batch in batches))
+        self.assertEqual(sorted(event.member_id for event in events if event.kind == "alive"), ["B", "C", "D", "E"])
+        self.assertTrue(all(event.state == "alive" and event.previous_state == "unknown" for event in events))
+
+        del batches[:]
+        for member in "ABCD":
+            self.transport.simulate_partition_between(member, "E")
+            self.transport.simulate_partition_between("E", member)
+        while node_a._remote_member_from_id("E").state != "dead":
+            self.do_tick()
+        node_a.deliver_events()  # (E may have been declared dead by another member's tick)
+        events = [event for batch in batches for event in batch]
+        self.assertEqual([(event.kind, event.member_id) for event in events], [("suspect", "E"), ("dead", "E")])
+        self.assertEqual(events[-1], membership.MembershipEvent("dead", "E", "dead", 1, "suspect"))
+
+        del batches[:]
+        self.members.pop()
+        for member in "ZE":  # (E believes everyone else has failed)
+            self.transport.simulate_partition_between(member, "EZ".replace(member, ""))
+        joiner = membership.Membership("Z", [], self.router, seed_member_ids=["A"])
+        joiner.start()
+        self.members.append(joiner)
+        self.do_tick()
+        node_a.deliver_events()  # (A only hears of Z after its own tick)
+        self.assertEqual([(event.kind, event.member_id, event.state) for batch in batches for event in batch], [("joined", "Z", "alive")])
+
+        node_a.unsubscribe(batches.append)
+        del batches[:]
+        self.members.pop().leave()
+        self.do_tick()
+        self.assertEqual(batches, [])
+        self.assertEqual(len(node_a._changed_members), 0)
+
+    def test_state_indexes(self):
+        """Test that per-state counts, iteration and snapshots always match a scan of the remote members"""
+        self._create_harness(n_members=8)
+        for member in self.members:
+            member.start()
+        for member in "ABCDEFG":
+            self.transport.simulate_partition_between(member, "H")
+            self.transport.simulate_partition_between("H", member)
+        node_a = self.members[0]
+        for _ in range(40):
+            self.do_tick()
+            for member in self.members:
+                snapshot = member.snapshot()
+                self.assertTrue(member.snapshot() is snapshot)
+                for state in membership.STATE_NAMES:
+                    expected = set(remote_member for remote_member in member.expected_remote_members if remote_member.state == state)
+                    self.assertEqual(member.count(state), len(expected))
+                    self.assertEqual(set(member.members_in_state(state)), expected)
+                    if state in membership.DISSEMINATED_STATES:
+                        self.assertEqual(getattr(snapshot, state), frozenset(remote_member.remote_member_id for remote_member in expected))
+        self.assertEqual((node_a.count("alive"), node_a.count("dead")), (6, 1))
+        snapshot = node_a.snapshot()
+        node_a._remote_member_from_id("B").on_disseminated_data(5, "alive")
+        node_a.member_updated(node_a._remote_member_from_id("B"), "alive")
+        self.assertTrue(node_a.snapshot() is not snapshot)
+        self.assertTrue(node_a.snapshot().alive is snapshot.alive)
+        self.assertEqual(node_a.snapshot().version, snapshot.version + 1)
+
+    def test_push_pull(self):
+        """Test that push-pull sync exchanges entire views of the group in both directions"""
+        self._create_harness(n_members=20)
+        for member in self.members:
+            member.start()
+        node_a, node_b = self.members[:2]
+        node_a.locally_disseminate({"alive": [(member.member_id, 1) for member in self.members[2:10]]})
+        node_b.locally_disseminate({"alive": [(member.member_id, 1) for member in self.members[10:]],
+                                    "dead": [("C", 1)]})
+        node_a.push_pull_with("B")
+        view_a = dict((state, sorted(entries)) for state, entries in node_a.membership_view().items())
+        view_b = dict((state, sorted(entries)) for state, entries in node_b.membership_view().items())
+        self.assertEqual(view_a, view_b)
+        self.assertEqual(node_b._remote_member_from_id("C").state, "dead")
+        self.assertEqual(len(node_b.membership_view()["alive"]), 19)
+
+    def test_periodic_push_pull(self):
+        """Test that each push-pull interval we sync with a random live member, or with one whose view we've seen differs from ours"""
+        router = swimtransport.MessageRouter(swimtransport.MessageTransport())
+        node = membership.Membership("A", [membership.RemoteMember(member_id) for member_id in "BCDEF"], router, push_pull_interval=10.0)
+        synced = []
+        node.push_pull_with = synced.append
+        node.start()
+        for member_id in "BCDE":
+            node._remote_member_from_id(member_id).node_alive()
+        node.locally_disseminate({"dead": [("F", 1)]})
+        time_now = 0.0
+        for _ in range(200):
+            node._push_pull(time_now)
+            time_now += 1.0
+        self.assertEqual(len(synced), 19)
+        self.assertEqual(set(synced), set("BCDE"))
+        del synced[:]
+        for member_id in ["C", "F", "C"]:
+            node._view_mismatch_member_id = member_id
+            for _ in range(10):
+                node._push_pull(time_now)
+                time_now += 1.0
+        self.assertEqual(synced[0], "C")
+        self.assertTrue(synced[1] in "BCDE")
+        self.assertEqual(synced[2], "C")
+
+    def test_partition_heal(self):
+        """Test that members promptly reconverge once a partition heals"""
+        self._create_harness(n_members=20)
+        for member in self.members:
+            member.start()
+        while not self._all_alive():
+            self.do_tick()
+        side_a = [member.member_id for member in self.members[:10]]
+        side_b = [member.member_id for member in self.members[10:]]
+        for id_a in side_a:
+            for id_b in side_b:
+                self.transport.simulate_partition_between(id_a, id_b)
+                self.transport.simulate_partition_between(id_b, id_a)
+        for _ in range(60):
+            self.do_tick()
+        self.assertFalse(self._all_alive())
+        for id_a in side_a:
+            for id_b in side_b:
+                self.transport.heal_partition_between(id_a, id_b)
+                self.transport.heal_partition_between(id_b, id_a)
+        for _ in range(5):
+            self.do_tick()
+        self.assertTrue(self._all_alive())
+
+    def test_view_digest(self):
+        """Test that the incrementally maintained view digest matches the digest of the whole view, and that
+        merging is skipped once members' views are identical"""
+        self._create_harness(n_members=10)
+        for member in self.members:
+            member.start()
+        while not self._all_alive():
+            self.do_tick()
+        for _ in range(10):
+            self.do_tick()
+        for member in self.members:
+            expected_digest = 0
+            for state, entries in member.membership_view().items():
+                for member_id, incarnation in entries:
+                    expected_digest ^= dissemination.view_entry_digest(member_id, incarnation, state)
+            self.assertEqual(member.view_digest, expected_digest)
+            self.assertEqual(member.view_digest, self.members[0].view_digest)
+        # In the steady state, merging every received message's piggyback data is skipped
+        merges_skipped = sum(member.merges_skipped for member in self.members)
+        received_messages = self.transport.received_messages
+        self.do_tick()
+        self.assertEqual(sum(member.merges_skipped for member in self.members) - merges_skipped,
+                         self.transport.received_messages - received_messages)
+
+        # A change to any member's view changes its digest
+        node_a = self.members[0]
+        digest = node_a.view_digest
+        node_a.locally_disseminate({"dead": [("B", 1)]})
+        self.assertNotEqual(node_a.view_digest, digest)
 
     def _ticks_until_state_converged(
             self,
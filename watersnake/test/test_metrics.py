@@ -0,0 +1,129 @@
+""" Unit tests for watersnake metrics module. """
+# Disable 'Line too long'                   pylint: disable=C0301
+
+import os
+import tempfile
+
+# Related third party imports
+import twisted.trial.unittest
+from twisted.internet import defer, protocol, reactor
+
+import watersnake.membership as membership
+import watersnake.metrics as metrics
+import watersnake.metricsexport as metricsexport
+import watersnake.swimprotocol as swimprotocol
+import watersnake.swimtransport as swimtransport
+
+
+class _Scraper(protocol.Protocol):
+    """Reads everything the metrics server writes"""
+    def __init__(self):
+        self.received = []
+        self.done = defer.Deferred()
+
+    def dataReceived(self, data):
+        self.received.append(data)
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        self.done.callback("".join(self.received))
+
+
+class TestMetrics(twisted.trial.unittest.TestCase):
+    """
+    Tests the Watersnake metrics registry and its instrumentation
+    """
+    timeout = 60
+
+    def test_registry(self):
+        """Test that counters, gauges and histograms are snapshotted and rendered as Prometheus text"""
+        registry = metrics.MetricsRegistry()
+        sent = registry.counter("sent_total", "Things sent", ("type",))
+        sent.labels("ping").inc()
+        sent.labels("ping").inc(2)
+        sent.labels("ack").inc()
+        registry.gauge("members", "Members", function=lambda: 7).labels()
+        latency = registry.histogram("latency_seconds", "Latency", (0.1, 1.0)).labels()
+        for value in (0.05, 0.1, 0.5, 5.0):
+            latency.observe(value)
+        self.assertTrue(registry.counter("sent_total", "Things sent", ("type",)) is sent)
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot["watersnake_sent_total"]["samples"], {("ping",): 3, ("ack",): 1})
+        self.assertEqual(snapshot["watersnake_members"]["samples"], {(): 7})
+        self.assertEqual(snapshot["watersnake_latency_seconds"]["samples"][()]["buckets"], [(0.1, 2), (1.0, 3), (float("inf"), 4)])
+        self.assertEqual(snapshot["watersnake_latency_seconds"]["samples"][()]["count"], 4)
+        text = registry.to_prometheus_text().splitlines()
+        self.assertTrue("# TYPE watersnake_sent_total counter" in text)
+        self.assertTrue('watersnake_sent_total{type="ping"} 3' in text)
+        self.assertTrue("watersnake_members 7" in text)
+        self.assertTrue('watersnake_latency_seconds_bucket{le="+Inf"} 4' in text)
+        self.assertTrue("watersnake_latency_seconds_sum 5.65" in text)
+        self.assertTrue("watersnake_latency_seconds_count 4" in text)
+
+    def test_write_prometheus_file(self):
+        """Test that metrics can be exported to a file"""
+        registry = metrics.MetricsRegistry()
+        registry.counter("sent_total", "Things sent").labels().inc(5)
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "watersnake.prom")
+        registry.write_prometheus_file(path)
+        with open(path) as prom_file:
+            self.assertEqual(prom_file.read(), registry.to_prometheus_text())
+        self.assertEqual(os.listdir(directory), ["watersnake.prom"])
+
+    def test_group_instrumentation(self):
+        """Test that members and transports record message, probe, piggyback and tick metrics"""
+        registry = metrics.MetricsRegistry()
+        transport = swimtransport.LoopbackMessageTransport()
+        transport.enable_metrics(registry)
+        router = swimtransport.MessageRouter(transport)
+        member_ids = ["A", "B", "C", "D"]
+        members = [
+            membership.Membership(
+                member_id,
+                [membership.RemoteMember(x) for x in member_ids if x != member_id],
+                router,
+                metrics_registry=registry
+            )
+            for member_id in member_ids
+        ]
+        transport.simulate_partition_between("A", "D")
+        for member in members:
+            member.start()
+        for tick in range(12):
+            for member in members:
+                member.tick(tick * swimprotocol.SWIM.T)
+        samples = dict((name, family["samples"]) for name, family in registry.snapshot().items())
+        self.assertEqual(sum(samples["watersnake_messages_sent_total"].values()), transport.sent_messages)
+        self.assertEqual(sum(samples["watersnake_message_bytes_received_total"].values()), transport.received_bytes)
+        self.assertEqual(samples["watersnake_encode_seconds"][("ping",)]["count"], samples["watersnake_messages_sent_total"][("ping",)])
+        self.assertEqual(samples["watersnake_tick_seconds"][()]["count"], 12 * len(members))
+        outcomes = samples["watersnake_probe_outcomes_total"]
+        self.assertTrue(outcomes[("ack",)] > 0)
+        self.assertTrue(outcomes[("indirect_ack",)] > 0)  # D's acks to A are lost
+        self.assertEqual(samples["watersnake_probe_rtt_seconds"][("direct",)]["count"], outcomes[("ack",)])
+        self.assertEqual(samples["watersnake_piggyback_entries"][()]["count"], transport.sent_messages)
+
+    def test_disabled_by_default(self):
+        """Test that nothing is recorded unless a registry is supplied"""
+        transport = swimtransport.LoopbackMessageTransport()
+        router = swimtransport.MessageRouter(transport)
+        members = [membership.Membership(member_id, [membership.RemoteMember(x) for x in "AB" if x != member_id], router) for member_id in "AB"]
+        for member in members:
+            member.start()
+        for member in members:
+            member.tick(0)
+        self.assertTrue(transport.metrics is None)
+        self.assertTrue(all(member.metrics is None for member in members))
+
+    def test_listen_tcp(self):
+        """Test that metrics can be scraped from a socket"""
+        registry = metrics.MetricsRegistry()
+        registry.counter("sent_total", "Things sent").labels().inc(3)
+        port = metricsexport.listen_tcp(registry, reactor)
+        self.addCleanup(port.stopListening)
+        scraper = _Scraper()
+        factory = protocol.ClientFactory()
+        factory.protocol = lambda: scraper
+        reactor.connectTCP("127.0.0.1", port.getHost().port, factory)
+        scraper.done.addCallback(self.assertEqual, registry.to_prometheus_text())
+        return scraper.done
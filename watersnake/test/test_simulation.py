@@ -0,0 +1,146 @@
+""" Unit tests for watersnake simulation module. """
+# Disable 'Line too long'                   pylint: disable=C0301
+
+import os
+import random
+
+# Related third party imports
+import twisted.trial.unittest
+
+import watersnake.simulation as simulation
+
+
+def count_wrong_views(simulator):
+    """Count the live members' views of the others which aren't the truth, the slow way"""
+    failed = simulator.failed_member_ids
+    wrong_views = 0
+    for member in simulator.members:
+        if member.member_id in failed:
+            continue
+        for remote_member in member.expected_remote_members:
+            if remote_member.remote_member_id in failed:
+                wrong_views += remote_member.state not in ("dead", "left")
+            else:
+                wrong_views += remote_member.state != "alive"
+    return wrong_views
+
+
+class TestClusterSimulator(twisted.trial.unittest.TestCase):
+    """
+    Tests the Watersnake discrete-event cluster simulator
+    """
+
+    def test_event_loop_ordering(self):
+        """Test that events run in virtual time order, including those scheduled while running"""
+        event_loop = simulation.EventLoop()
+        fired = []
+        event_loop.call_at(2.0, lambda: fired.append(("b", event_loop.now)))
+        event_loop.call_at(1.0, lambda: event_loop.call_at(1.5, lambda: fired.append(("c", event_loop.now))))
+        event_loop.call_at(5.0, lambda: fired.append(("d", event_loop.now)))
+        self.assertEqual(event_loop.run_until(3.0), 3)
+        self.assertEqual(fired, [("c", 1.5), ("b", 2.0)])
+        self.assertEqual(event_loop.now, 3.0)
+        self.assertEqual(len(event_loop), 1)
+
+    def test_converges_with_latency(self):
+        """Test that a simulated group converges, reproducibly for a given seed"""
+        reports = []
+        for _ in range(2):
+            simulator = simulation.ClusterSimulator(30, latency=simulation.uniform_latency(0.001, 0.05), seed=7)
+            self.assertTrue(simulator.run_until_converged(max_periods=50) is not None)
+            simulator.run(10)
+            reports.append(simulator.report())
+        self.assertEqual(reports[0], reports[1])
+        self.assertEqual(reports[0]["false_suspicions"], 0)
+        self.assertEqual(reports[0]["false_deaths"], 0)
+        self.assertTrue(reports[0]["bytes_per_member_per_period"] > 0)
+
+    def test_probe_timeout_between_ticks(self):
+        """Test that a member's RTT-based probe timeouts take effect when they expire, rather than at its next tick"""
+        simulator = simulation.ClusterSimulator(2, latency=simulation.constant_latency(0.01), seed=1)
+        self.assertTrue(simulator.run_until_converged(max_periods=50) is not None)
+        member = simulator.members[0]
+        ticks = []
+        tick = member.tick
+
+        def record_tick(time_now):
+            """Note when member ticks"""
+            ticks.append(time_now)
+            tick(time_now)
+        member.tick = record_tick
+        suspected = []
+        member.subscribe(lambda events: suspected.extend(simulator.event_loop.now for event in events if event.state == "suspect"))
+        simulator.fail_member("m1")
+        simulator.run(3)
+        self.assertTrue(suspected)
+        since_tick = suspected[0] - max(t for t in ticks if t <= suspected[0])
+        self.assertTrue(0 < since_tick < simulator.period / 2, since_tick)
+
+    def test_packet_loss_and_failure(self):
+        """Test that a failed member is detected by everyone despite packet loss, without false deaths"""
+        simulator = simulation.ClusterSimulator(30, latency=simulation.exponential_latency(0.01, 0.001), loss_rate=0.05, seed=3)
+        self.assertTrue(simulator.run_until_converged(max_periods=50) is not None)
+        simulator.fail_member("m0")
+        self.assertTrue(simulator.run_until_converged(max_periods=50) is not None)
+        report = simulator.report()
+        self.assertTrue(report["messages_lost"] > 0)
+        self.assertEqual(report["false_deaths"], 0)
+        for member in simulator.members[1:]:
+            self.assertEqual(member._remote_member_from_id("m0").state, "dead")
+
+    def test_convergence_tracking(self):
+        """Test that the count of wrong views kept up to date as members' views change matches their views, through failures and restarts, and that the simulator leaves the global random module alone"""
+        random_state = random.getstate()
+        state_dir = self.mktemp()
+        os.mkdir(state_dir)
+        simulator = simulation.ClusterSimulator(20, latency=simulation.uniform_latency(0.001, 0.05), loss_rate=0.02, seed=11, state_dir=state_dir)
+        self.assertEqual(simulator.wrong_views, 20 * 19)
+        for step in range(30):
+            simulator.run(1)
+            self.assertEqual(simulator.wrong_views, count_wrong_views(simulator))
+            self.assertEqual(simulator.converged(), simulator.wrong_views == 0)
+            if step in (10, 12):
+                simulator.fail_member("m%s" % step)
+            elif step in (16, 20):
+                simulator.restart_member("m%s" % (step - 6))
+            self.assertEqual(simulator.wrong_views, count_wrong_views(simulator))
+        self.assertTrue(simulator.run_until_converged(max_periods=50) is not None)
+        self.assertEqual(count_wrong_views(simulator), 0)
+        self.assertEqual(random.getstate(), random_state)
+
+    def test_rolling_restart_from_state_files(self):
+        """Test that members restarted from their state files rejoin the group at a higher incarnation and it reconverges sooner than from scratch"""
+        periods = {}
+        for warm in (False, True):
+            state_dir = None
+            if warm:
+                state_dir = self.mktemp()
+                os.mkdir(state_dir)
+            simulator = simulation.ClusterSimulator(20, seed=5, state_dir=state_dir)
+            self.assertTrue(simulator.run_until_converged(max_periods=50) is not None)
+            periods[warm] = 0
+            for member_id in simulator.member_ids[:3]:
+                incarnation = simulator.members[simulator.member_ids.index(member_id)].incarnation_number
+                simulator.fail_member(member_id)
+                simulator.run(3)
+                member = simulator.restart_member(member_id)
+                if warm:
+                    self.assertTrue(member.incarnation_number > incarnation)
+                else:
+                    self.assertEqual(member.incarnation_number, 1)
+                periods[warm] += simulator.run_until_converged(max_periods=50)
+            self.assertEqual(simulator.report()["false_deaths"], 0)
+        self.assertTrue(periods[True] < periods[False], periods)
+
+    def test_zone_aware_probing(self):
+        """Test that with zone-aware probing members send less traffic between zones, and still detect a failure"""
+        cross_zone_shares = []
+        for zone_aware_probing in (None, {}):
+            simulator = simulation.ClusterSimulator(30, seed=2, n_zones=3, cross_zone_latency=simulation.constant_latency(0.02), zone_aware_probing=zone_aware_probing)
+            self.assertTrue(simulator.run_until_converged(max_periods=50) is not None)
+            simulator.run(10)
+            cross_zone_shares.append(float(simulator.transport.cross_zone_bytes) / simulator.transport.sent_bytes)
+            simulator.fail_member("m4")
+            self.assertTrue(simulator.run_until_converged(max_periods=50) is not None)
+            self.assertEqual(simulator.report()["false_deaths"], 0)
+        self.assertTrue(cross_zone_shares[1] < cross_zone_shares[0] / 2, cross_zone_shares)
@@ -0,0 +1,129 @@
+""" Unit tests for watersnake statefile module. """
+# Disable 'Line too long'                   pylint: disable=C0301
+
+import os
+
+# Related third party imports
+import twisted.trial.unittest
+from twisted.internet import task
+
+import watersnake.dissemination as dissemination
+import watersnake.membership as membership
+import watersnake.statefile as statefile
+import watersnake.swimtransport as swimtransport
+import watersnake.udptransport as udptransport
+
+
+def create_member(member_id, remote_member_ids):
+    """A Membership expecting remote_member_ids, on a transport of its own"""
+    router = swimtransport.MessageRouter(swimtransport.MessageTransport())
+    return membership.Membership(
+        member_id,
+        [membership.RemoteMember(x) for x in remote_member_ids],
+        router
+    )
+
+
+class TestStateFile(twisted.trial.unittest.TestCase):
+    """
+    Tests the Watersnake warm restart state file
+    """
+
+    def test_encode_decode(self):
+        """Test that state round trips through a file, and that corrupt or truncated state is rejected"""
+        members = [("a", 3, membership.STATE_ALIVE), (u"b\xe9", 0, membership.STATE_DEAD), ("c", 2 ** 40, membership.STATE_LEFT)]
+        data = statefile.encode_state("me", 7, members)
+        self.assertEqual(statefile.decode_state(data), ("me", 7, members))
+        self.assertEqual(statefile.decode_state(statefile.encode_state(u"me", 1, [])), ("me", 1, []))
+        path = self.mktemp()
+        self.assertEqual(statefile.read_state(path), None)
+        statefile.write_state(path, data)
+        self.assertEqual(statefile.read_state(path), ("me", 7, members))
+        self.assertEqual(os.listdir(os.path.dirname(os.path.abspath(path))), [os.path.basename(path)])
+        corrupt = bytearray(data)
+        corrupt[-10] ^= 1
+        for buff in [bytes(corrupt), data[:-1], data[:10], b""]:
+            self.assertRaises(ValueError, statefile.decode_state, buff)
+
+    def test_background_writer(self):
+        """Test that the background writer writes the latest state submitted before it's closed"""
+        path = self.mktemp()
+        writer = statefile.StateFileWriter(path)
+        for incarnation in range(1, 20):
+            writer.submit(statefile.encode_state("me", incarnation, []))
+        writer.close()
+        self.assertTrue(1 <= writer.writes <= 19)
+        self.assertEqual(statefile.read_state(path).incarnation, 19)
+
+    def test_warm_restart(self):
+        """Test that a restarted member takes an incarnation beyond its lease, renewed only as its incarnation passes it, and is seeded with its last view of the group"""
+        path = self.mktemp()
+        member = create_member("A", ["B", "C", "D"])
+        self.assertEqual(member.enable_state_file(path, background=False, incarnation_lease=4), None)
+        member.start()
+        member._remote_member_from_id("B").node_alive()
+        member.tick(1.0)
+        self.assertEqual(statefile.read_state(path), ("A", 5, []))
+        member.tick(member.state_save_interval)
+        self.assertEqual(len(statefile.read_state(path).members), 1)
+        member.locally_disseminate({"alive": [["C", 4], ["E", 2]], "dead": [["D", 3]]})
+        member.locally_disseminate({"suspect": [["A", 4]]})
+        self.assertEqual(member.incarnation_number, 5)
+        self.assertEqual(statefile.read_state(path).incarnation, 5)
+        member.locally_disseminate({"suspect": [["A", 5]]})
+        self.assertEqual(member.incarnation_number, 6)
+        saved = statefile.read_state(path)
+        self.assertEqual((saved.incarnation, len(saved.members)), (10, 4))
+
+        restarted = create_member("A", ["B", "C", "F"])
+        saved = restarted.enable_state_file(path, background=False, incarnation_lease=4)
+        restarted.start()
+        self.assertEqual((saved.member_id, saved.incarnation), ("A", 10))
+        self.assertEqual(restarted.incarnation_number, 11)
+        self.assertEqual(statefile.read_state(path).incarnation, 15)
+        self.assertEqual(
+            dict((x.remote_member_id, (x.state, x.incarnation_number)) for x in restarted.expected_remote_members),
+            {"B": ("alive", 0), "C": ("alive", 4), "D": ("dead", 3), "E": ("alive", 2), "F": ("unknown", 0)}
+        )
+        self.assertEqual((restarted.count("alive"), restarted.count("dead"), restarted.count("unknown")), (3, 1, 1))
+        self.assertEqual(len(restarted.dissemination_buffer), 0)
+        view_digest = dissemination.view_entry_digest("A", 11, "alive")
+        for remote_member in restarted.expected_remote_members:
+            view_digest ^= dissemination.view_entry_digest(remote_member.remote_member_id, remote_member.incarnation_number, remote_member.state)
+        self.assertEqual(restarted.view_digest, view_digest)
+
+    def test_close(self):
+        """Test that incarnation changes within the lease aren't waited for, that the lease is written before an incarnation beyond it is taken, and that stopping a member's ticker closes it, writing its final state and stopping the writer thread"""
+        path = self.mktemp()
+        member = create_member("A", ["B", "C"])
+        member.enable_state_file(path, save_interval=1000.0, incarnation_lease=2)
+        writer = member._state_writer
+        ticker = udptransport.MembershipTicker(member, task.Clock())
+        member.start()
+        ticker.start()
+        self.assertEqual((statefile.read_state(path).incarnation, writer.writes), (3, 1))
+        member.locally_disseminate({"suspect": [["A", 1]]})
+        member.locally_disseminate({"suspect": [["A", 2]]})
+        self.assertEqual((member.incarnation_number, writer.writes), (3, 1))
+        member.locally_disseminate({"suspect": [["A", 3]]})
+        self.assertEqual(member.incarnation_number, 4)
+        self.assertEqual((statefile.read_state(path).incarnation, writer.writes), (6, 2))
+        member.locally_disseminate({"alive": [["B", 2]]})
+        ticker.stop()
+        self.assertEqual(statefile.read_state(path), ("A", 6, [("B", 2, membership.STATE_ALIVE)]))
+        self.assertFalse(writer._thread.is_alive())
+        self.assertEqual(member.state_file, None)
+        member.close()
+
+    def test_restore_into_hash_ring(self):
+        """Test that members restored from a state file are added to a hash ring enabled beforehand, which stays live"""
+        path = self.mktemp()
+        statefile.write_state(path, statefile.encode_state("A", 3, [("B", 2, membership.STATE_ALIVE), ("C", 1, membership.STATE_DEAD), ("E", 1, membership.STATE_SUSPECT)]))
+        member = create_member("A", ["B", "C", "D"])
+        ring = member.enable_hash_ring(vnodes=10)
+        member.enable_state_file(path, background=False)
+        member.start()
+        self.assertTrue(ring is member.hash_ring)
+        self.assertEqual(sorted(member_id for member_id in ["A", "B", "C", "D", "E"] if member_id in ring), ["A", "B", "E"])
+        member._remote_member_from_id("D").node_alive()
+        self.assertTrue("D" in ring)
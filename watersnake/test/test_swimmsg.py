@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+""" Unit tests for watersnake swimmsg module wire formats. """
+# Disable 'Line too long'                   pylint: disable=C0301
+
+import random
+
+# Related third party imports
+import twisted.trial.unittest
+
+import watersnake.swimmsg as swimmsg
+
+SERIALISERS = [swimmsg.SWIMJSONMessageSerialiser, swimmsg.SWIMBinaryMessageSerialiser]
+
+
+def random_member_id(rand):
+    """Generate a random (possibly non-ascii) member id"""
+    alphabet = u"abcdefghijklmnopqrstuvwxyz0123456789:.-_é世"
+    return u"".join(rand.choice(alphabet) for _ in range(rand.randint(1, 24)))
+
+
+def random_message(rand):
+    """Generate a random, valid SWIMMessage"""
+    member_ids = [random_member_id(rand) for _ in range(rand.randint(1, 12))]
+    meta_data = rand.choice([
+        None,
+        {u"requested_by_member_id": rand.choice(member_ids), u"member_id_to_ping": rand.choice(member_ids)},
+        {u"meta": rand.randint(-5, 5), u"data": [random_member_id(rand)]},
+    ])
+    piggyback_data = None
+    if rand.random() < 0.8:
+        piggyback_data = {}
+        for state in [u"alive", u"dead"]:
+            if rand.random() < 0.8:
+                piggyback_data[state] = [[rand.choice(member_ids), rand.choice([0, 1, 127, 128, rand.randint(0, 2 ** 40)])]
+                                         for _ in range(rand.randint(0, 10))]
+        if rand.random() < 0.5:
+            piggyback_data[u"digest"] = rand.randint(0, 2 ** 64 - 1)
+        if rand.random() < 0.2:
+            piggyback_data[u"other"] = {u"digest": rand.randint(0, 2 ** 31)}
+    return swimmsg.SWIMMessage(rand.choice(swimmsg.SWIMMessage.MESSAGE_NAMES), meta_data, piggyback_data)
+
+
+class TestSWIMMessageWireFormats(twisted.trial.unittest.TestCase):
+    """
+    Tests the Watersnake message serialisers
+    """
+
+    def test_round_trip(self):
+        """Test each serialiser round trips the messages the protocol sends"""
+        messages = [
+            swimmsg.ping(),
+            swimmsg.ack(meta_data={"requested_by_member_id": "A", "member_id_to_ping": "C"}),
+            swimmsg.ping_req("A", "B", piggyback_data={"alive": [["A", 1], ["B", 3]], "dead": []}),
+            swimmsg.ping_req_ack("A", "B", piggyback_data={"alive": [["C", 300]], "dead": [["D", 2]]}),
+            swimmsg.test(meta_data={"meta": "data"}, piggyback_data={"piggyback": "data"}),
+        ]
+        for serialiser in SERIALISERS:
+            for message in messages:
+                decoded = serialiser.from_buffer(serialiser.to_buffer(message))
+                self.assertEqual(message, decoded)
+                self.assertEqual(message, swimmsg.from_buffer(serialiser.to_buffer(message)))
+
+    def test_fuzz_round_trip(self):
+        """Test binary serialisation round trips random messages exactly as JSON does"""
+        rand = random.Random(1234)
+        for _ in range(2000):
+            message = random_message(rand)
+            via_json = swimmsg.SWIMJSONMessageSerialiser.from_buffer(swimmsg.SWIMJSONMessageSerialiser.to_buffer(message))
+            via_binary = swimmsg.SWIMBinaryMessageSerialiser.from_buffer(swimmsg.SWIMBinaryMessageSerialiser.to_buffer(message))
+            self.assertEqual(via_json, via_binary)
+            self.assertEqual(message, via_binary)
+
+    def test_fuzz_corrupt_buffers(self):
+        """Test that truncated or corrupted binary buffers only ever raise SWIMDeserialisationException"""
+        rand = random.Random(4321)
+        for _ in range(2000):
+            buff = bytearray(swimmsg.SWIMBinaryMessageSerialiser.to_buffer(random_message(rand)))
+            if rand.random() < 0.5:
+                buff = buff[:rand.randint(0, len(buff) - 1)]
+            else:
+                buff[rand.randint(0, len(buff) - 1)] = rand.randint(0, 255)
+            try:
+                swimmsg.from_buffer(str(buff))
+            except swimmsg.SWIMDeserialisationException:
+                pass
+
+    def test_binary_is_smaller(self):
+        """Test that the binary encoding of typical protocol traffic is much smaller than JSON"""
+        message = swimmsg.ping_req("member-a", "member-b",
+                                   piggyback_data={"alive": [["member-%s" % n, n] for n in range(20)], "dead": []})
+        self.assertLess(len(swimmsg.SWIMBinaryMessageSerialiser.to_buffer(message)),
+                        len(swimmsg.SWIMJSONMessageSerialiser.to_buffer(message)) * 2 / 3)
+
+    def test_unsupported_version(self):
+        """Test that a binary message from a future version of the codec is rejected"""
+        buff = bytearray(swimmsg.SWIMBinaryMessageSerialiser.to_buffer(swimmsg.ping()))
+        buff[1] = swimmsg.SWIMBinaryMessageSerialiser.VERSION + 1
+        self.assertRaises(swimmsg.SWIMDeserialisationException, swimmsg.from_buffer, str(buff))
+
+    def test_compound_round_trip(self):
+        """Test that several serialised messages can be packed into, and recovered from, one buffer"""
+        buffers = [swimmsg.SWIMBinaryMessageSerialiser.to_buffer(swimmsg.ping()),
+                   swimmsg.SWIMJSONMessageSerialiser.to_buffer(swimmsg.ack()),
+                   "x" * 300]
+        compound = swimmsg.to_compound_buffer(buffers)
+        self.assertTrue(swimmsg.is_compound(compound))
+        self.assertFalse(any(swimmsg.is_compound(buff) for buff in buffers))
+        self.assertEqual(len(compound), 2 + sum(swimmsg.compound_entry_size(buff) for buff in buffers))
+        self.assertEqual(swimmsg.split_compound_buffer(compound), buffers)
+        self.assertRaises(swimmsg.SWIMDeserialisationException, swimmsg.split_compound_buffer, compound[:-1])
+        self.assertRaises(swimmsg.SWIMDeserialisationException, swimmsg.split_compound_buffer, compound + "x")
+
+    def test_merge_piggyback_data(self):
+        """Test that merged piggyback data carries each update once, at its highest incarnation"""
+        merged = swimmsg.merge_piggyback_data([
+            {"alive": [("A", 1), ("B", 2)], "dead": [], "digest": 1},
+            {"alive": [("A", 3), ("B", 1)], "suspect": [("C", 1)], "digest": 2},
+        ])
+        self.assertEqual(sorted(merged["alive"]), [["A", 3], ["B", 2]])
+        self.assertEqual(merged["suspect"], [("C", 1)])
+        self.assertEqual(merged["dead"], [])
+        self.assertEqual(merged["digest"], 2)
+        self.assertTrue(isinstance(merged, swimmsg.PiggybackData))
+        shared = swimmsg.PiggybackData({"alive": [("A", 1)], "digest": 1})
+        self.assertTrue(swimmsg.merge_piggyback_data([shared, shared, shared]) is shared)
+
+    def test_reused_piggyback_encoding(self):
+        """Test that messages sharing PiggybackData encode exactly as if each had its own copy, and that it's encoded once per serialiser"""
+        rand = random.Random(2468)
+        for serialiser in SERIALISERS:
+            for _ in range(200):
+                shared = random_message(rand).piggyback_data
+                if shared is not None:
+                    shared = swimmsg.PiggybackData(shared)
+                for _ in range(3):
+                    message = random_message(rand)
+                    message.piggyback_data = shared
+                    decoded = serialiser.from_buffer(serialiser.to_buffer(message))
+                    self.assertEqual(message, decoded)
+                    message.piggyback_data = None
+                    self.assertEqual(message, serialiser.from_buffer(serialiser.to_buffer(message)))
+                if shared is not None:
+                    self.assertEqual(shared.encodings.keys(), [serialiser])
+
+    def test_lazy_piggyback_decoding(self):
+        """Test that messages are decoded from memoryviews, and that binary piggyback data is only decoded when it's accessed"""
+        rand = random.Random(1357)
+        for _ in range(500):
+            message = random_message(rand)
+            for serialiser in SERIALISERS:
+                view = memoryview(bytearray(serialiser.to_buffer(message)))
+                decoded = swimmsg.from_buffer(view)
+                view[:] = "\0" * len(view)  # e.g. the receive buffer being reused
+                self.assertEqual(decoded.has_piggyback_data, bool(message.piggyback_data))
+                self.assertEqual(decoded.piggyback_digest, (message.piggyback_data or {}).get(u"digest"))
+                if serialiser is swimmsg.SWIMBinaryMessageSerialiser and message.piggyback_data:
+                    self.assertTrue(decoded._undecoded is not None)
+                self.assertEqual(message, decoded)
+        compound = swimmsg.to_compound_buffer([swimmsg.SWIMBinaryMessageSerialiser.to_buffer(message)])
+        (part,) = swimmsg.split_compound_buffer(memoryview(compound))
+        self.assertTrue(isinstance(part, memoryview))
+        self.assertEqual(message, swimmsg.from_buffer(part))
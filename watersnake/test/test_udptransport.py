@@ -0,0 +1,204 @@
+""" Unit tests for watersnake udptransport module. """
+# Disable 'Line too long'                   pylint: disable=C0301
+
+# Related third party imports
+import twisted.trial.unittest
+from twisted.internet import defer, reactor, task
+
+import watersnake.batchio as batchio
+import watersnake.membership as membership
+import watersnake.scheduler as scheduler
+import watersnake.swimmsg as swimmsg
+import watersnake.swimtransport as swimtransport
+import watersnake.udptransport as udptransport
+
+
+class TestUDPMessageTransport(twisted.trial.unittest.TestCase):
+    """
+    Tests the Watersnake UDP transport on localhost
+    """
+    timeout = 60
+
+    def setUp(self):
+        self.ports = []
+        self.tickers = []
+
+    def tearDown(self):
+        for ticker in self.tickers:
+            ticker.stop()
+        return defer.gatherResults([port.stopListening() for port in self.ports])
+
+    def _create_cluster(self, n_members, serialiser=swimmsg.SWIMJSONMessageSerialiser, batching=False, use_mmsg=None):
+        """ Create n Membership objects in this process, each with its own UDP socket on localhost """
+        address_book = {}
+        member_ids = ["member-%s" % n for n in range(n_members)]
+        members = []
+        for member_id in member_ids:
+            transport = udptransport.UDPMessageTransport(address_book, serialiser)
+            router = swimtransport.MessageRouter(transport)
+            if batching:
+                transport.enable_batching(use_mmsg)
+            self.ports.append(transport.listen(reactor))
+            address_book[member_id] = transport.local_address()
+            members.append(membership.Membership(
+                member_id,
+                [membership.RemoteMember(x) for x in member_ids if x != member_id],
+                router
+            ))
+        return members
+
+    def _create_shared_cluster(self, n_transports, members_per_transport):
+        """ Create Membership objects in this process, members_per_transport of them sharing each UDP socket on localhost """
+        address_book = {}
+        member_ids = ["member-%s" % n for n in range(n_transports * members_per_transport)]
+        members = []
+        for n in range(n_transports):
+            transport = udptransport.UDPMessageTransport(address_book, swimmsg.SWIMBinaryMessageSerialiser)
+            router = swimtransport.MessageRouter(transport)
+            self.ports.append(transport.listen(reactor))
+            for member_id in member_ids[n * members_per_transport:(n + 1) * members_per_transport]:
+                members.append(membership.Membership(
+                    member_id,
+                    [membership.RemoteMember(x) for x in member_ids if x != member_id],
+                    router
+                ))
+            address_book.update(transport.local_member_addresses())
+        return members
+
+    @defer.inlineCallbacks
+    def _wait_until(self, condition, period=0.05):
+        """ Poll until condition() is true """
+        while not condition():
+            yield task.deferLater(reactor, period, lambda: None)
+
+    def test_probe_timeout_between_ticks(self):
+        """Test that a probe timeout derived from round trip times, much shorter than the protocol period, is acted on when it expires rather than at the next tick"""
+        clock = task.Clock()
+        member = membership.Membership("A", [membership.RemoteMember("B")], swimtransport.MessageRouter(swimtransport.MessageTransport()))
+        ticker = udptransport.MembershipTicker(member, clock, period=1.0)
+        self.tickers.append(ticker)
+        member.start()
+        remote_member = member._remote_member_from_id("B")
+        remote_member.node_alive()
+        for _ in range(8):
+            remote_member.rtt_estimator.add_sample(0.02)
+        ticker.start()
+        timeout = remote_member.probe_timeout()
+        self.assertTrue(3 * timeout < ticker.period)
+        clock.advance(ticker.period)
+        self.assertEqual(remote_member.failure_detection_transaction.state, "ping_sent")
+        clock.advance(timeout + 2 * scheduler.DEADLINE_SLACK)
+        self.assertEqual(remote_member.failure_detection_transaction.state, "ping_req_sent")
+        clock.advance(timeout)
+        self.assertEqual(remote_member.state, "suspect")
+        self.assertTrue(clock.seconds() < 2 * ticker.period)
+        self.assertEqual(member.rtt_estimates().keys(), ["B"])
+
+    def test_frame_round_trip(self):
+        """Test datagram framing and that bad frames are rejected"""
+        frame = udptransport.encode_frame(u"A", "B", "payload")
+        self.assertEqual(udptransport.decode_frame(frame), (u"A", u"B", "payload"))
+        self.assertRaises(udptransport.SWIMFramingException, udptransport.decode_frame, frame[:4])
+        self.assertRaises(udptransport.SWIMFramingException, udptransport.decode_frame, "\x02" + frame[1:])
+
+    @defer.inlineCallbacks
+    def test_udp_cluster_converges(self):
+        """Test that a cluster of members on localhost sockets converges"""
+        members = self._create_cluster(20, swimmsg.SWIMBinaryMessageSerialiser)
+        for member in members:
+            member.start()
+            ticker = udptransport.MembershipTicker(member, reactor, period=0.02)
+            ticker.start()
+            self.tickers.append(ticker)
+        yield self._wait_until(lambda: all(
+            all(remote_member.state == "alive" for remote_member in member.expected_remote_members)
+            for member in members
+        ))
+        self.assertTrue(all(member.received_messages > 0 for member in members))
+
+    @defer.inlineCallbacks
+    def test_udp_cluster_converges_coalesced(self):
+        """Test that a cluster of members coalescing the messages they send converges"""
+        members = self._create_cluster(20, swimmsg.SWIMBinaryMessageSerialiser)
+        for member in members:
+            member.messagerouter.transport.enable_coalescing()
+            member.start()
+            ticker = udptransport.MembershipTicker(member, reactor, period=0.02)
+            ticker.start()
+            self.tickers.append(ticker)
+        yield self._wait_until(lambda: all(
+            all(remote_member.state == "alive" for remote_member in member.expected_remote_members)
+            for member in members
+        ))
+        self.assertTrue(all(member.messagerouter.transport.sent_frames > 0 for member in members))
+
+    @defer.inlineCallbacks
+    def _check_batched_cluster_converges(self, use_mmsg):
+        """ Check that a cluster of members batching their socket I/O converges """
+        members = self._create_cluster(20, swimmsg.SWIMBinaryMessageSerialiser, batching=True, use_mmsg=use_mmsg)
+        for member in members:
+            member.start()
+            ticker = udptransport.MembershipTicker(member, reactor, period=0.02)
+            ticker.start()
+            self.tickers.append(ticker)
+        yield self._wait_until(lambda: all(
+            all(remote_member.state == "alive" for remote_member in member.expected_remote_members)
+            for member in members
+        ))
+        senders = [port.sender for port in self.ports]
+        self.assertTrue(all(sender.use_mmsg == (use_mmsg is not False and batchio.HAVE_MMSG) for sender in senders))
+        self.assertTrue(all(0 < sender.syscalls <= member.messagerouter.transport.sent_frames for sender, member in zip(senders, members)))
+
+    def test_udp_cluster_converges_batched(self):
+        """Test that a cluster of members batching their socket I/O (with sendmmsg/recvmmsg if available) converges"""
+        return self._check_batched_cluster_converges(None)
+
+    def test_udp_cluster_converges_batched_fallback(self):
+        """Test that a cluster of members batching their socket I/O without sendmmsg/recvmmsg converges"""
+        return self._check_batched_cluster_converges(False)
+
+    @defer.inlineCallbacks
+    def test_shared_socket_cluster_converges(self):
+        """Test that a cluster of members sharing sockets converges, with messages between members sharing a socket delivered without serialisation"""
+        members = self._create_shared_cluster(2, 10)
+        for member in members:
+            member.start()
+            ticker = udptransport.MembershipTicker(member, reactor, period=0.02)
+            ticker.start()
+            self.tickers.append(ticker)
+        yield self._wait_until(lambda: all(
+            all(remote_member.state == "alive" for remote_member in member.expected_remote_members)
+            for member in members
+        ))
+        routers = set(member.messagerouter for member in members)
+        self.assertEqual(len(routers), 2)
+        for router in routers:
+            self.assertEqual(len(router.members), 10)
+            self.assertTrue(router.local_messages > 0)
+            self.assertTrue(router.transport.received_messages > 0)
+            self.assertEqual(router.transport.dropped_messages, 0)
+
+    def test_local_delivery_skips_serialisation(self):
+        """Test that a message between members sharing a transport is handed straight to the recipient"""
+        transport = udptransport.UDPMessageTransport(serialiser=swimmsg.SWIMBinaryMessageSerialiser)
+        router = swimtransport.MessageRouter(transport)
+        node_a, node_b = [membership.Membership(member_id, [membership.RemoteMember(x) for x in "AB" if x != member_id], router) for member_id in "AB"]
+        for member in [node_a, node_b]:
+            member.start()
+        message = swimmsg.test(meta_data={"meta": "data"})
+        node_a.send_message_to_member_id(message, "B")
+        self.assertTrue(node_b.last_received_message is message)
+        self.assertEqual(router.local_messages, 1)
+        self.assertEqual((transport.sent_messages, transport.dropped_messages), (0, 0))
+
+    @defer.inlineCallbacks
+    def test_learns_unknown_sender_address(self):
+        """Test that replies can be sent to a member whose address was only learnt from its datagrams"""
+        members = self._create_cluster(2)
+        node_a, node_b = members
+        for member in members:
+            member.start()
+        del node_b.messagerouter.transport.address_book["member-0"]
+        node_a.send_message_to_member_id(swimmsg.ping(), "member-1")
+        yield self._wait_until(lambda: node_a.received_messages > 0)
+        self.assertTrue(node_a.last_received_message.equals_ignoring_piggyback_data(swimmsg.ack()))
@@ -0,0 +1,64 @@
+""" Unit tests for watersnake vectormodel module, validating it against the
+object-level implementation. """
+# Disable 'Line too long'                   pylint: disable=C0301
+
+# Related third party imports
+import twisted.trial.unittest
+
+import watersnake.simulation as simulation
+try:
+    import watersnake.vectormodel as vectormodel
+except ImportError:  # numpy isn't installed
+    vectormodel = None
+
+
+class TestVectorModel(twisted.trial.unittest.TestCase):
+    """
+    Tests the Watersnake vectorised protocol model
+    """
+    if vectormodel is None:
+        skip = "numpy is not installed"
+
+    def test_regular_convergence_matches_membership(self):
+        """Test that without dissemination, members converge by round-robin probing alone (as in test_convergence_speed)"""
+        for n_members in [3, 10, 50]:
+            model = vectormodel.VectorModel(n_members, enable_infection_dissemination=False)
+            self.assertEqual(model.run_until_converged(), n_members - 1)
+
+    def test_infection_convergence_matches_simulator(self):
+        """Test that startup convergence time is in line with the discrete-event simulation of Membership"""
+        for n_members in [10, 30]:
+            seeds = range(3)
+            model_periods = [vectormodel.VectorModel(n_members, seed=seed).run_until_converged(100) for seed in seeds]
+            simulated_periods = [simulation.ClusterSimulator(n_members, seed=seed).run_until_converged(100) for seed in seeds]
+            self.assertTrue(abs(sum(model_periods) - sum(simulated_periods)) / len(seeds) <= 3,
+                            (n_members, model_periods, simulated_periods))
+
+    def test_failure_detection(self):
+        """Test that a failed member is declared dead by every other member, despite packet loss, without false deaths"""
+        model = vectormodel.VectorModel(50, loss_rate=0.05, seed=1)
+        self.assertTrue(model.run_until_converged(100) is not None)
+        model.fail_members([0])
+        self.assertTrue(model.run_until_converged(100) is not None)
+        report = model.report()
+        self.assertTrue(report["suspicions_raised"] >= 49)
+        self.assertTrue(report["suspicions_confirmed"] >= 1)
+        self.assertEqual(report["false_positive_rate"], 0)
+
+    def test_refutation(self):
+        """Test that a member refutes a suspicion by reincarnating"""
+        model = vectormodel.VectorModel(20, seed=2)
+        model.run_until_converged(100)
+        model.view[1, 0] = 4 * 1 + 1  # member 1 suspects member 0 (at incarnation 1)
+        model._enqueue([1], [0])
+        model.run(10)
+        self.assertEqual(model.view[0, 0], 4 * 2)
+        self.assertTrue((model.view[:, 0] == 4 * 2).all())
+        self.assertTrue(model.converged())
+
+    def test_sweep(self):
+        """Test that a sweep models every combination of parameters"""
+        results = vectormodel.sweep(20, k=(1, 3), budget_bytes=(128, 512))
+        self.assertEqual(sorted((params["k"], params["budget_bytes"]) for params, _ in results),
+                         [(1, 128), (1, 512), (3, 128), (3, 512)])
+        self.assertTrue(all(report["converged_after_periods"] is not None for _, report in results))
@@ -0,0 +1,293 @@
+""" Implementation of a UDP MessageTransport for a protocol based on the SWIM
+protocol described in
+http://www.cs.cornell.edu/~asdas/research/dsn02-SWIM.pdf ("the paper"),
+built on the (non-blocking, single threaded) twisted reactor. """
+# Disable 'Invalid name'                             pylint: disable=C0103
+
+import socket
+import struct
+
+from twisted.internet import protocol, task, udp
+from twisted.python import log
+
+import watersnake.batchio as batchio
+import watersnake.scheduler as scheduler
+import watersnake.swimmsg as swimmsg
+import watersnake.swimprotocol as swimprotocol
+import watersnake.swimtransport as swimtransport
+
+FRAME_VERSION = 1
+_FRAME_HEADER = struct.Struct("!BHH")
+
+
+class SWIMFramingException(Exception):
+    """Exception class raised when a datagram received from the wire does not
+    contain a valid frame"""
+    pass
+
+
+def encode_frame(from_sender, address, payload):
+    """Wraps a serialised message in a frame identifying its logical sender
+    and recipient member ids"""
+    if isinstance(from_sender, unicode):
+        from_sender = from_sender.encode("utf-8")
+    if isinstance(address, unicode):
+        address = address.encode("utf-8")
+    return "".join((
+        _FRAME_HEADER.pack(FRAME_VERSION, len(from_sender), len(address)),
+        from_sender,
+        address,
+        payload
+    ))
+
+
+def decode_frame(datagram):
+    """Returns (from_sender, address, payload) from a framed datagram (a str
+    or memoryview); raises a SWIMFramingException if this isn't possible.
+    The payload is a memoryview of the datagram, so isn't copied."""
+    try:
+        datagram = memoryview(datagram)
+        version, sender_len, address_len = _FRAME_HEADER.unpack_from(datagram)
+        if version != FRAME_VERSION:
+            raise ValueError("Unsupported frame version %s" % version)
+        offset = _FRAME_HEADER.size
+        end = offset + sender_len + address_len
+        if end > len(datagram):
+            raise ValueError("Truncated frame")
+        from_sender = datagram[offset:offset + sender_len].tobytes()
+        address = datagram[offset + sender_len:end].tobytes()
+        return (from_sender.decode("utf-8"), address.decode("utf-8"),
+                datagram[end:])
+    except Exception as _:
+        raise SWIMFramingException()
+
+
+class ReceiveBufferPort(udp.Port):
+    """ A twisted UDP port which receives datagrams into pre-allocated
+    buffers, rather than allocating a new string per datagram, and passes
+    its protocol a memoryview of each datagram. Datagrams are received (and
+    with write_batch, sent) in batches, with recvmmsg and sendmmsg where the
+    platform has them and use_mmsg isn't False (see batchio).
+
+    The memoryview is only valid until datagramReceived returns (later
+    datagrams overwrite it), so protocols must copy anything they keep. """
+    def __init__(self, *args, **kwargs):
+        self.use_mmsg = kwargs.pop("use_mmsg", None)
+        udp.Port.__init__(self, *args, **kwargs)
+        self.receiver = None
+        self.sender = None
+
+    def startListening(self):
+        """Bind the socket and start reading from it"""
+        udp.Port.startListening(self)
+        self.receiver = batchio.DatagramBatchReceiver(
+            self.socket, self.maxPacketSize, self.use_mmsg
+        )
+        self.sender = batchio.DatagramBatchSender(self.socket, self.use_mmsg)
+
+    def doRead(self):
+        """Called when the socket is ready for reading (as udp.Port.doRead,
+        but draining the socket a batch of datagrams at a time)"""
+        read = 0
+        while read < self.maxThroughput:
+            try:
+                datagrams = self.receiver.receive()
+            except socket.error as se:
+                no = se.args[0]
+                if no in udp._sockErrReadIgnore:
+                    return
+                if no in udp._sockErrReadRefuse:
+                    if self._connectedAddr:
+                        self.protocol.connectionRefused()
+                    return
+                raise
+            for datagram, addr in datagrams:
+                read += len(datagram)
+                try:
+                    self.protocol.datagramReceived(datagram, addr)
+                except:
+                    log.err()
+
+    def write_batch(self, datagrams):
+        """Send each (datagram, (host, port)) in datagrams, with as few
+        system calls as possible; returns the number which couldn't be
+        sent"""
+        return self.sender.send(datagrams)
+
+
+class UDPMessageTransport(swimtransport.MessageTransport,
+                          protocol.DatagramProtocol):
+    """ A MessageTransport which sends each message as a single UDP datagram.
+
+    'address_book' maps member ids to (host, port) socket addresses; it may be
+    shared between transports and is extended with the source address of
+    datagrams received from previously unknown members.
+
+    Any number of members may share a transport (and so a socket) by
+    registering with its MessageRouter: each datagram's frame header holds
+    the member id it's addressed to, and messages between members sharing
+    the transport are handed straight to the recipient, without being
+    serialised. """
+    deliver_locally = True
+    def __init__(
+            self,
+            address_book=None,
+            serialiser=swimmsg.SWIMJSONMessageSerialiser
+        ):
+        swimtransport.MessageTransport.__init__(self, serialiser)
+        self.address_book = {} if address_book is None else address_book
+        self.dropped_messages = 0
+        self.reactor = None
+        self.use_mmsg = None
+        self._send_batch = None
+        self._flush_pending = False
+
+    def enable_batching(self, use_mmsg=None):
+        """Rather than writing each datagram to the socket as it's sent,
+        queue them up until the reactor has finished its current work (e.g.
+        a tick, or a datagram and the replies to it) and then write them all
+        at once, with sendmmsg if possible (and use_mmsg isn't False).
+        Should be called before listen()."""
+        self.use_mmsg = use_mmsg
+        self._send_batch = []
+
+    def listen(self, reactor, port=0, interface="127.0.0.1"):
+        """Start listening for datagrams; returns the twisted listening port
+        (so the caller can stopListening() it)"""
+        self.reactor = reactor
+        listening_port = ReceiveBufferPort(port, self, interface=interface,
+                                           reactor=reactor,
+                                           use_mmsg=self.use_mmsg)
+        listening_port.startListening()
+        return listening_port
+
+    def schedule_flush(self):
+        """Send messages queued while coalescing or batching once the
+        reactor has finished its current work (so that everything sent in
+        response to one tick or datagram is coalesced and batched)"""
+        if self.reactor is not None and not self._flush_pending:
+            self._flush_pending = True
+            self.reactor.callLater(0, self.flush)
+
+    def flush(self):
+        """Send every message queued while coalescing, then write every
+        datagram queued while batching"""
+        swimtransport.MessageTransport.flush(self)
+        if self._send_batch:
+            datagrams, self._send_batch = self._send_batch, []
+            if self.transport is None:
+                self.dropped_messages += len(datagrams)
+            else:
+                self.dropped_messages += self.transport.write_batch(datagrams)
+        self._flush_pending = False
+
+    def local_address(self):
+        """The (host, port) we're listening on"""
+        host = self.transport.getHost()
+        return (host.host, host.port)
+
+    def local_member_addresses(self):
+        """{member id: (host, port)} for every member sharing this transport,
+        for adding to the address books of other processes' transports"""
+        address = self.local_address()
+        return dict.fromkeys(self.message_router.members, address)
+
+    def send_message_impl(self, address, message, from_sender):
+        """Send the serialised message to the socket address of the member
+        identified by 'address' (if we know it)"""
+        destination = self.address_book.get(address)
+        if destination is None or self.transport is None:
+            self.dropped_messages += 1
+            return
+        if self._send_batch is not None:
+            if not self._send_batch:
+                self.schedule_flush()
+            self._send_batch.append((
+                encode_frame(from_sender, address, message),
+                destination
+            ))
+            return
+        self.transport.write(
+            encode_frame(from_sender, address, message),
+            destination
+        )
+
+    def datagramReceived(self, datagram, source):
+        """twisted callback - a datagram (a str or, when we're listening,
+        a memoryview of ReceiveBufferPort's buffer) has arrived from
+        'source'"""
+        try:
+            from_sender, address, payload = decode_frame(datagram)
+            if address not in self.message_router.members:
+                raise SWIMFramingException()
+            if from_sender not in self.address_book:
+                self.address_book[from_sender] = source
+            self.on_incoming_message(address, payload, from_sender)
+        except (SWIMFramingException, swimmsg.SWIMDeserialisationException):
+            self.dropped_messages += 1
+
+
+class MembershipTicker(object):
+    """ Drives Membership.tick() from a reactor timer, once per protocol
+    period, and runs the membership's deadlines (e.g. probe timeouts, which
+    are derived from round trip times and so usually much shorter than the
+    period) from another timer as they expire. Unless the membership
+    already has a clock, it is given the reactor's, so that round trip
+    times are measured precisely. """
+    def __init__(self, membership, reactor, period=swimprotocol.SWIM.T):
+        self.membership = membership
+        if membership.clock is None:
+            membership.clock = reactor.seconds
+        self.reactor = reactor
+        self.period = period
+        self._loop = task.LoopingCall(self._tick)
+        self._loop.clock = reactor
+        self._deadline_call = None
+        self._deadline = None
+
+    def start(self):
+        """Start ticking; returns a deferred which fires when stopped"""
+        self.membership.scheduler.wakeup = self._wake_at
+        return self._loop.start(self.period, now=False)
+
+    def stop(self):
+        """Stop ticking, and close the membership (see Membership.close())"""
+        self.membership.scheduler.wakeup = None
+        self._cancel_deadline_call()
+        if self._loop.running:
+            self._loop.stop()
+        self.membership.close()
+
+    def _tick(self):
+        """Timer has fired"""
+        self.membership.tick(self.reactor.seconds())
+        self._wake_at(self.membership.scheduler.next_deadline())
+
+    def _wake_at(self, deadline):
+        """Make sure we run the membership's deadlines just after deadline
+        (unless we already will sooner)"""
+        if deadline is None or not self._loop.running:
+            return
+        if self._deadline_call is not None:
+            if self._deadline <= deadline:
+                return
+            self._cancel_deadline_call()
+        self._deadline = deadline
+        self._deadline_call = self.reactor.callLater(
+            max(0.0, deadline - self.reactor.seconds()) +
+            scheduler.DEADLINE_SLACK,
+            self._run_deadlines
+        )
+
+    def _cancel_deadline_call(self):
+        """Forget about the timer for the next deadline"""
+        if self._deadline_call is not None:
+            if self._deadline_call.active():
+                self._deadline_call.cancel()
+            self._deadline_call = None
+
+    def _run_deadlines(self):
+        """Deadline timer has fired"""
+        self._deadline_call = None
+        self.membership.run_deadlines(self.reactor.seconds())
+        self._wake_at(self.membership.scheduler.next_deadline())
@@ -0,0 +1,428 @@
+""" Vectorised model of a protocol based on the SWIM protocol described in
+http://www.cs.cornell.edu/~asdas/research/dsn02-SWIM.pdf ("the paper"),
+for studying convergence time and bandwidth of large groups.
+
+Every member's view of the group is held in a single N x N matrix, and all
+members are stepped through a protocol period at once with batched random
+selection and merges. The model mirrors Membership's round-robin probing,
+ping_req fan-out to K members, suspicion, bounded piggybacking and
+incarnation/state precedence rules, with these simplifications:
+
+ -  all messages within a protocol period are delivered within that period
+    (as they are by the lockstep loopback test harness)
+ -  messages are sent in batches (all pings, then all acks, etc.), and a
+    member sending several messages in the same batch piggybacks the same
+    updates on each
+ -  ping_req helpers are chosen with replacement
+
+Requires numpy (which is otherwise not a dependency of watersnake). """
+# Disable 'Too many instance attributes'             pylint: disable=R0902
+# Disable 'Invalid name'                             pylint: disable=C0103
+
+import itertools
+import math
+
+import numpy
+
+import watersnake.dissemination as dissemination
+import watersnake.membership as membership
+import watersnake.swimmsg as swimmsg
+import watersnake.swimprotocol as swimprotocol
+
+# A view of a member is encoded as a single integer, incarnation * 4 plus
+# the precedence of its state, so that merging rumours is a simple maximum;
+# a member whose state we don't know is -1
+_UNKNOWN = -1
+_ALIVE, _SUSPECT, _DEAD = 0, 1, 2
+# An update queued for dissemination is keyed by the number of times it has
+# been transmitted, then by how long ago it was queued, so that the updates
+# to piggyback are those with the lowest keys
+_TRANSMISSION = 1 << 20
+_NOT_QUEUED = numpy.iinfo(numpy.int32).max
+
+
+def _message_overhead_bytes():
+    """Size of a binary encoded message carrying no piggybacked updates
+    (but a view digest)"""
+    return len(swimmsg.SWIMBinaryMessageSerialiser.to_buffer(
+        swimmsg.ping(piggyback_data={"alive": [], "digest": 2 ** 63})
+    ))
+
+
+class VectorModel(object):
+    """ Models a group of n_members members, each of which initially
+    expects all of the others (as the test harness and ClusterSimulator
+    do). Members are identified by index. Runs are reproducible for a given
+    seed. """
+    def __init__(
+            self,
+            n_members,
+            k=swimprotocol.SWIM.K,
+            loss_rate=0.0,
+            budget_bytes=dissemination.DEFAULT_BUDGET_BYTES,
+            period=swimprotocol.SWIM.T,
+            retransmit_multiplier=swimprotocol.SWIM.LAMBDA,
+            suspicion_multiplier=membership.DEFAULT_SUSPICION_MULTIPLIER,
+            enable_infection_dissemination=True,
+            push_pull_interval=membership.DEFAULT_PUSH_PULL_INTERVAL,
+            seed=0
+        ):
+        assert n_members >= 2
+        self.n_members = n_members
+        self.k = k
+        self.loss_rate = loss_rate
+        self.budget_bytes = budget_bytes
+        self.period = period
+        self.enable_infection_dissemination = enable_infection_dissemination
+        self.push_pull_periods = None
+        if enable_infection_dissemination and push_pull_interval:
+            self.push_pull_periods = max(
+                1, int(round(push_pull_interval / period))
+            )
+        self.rand = numpy.random.RandomState(seed)
+        self.entry_bytes = dissemination.DisseminationBuffer.entry_size(
+            "m%s" % n_members, 1
+        )
+        self.message_overhead_bytes = _message_overhead_bytes()
+        self.n_entries = min(
+            n_members,
+            max(0, (budget_bytes - self.entry_bytes) // self.entry_bytes)
+        )
+        self.retransmit_limit = dissemination.DisseminationBuffer(
+            budget_bytes, retransmit_multiplier
+        ).retransmit_limit(n_members)
+        self.suspicion_periods = (suspicion_multiplier *
+                                  max(1.0, math.log10(n_members)))
+        # view[i, j] is member i's view of member j
+        self.view = numpy.full((n_members, n_members), _UNKNOWN, numpy.int32)
+        self._members = numpy.arange(n_members)
+        self.view[self._members, self._members] = 4 * 1 + _ALIVE
+        # Dissemination buffers: queued[i, j] keys member i's update about
+        # member j (if any)
+        self.queued = numpy.full((n_members, n_members), _NOT_QUEUED,
+                                 numpy.int32)
+        # Pending suspicion timeouts: (member, suspect, deadline, view)
+        self._timers = [numpy.zeros(0, numpy.int64) for _ in range(4)]
+        self._rotation_offset = self.rand.randint(0, n_members - 1,
+                                                  n_members)
+        self.failed = numpy.zeros(n_members, bool)
+        self._last_heard_from = numpy.full(n_members, -1, numpy.int64)
+        self.periods = 0
+        self.converged_after = None
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.suspicions_raised = 0
+        self.suspicions_confirmed = 0
+        self.false_deaths = 0
+
+    def fail_members(self, members):
+        """The given members crash; they no longer send or receive"""
+        self.failed[numpy.asarray(members)] = True
+
+    def _enqueue(self, members, subjects):
+        """members have changed their view of subjects (arrays of equal
+        length); queue the changes for dissemination"""
+        if self.enable_infection_dissemination and len(members):
+            self.queued[members, subjects] = _TRANSMISSION - 1 - self.periods
+
+    def _select_piggyback(self, senders, n_messages):
+        """Choose the updates each of senders (unique) will piggyback on
+        its next n_messages messages, accounting for their transmission.
+        Returns (len(senders) x B matrix of subjects, mask of which are
+        valid)."""
+        keys = self.queued[senders]
+        if self.n_entries < self.n_members:
+            subjects = numpy.argpartition(keys, self.n_entries - 1, axis=1)
+            subjects = subjects[:, :self.n_entries]
+        else:
+            subjects = numpy.tile(self._members, (len(senders), 1))
+        valid = numpy.take_along_axis(keys, subjects, 1) != _NOT_QUEUED
+        rows = numpy.repeat(senders, subjects.shape[1])[valid.ravel()]
+        cols = subjects[valid]
+        keys = (self.queued[rows, cols] +
+                numpy.repeat(n_messages, valid.sum(axis=1)) * _TRANSMISSION)
+        self.queued[rows, cols] = numpy.where(
+            keys >= self.retransmit_limit * _TRANSMISSION,
+            _NOT_QUEUED,
+            keys
+        )
+        return subjects, valid
+
+    def _send(self, senders, receivers):
+        """Messages are sent from senders to receivers (arrays of equal
+        length); returns a mask of those which were delivered, having
+        merged their piggybacked updates into the receivers' views"""
+        delivered = self._deliverable(receivers)
+        self.messages_sent += len(senders)
+        self.bytes_sent += len(senders) * self.message_overhead_bytes
+        if not self.enable_infection_dissemination or not len(senders):
+            return delivered
+        unique_senders, index, n_messages = numpy.unique(
+            senders,
+            return_inverse=True,
+            return_counts=True
+        )
+        subjects, valid = self._select_piggyback(unique_senders, n_messages)
+        subjects = subjects[index]
+        valid = valid[index]
+        self.bytes_sent += (len(senders) + int(valid.sum())) * \
+                           self.entry_bytes
+        senders = senders[delivered]
+        receivers = receivers[delivered]
+        subjects = subjects[delivered]
+        valid = valid[delivered]
+        if not len(senders):
+            return delivered
+        # Every message reports its sender's own liveness, plus the
+        # sender's piggybacked updates
+        entry_subjects = numpy.concatenate(
+            (subjects, senders[:, None]),
+            axis=1
+        )
+        entry_valid = numpy.concatenate(
+            (valid, numpy.ones((len(senders), 1), bool)),
+            axis=1
+        )
+        entry_views = self.view[senders[:, None], entry_subjects]
+        rows = numpy.repeat(receivers, entry_subjects.shape[1])
+        self._merge(
+            rows[entry_valid.ravel()],
+            entry_subjects[entry_valid],
+            entry_views[entry_valid]
+        )
+        self._last_heard_from[receivers] = senders
+        return delivered
+
+    def _merge(self, members, subjects, views):
+        """members have been told views of subjects (arrays of equal
+        length); merge them into their own views of the group"""
+        previous = self.view[members, subjects]
+        numpy.maximum.at(self.view, (members, subjects), views)
+        current = self.view[members, subjects]
+        changed = current > previous
+        about_self = members == subjects
+        self._on_changed(members[changed & ~about_self],
+                         subjects[changed & ~about_self])
+        self._refute(members[about_self & (current % 4 != _ALIVE)])
+
+    def _push_pull(self):
+        """Every member syncs its entire view of the group with the member
+        it last heard from, if their views differ"""
+        members = self._members[
+            ~self.failed & (self._last_heard_from >= 0)
+        ]
+        peers = self._last_heard_from[members]
+        differ = (self.view[members] != self.view[peers]).any(axis=1)
+        members = members[differ]
+        peers = peers[differ]
+        synced = self._sync(members, peers)
+        self._sync(peers[synced], members[synced])
+
+    def _sync(self, senders, receivers):
+        """senders send their entire view of the group to receivers (a sync
+        or sync_ack); returns a mask of those which were delivered"""
+        delivered = self._deliverable(receivers)
+        known = self.view[senders] != _UNKNOWN
+        self.messages_sent += len(senders)
+        self.bytes_sent += (len(senders) * self.message_overhead_bytes +
+                            int(known.sum()) * self.entry_bytes)
+        senders = senders[delivered]
+        receivers = receivers[delivered]
+        known = known[delivered].ravel()
+        self._merge(
+            numpy.repeat(receivers, self.n_members)[known],
+            numpy.tile(self._members, len(receivers))[known],
+            self.view[senders].ravel()[known]
+        )
+        return delivered
+
+    def _deliverable(self, receivers):
+        """Which of a batch of messages to receivers won't be lost"""
+        delivered = ~self.failed[receivers]
+        if self.loss_rate:
+            delivered &= self.rand.random_sample(len(receivers)) >= \
+                         self.loss_rate
+        return delivered
+
+    def _refute(self, members):
+        """members have heard a rumour that they're not alive in their
+        current (or a later) incarnation; they reincarnate"""
+        if len(members):
+            members = numpy.unique(members)
+            self.view[members, members] = \
+                (self.view[members, members] // 4 + 1) * 4 + _ALIVE
+
+    def _on_changed(self, members, subjects):
+        """members' views of subjects have changed"""
+        self._enqueue(members, subjects)
+        suspected = self.view[members, subjects] % 4 == _SUSPECT
+        self._start_suspicion_timers(members[suspected], subjects[suspected])
+
+    def _start_suspicion_timers(self, members, subjects):
+        """members have started to suspect subjects"""
+        if not len(members):
+            return
+        self.suspicions_raised += len(members)
+        new_timers = (
+            members,
+            subjects,
+            numpy.full(len(members), self.periods + self.suspicion_periods),
+            self.view[members, subjects]
+        )
+        self._timers = [
+            numpy.concatenate((timers, numpy.asarray(new, numpy.int64)))
+            for timers, new in zip(self._timers, new_timers)
+        ]
+
+    def _expire_suspicion_timers(self):
+        """Suspicions which have not been refuted in time are confirmed"""
+        members, subjects, deadlines, views = self._timers
+        expired = deadlines < self.periods
+        if not expired.any():
+            return
+        self._timers = [timers[~expired] for timers in self._timers]
+        members = members[expired]
+        subjects = subjects[expired]
+        confirmed = (self.view[members, subjects] == views[expired]) & \
+                    ~self.failed[members]
+        members = members[confirmed]
+        subjects = subjects[confirmed]
+        self.view[members, subjects] = \
+            self.view[members, subjects] // 4 * 4 + _DEAD
+        self.suspicions_confirmed += len(members)
+        self.false_deaths += int((~self.failed[subjects]).sum())
+        self._enqueue(members, subjects)
+
+    def _node_alive(self, members, subjects):
+        """members have heard directly (or indirectly) from subjects"""
+        views = self.view[members, subjects]
+        changed = (views % 4 != _ALIVE) | (views == _UNKNOWN)
+        members = members[changed]
+        subjects = subjects[changed]
+        self.view[members, subjects] = \
+            numpy.maximum(self.view[members, subjects], 0) // 4 * 4 + _ALIVE
+        self._enqueue(members, subjects)
+
+    def _helpers(self, members, subjects):
+        """Choose K ping_req helpers for each member (other than itself and
+        the subject it's probing)"""
+        helpers = self.rand.randint(0, self.n_members - 2,
+                                    (len(members), self.k))
+        low = numpy.minimum(members, subjects)[:, None]
+        high = numpy.maximum(members, subjects)[:, None]
+        helpers += helpers >= low
+        helpers += helpers >= high
+        return helpers
+
+    def step(self):
+        """Step every member through one protocol period"""
+        n_members = self.n_members
+        live = self._members[~self.failed]
+        targets = (live + 1 +
+                   (self._rotation_offset[live] + self.periods) %
+                   (n_members - 1)) % n_members
+        # Direct probe: ping and ack
+        pinged = self._send(live, targets)
+        acked = numpy.zeros(len(live), bool)
+        acked[pinged] = self._send(targets[pinged], live[pinged])
+        self._node_alive(live[acked], targets[acked])
+        # Indirect probe via K helpers: ping_req, ping, ack, ping_req_ack
+        probers = live[~acked]
+        subjects = targets[~acked]
+        reached = numpy.zeros(len(probers), bool)
+        if self.k and len(probers) and n_members > 2:
+            helpers = self._helpers(probers, subjects)
+            for column in range(self.k):
+                legs = [
+                    numpy.repeat(probers, 1),
+                    helpers[:, column],
+                    subjects,
+                    helpers[:, column],
+                    probers,
+                ]
+                ok = numpy.ones(len(probers), bool)
+                for src, dst in zip(legs, legs[1:]):
+                    ok[ok] = self._send(src[ok], dst[ok])
+                reached |= ok
+        self._node_alive(probers[reached], subjects[reached])
+        # Suspect whoever couldn't be reached at all
+        unreached = ~reached
+        probers = probers[unreached]
+        subjects = subjects[unreached]
+        views = self.view[probers, subjects]
+        newly = (views % 4 == _ALIVE) | (views == _UNKNOWN)
+        probers = probers[newly]
+        subjects = subjects[newly]
+        self.view[probers, subjects] = \
+            numpy.maximum(views[newly], 0) // 4 * 4 + _SUSPECT
+        self._enqueue(probers, subjects)
+        self._start_suspicion_timers(probers, subjects)
+        if (self.push_pull_periods and self.periods and
+                self.periods % self.push_pull_periods == 0):
+            self._push_pull()
+        self.periods += 1
+        self._expire_suspicion_timers()
+
+    def run(self, periods):
+        """Step through a number of protocol periods"""
+        for _ in range(periods):
+            self.step()
+
+    def converged(self):
+        """Does every live member believe every other live member to be
+        alive, and every failed member to be dead?"""
+        live = ~self.failed
+        views = self.view[live]
+        live_views = views[:, live]
+        if not ((live_views >= 0) & (live_views % 4 == _ALIVE)).all():
+            return False
+        failed_views = views[:, self.failed]
+        return bool((failed_views % 4 >= _DEAD).all())
+
+    def run_until_converged(self, max_periods=1000):
+        """Step until the group has converged; returns the number of
+        periods this took (or None if it didn't converge within
+        max_periods)"""
+        start = self.periods
+        while self.periods - start < max_periods:
+            self.step()
+            if self.converged():
+                self.converged_after = self.periods - start
+                return self.converged_after
+        return None
+
+    def report(self):
+        """Summary statistics for the model so far"""
+        member_periods = max(1, self.n_members * self.periods)
+        converged_after_seconds = None
+        if self.converged_after is not None:
+            converged_after_seconds = self.converged_after * self.period
+        return {
+            "members" : self.n_members,
+            "periods" : self.periods,
+            "converged_after_periods" : self.converged_after,
+            "converged_after_seconds" : converged_after_seconds,
+            "suspicions_raised" : self.suspicions_raised,
+            "suspicions_confirmed" : self.suspicions_confirmed,
+            "false_positive_rate" :
+                float(self.false_deaths) / member_periods,
+            "messages_per_member_per_period" :
+                float(self.messages_sent) / member_periods,
+            "bytes_per_member_per_period" :
+                float(self.bytes_sent) / member_periods,
+        }
+
+
+def sweep(n_members, max_periods=1000, seed=0, **parameters):
+    """Model startup convergence for every combination of the given
+    parameters, each of which is a sequence of values for the VectorModel
+    keyword argument of the same name (e.g. k=(1, 3), loss_rate=(0, 0.1)).
+    Returns a list of (parameters, report) pairs."""
+    names = sorted(parameters)
+    results = []
+    for values in itertools.product(*[parameters[name] for name in names]):
+        kwargs = dict(zip(names, values))
+        model = VectorModel(n_members, seed=seed, **kwargs)
+        model.run_until_converged(max_periods)
+        results.append((kwargs, model.report()))
+    return results